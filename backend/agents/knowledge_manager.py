@@ -1,7 +1,43 @@
 """NotebookLM-style knowledge base for queryable lead intelligence"""
-from typing import Dict, List, Any
+from typing import Callable, Dict, List, Any, Iterable, Optional, Sequence, Tuple
+from array import array
+from collections import OrderedDict
 from datetime import datetime
-import json
+import heapq
+import math
+import re
+import sqlite3
+
+from utils.geohash import DEFAULT_PRECISIONS, GeoCellAggregates, lead_coordinates, viewport_precision
+from utils.knowledge_store import KnowledgeStore, SEARCH_FIELDS, search_texts
+from utils.lead_columns import LeadColumns
+from utils.text import tokenize
+from utils.vector_index import HashingEmbedder, VectorIndex, search_chunks
+
+ZIP_PATTERN = re.compile(r'\b\d{5}\b')
+
+def _add_id(index: Dict[str, Any], key: str, entry_id: int) -> int:
+    """
+    Append an entry ID under key, returning how many the key now has. A key
+    with one entry holds the bare int; most owners and tokens never get a second
+    """
+    ids = index.get(key)
+    if ids is None:
+        index[key] = entry_id
+        return 1
+    if isinstance(ids, int):
+        ids = index[key] = array('I', (ids,))
+    ids.append(entry_id)
+    return len(ids)
+
+
+def _get_ids(index: Dict[str, Any], key: str) -> Sequence[int]:
+    ids = index.get(key, ())
+    return (ids,) if isinstance(ids, int) else ids
+
+
+# BM25 weight of a match in each searchable field
+DEFAULT_FIELD_WEIGHTS = {'address': 2.0, 'owner': 1.5, 'tags': 1.0, 'details': 1.0}
 
 
 class KnowledgeManager:
@@ -9,71 +45,376 @@ class KnowledgeManager:
 
     def __init__(self, config: Dict):
         self.config = config
-        self.leads_db = []
+        # Columnar lead table; analyses and messages are spilled to a temp file in spill_dir
+        self.leads_db = LeadColumns(config.get('spill_dir'))
         self.conversations = []
 
+        # BM25 ranking parameters
+        weights = {**DEFAULT_FIELD_WEIGHTS, **config.get('field_weights', {})}
+        self.field_weights = tuple(float(weights[field]) for field in SEARCH_FIELDS)
+        self.bm25_k1 = float(config.get('bm25_k1', 1.2))
+        self.bm25_b = float(config.get('bm25_b', 0.75))
+        self.high_roi_boost = float(config.get('high_roi_boost', 2.0))
+
+        # Geohash lengths geocoded leads are aggregated at; hot zones use hot_zone_precision
+        self.geo_precisions = tuple(sorted(config.get('geo_precisions', DEFAULT_PRECISIONS)))
+        self.hot_zone_precision = int(config.get('hot_zone_precision', 6))
+        if self.hot_zone_precision not in self.geo_precisions:
+            raise ValueError(f"hot_zone_precision {self.hot_zone_precision} not in geo_precisions")
+        self.hot_zone_min_leads = int(config.get('hot_zone_min_leads', 1))
+        self.max_viewport_cells = int(config.get('max_viewport_cells', 256))
+
+        # Persistent SQLite backend; when set, leads live on disk instead of leads_db
+        self.store: Optional[KnowledgeStore] = None
+        db_path = config.get('db_path')
+        if db_path:
+            try:
+                self.store = KnowledgeStore(
+                    db_path,
+                    commit_interval=int(config.get('commit_interval', 500)),
+                    field_weights=self.field_weights,
+                    geo_precisions=self.geo_precisions,
+                    busy_timeout=float(config.get('busy_timeout', 30))
+                )
+                print(f"[KnowledgeManager] Using {db_path} ({len(self.store)} leads)")
+            except sqlite3.OperationalError as e:
+                if 'fts5' not in str(e):
+                    # e.g. "database is locked": an empty in-memory KB would hide it
+                    raise
+                print(f"[KnowledgeManager] SQLite built without FTS5, keeping leads in memory: {e}")
+
+        # Inverted index: token -> flat array of (entry ID, term-frequency pattern ID)
+        # pairs, ascending by ID. A pattern is the per-field frequency tuple, interned
+        # since few distinct ones occur
+        self.index: Dict[str, array] = {}
+        self.freq_patterns: List[Tuple[int, ...]] = []
+        self._freq_pattern_ids: Dict[Tuple[int, ...], int] = {}
+        # Token count of each entry's fields, for BM25 length normalization
+        self.field_lengths = [array('I') for _ in SEARCH_FIELDS]
+        self.field_length_totals = [0] * len(SEARCH_FIELDS)
+        # Entries with cap rate >= 7, for "high ROI" queries
+        self.high_roi_ids = array('I')
+
+        # Relationship indexes: owner / area (ZIP when present) -> entry ID(s), see _add_id
+        self.owner_index: Dict[str, Any] = {}
+        self.area_index: Dict[str, Any] = {}
+        self.max_related_leads = int(config.get('max_related_leads', 20))
+
+        # Running aggregates behind get_insights, updated in add_lead
+        self.zone_stats: Dict[str, Dict] = {}
+        self.multi_property_owners: Dict[str, int] = {}
+        self.totals = {'lead_count': 0, 'total_value': 0, 'cap_rate_sum': 0, 'analyzed_count': 0}
+        self.geo_cells = GeoCellAggregates(self.geo_precisions)
+
+        # Optional local embeddings for semantic search, computed in batches as
+        # leads arrive. Off by default: embedding costs more than the rest of ingestion
+        self.semantic_search = config.get('semantic_search', False)
+        dim = int(config.get('embedding_dim', 256))
+        self.embedder = HashingEmbedder(dim)
+        # In memory only; with a store, vectors stay on disk and are streamed per query
+        self.vector_index = VectorIndex(dim, ann_threshold=int(config.get('ann_threshold', 20000)))
+        self.embed_batch_size = int(config.get('embed_batch_size', 256))
+        self._pending_embeddings: List[Tuple[int, str]] = []
+        # Nearest neighbors below this cosine similarity are noise, not matches
+        self.semantic_min_similarity = float(config.get('semantic_min_similarity', 0.25))
+
+        # LRU cache of query results, tagged with the data generation they were
+        # computed at; add_lead bumps the generation so stale results are never served
+        self.query_cache_size = int(config.get('query_cache_size', 256))
+        self._query_cache: 'OrderedDict[Tuple, Tuple[int, List[Dict]]]' = OrderedDict()
+        self.generation = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
     def add_lead(self, lead: Any):
         """Add lead to knowledge base with rich context"""
-        lead_entry = {
-            'lead': lead,
-            'timestamp': datetime.now().isoformat(),
-            'embeddings': self._create_embeddings(lead),
-            'tags': self._generate_tags(lead),
-            'relationships': self._find_relationships(lead)
-        }
-        self.leads_db.append(lead_entry)
+        self._add_lead(lead)
+        if self.store is not None:
+            # Committed right away so other connections to the store are not kept waiting
+            self.store.commit()
+
+    def _add_lead(self, lead: Any):
+        self.generation += 1
+
+        tags = self._generate_tags(lead)
+        texts = search_texts(lead.address, lead.owner, tags, lead.source,
+                             lead.estimated_value, lead.roi_analysis)
+
+        if self.store is not None:
+            entry_id = len(self.store)
+            self.store.add(
+                entry_id, lead,
+                timestamp=datetime.now().isoformat(),
+                tags=tags,
+                area=self._area_key(lead.address),
+                zone=self._zone(lead.address),
+                texts=texts
+            )
+        else:
+            entry_id = self.leads_db.append(lead, tags).id
+            self._index_entry(entry_id, lead, texts)
+
+        if self.semantic_search:
+            self._pending_embeddings.append((entry_id, ' '.join(texts)))
+            if len(self._pending_embeddings) >= self.embed_batch_size:
+                self._flush_embeddings()
+
+    def add_leads(self, leads: Iterable[Any]):
+        """Add many leads, embedding them together at the end"""
+        for lead in leads:
+            self._add_lead(lead)
+        self._flush_embeddings()
+        if self.store is not None:
+            self.store.commit()
+
+    def close(self):
+        """Write out pending embeddings and commit the store"""
+        self._flush_embeddings()
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+        self.leads_db.close()
+
+    def _index_entry(self, entry_id: int, lead: Any, texts: Tuple[str, ...]):
+        """Add an entry's searchable tokens to the inverted index"""
+        term_freqs: Dict[str, List[int]] = {}
+        for field, text in enumerate(texts):
+            tokens = tokenize(text)
+            self.field_lengths[field].append(len(tokens))
+            self.field_length_totals[field] += len(tokens)
+            for token in tokens:
+                freqs = term_freqs.get(token)
+                if freqs is None:
+                    freqs = term_freqs[token] = [0] * len(texts)
+                freqs[field] += 1
+
+        for token, freqs in term_freqs.items():
+            pattern = tuple(freqs)
+            pattern_id = self._freq_pattern_ids.get(pattern)
+            if pattern_id is None:
+                pattern_id = self._freq_pattern_ids[pattern] = len(self.freq_patterns)
+                self.freq_patterns.append(pattern)
+
+            postings = self.index.get(token)
+            if postings is None:
+                self.index[token] = array('I', (entry_id, pattern_id))
+            else:
+                postings.append(entry_id)
+                postings.append(pattern_id)
+
+        if lead.roi_analysis and lead.roi_analysis.get('cap_rate', 0) >= 7:
+            self.high_roi_ids.append(entry_id)
+
+        owner_count = _add_id(self.owner_index, lead.owner, entry_id)
+        if owner_count > 1:
+            self.multi_property_owners[lead.owner] = owner_count
+
+        area = self._area_key(lead.address)
+        if area:
+            _add_id(self.area_index, area, entry_id)
+
+        self._update_aggregates(lead)
+
+    def _update_aggregates(self, lead: Any):
+        """Fold one lead into the zone and market running totals"""
+        roi = lead.roi_analysis or {}
+        value = lead.estimated_value or 0
+
+        zone = self._zone(lead.address)
+        if zone is not None:
+            stats = self.zone_stats.get(zone)
+            if stats is None:
+                stats = self.zone_stats[zone] = {
+                    'lead_count': 0,
+                    'total_value': 0,
+                    'cap_rate_sum': 0,
+                    'cap_rate_count': 0
+                }
+            stats['lead_count'] += 1
+            stats['total_value'] += value
+            if 'cap_rate' in roi:
+                stats['cap_rate_sum'] += roi['cap_rate']
+                stats['cap_rate_count'] += 1
+
+        coordinates = lead_coordinates(lead)
+        if coordinates is not None:
+            self.geo_cells.add(*coordinates, value=lead.estimated_value, cap_rate=roi.get('cap_rate'))
+
+        self.totals['lead_count'] += 1
+        self.totals['total_value'] += value
+        if roi:
+            self.totals['cap_rate_sum'] += roi.get('cap_rate', 0)
+            self.totals['analyzed_count'] += 1
+
+    def query(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Query the knowledge base, ranking matches by BM25 over the weighted
+        lead fields. Only the top `limit` results are selected (heap, no full sort)
+
+        Confidence is the score relative to the best score the query could reach
+        """
+        return self._cached(('query', query, limit), lambda: self._run_query(query, limit))
+
+    def _run_query(self, query: str, limit: int) -> List[Dict]:
+        query_lower = query.lower()
+        keywords = tokenize(query_lower)
+        if not keywords:
+            return []
+
+        high_roi = 'high' in query_lower and 'roi' in query_lower
+        boost = self.high_roi_boost if high_roi else 0.0
+
+        if self.store is not None:
+            terms = list(dict.fromkeys(keywords))
+            # With the high-ROI rule every match needs its score, not just the top k
+            scores = dict(self.store.search(terms, limit=None if high_roi else limit))
+            max_score = self.store.max_bm25(terms, k1=self.bm25_k1)
+            high_roi_ids = self.store.high_roi_ids() if high_roi else ()
+        else:
+            scores, max_score = self._bm25_scores(keywords)
+            high_roi_ids = self.high_roi_ids if high_roi else ()
+
+        # Check for high ROI
+        for entry_id in high_roi_ids:
+            scores[entry_id] = scores.get(entry_id, 0.0) + boost
+        max_score += boost
+
+        # Nothing shares a keyword (e.g. a misspelling): fall back to embeddings,
+        # which still return nothing unless a lead is similar enough
+        if not scores and self.semantic_search:
+            return self._run_semantic_query(query, limit)
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+        return [self._result(entry_id, min(1.0, score / max_score)) for entry_id, score in top]
+
+    def _bm25_scores(self, keywords: List[str]) -> Tuple[Dict[int, float], float]:
+        """
+        BM25F scores from the in-memory postings: per-field term frequencies are
+        length-normalized and weighted before saturation
+
+        Returns:
+            (entry ID -> score, upper bound of any score for these keywords)
+        """
+        scores: Dict[int, float] = {}
+        max_score = 0.0
+
+        total = len(self.leads_db)
+        if not total:
+            return scores, max_score
+
+        k1, b = self.bm25_k1, self.bm25_b
+        weights = self.field_weights
+        patterns = self.freq_patterns
+        lengths = self.field_lengths
+        avg_lengths = [(field_total / total) or 1.0 for field_total in self.field_length_totals]
+
+        for keyword in set(keywords):
+            postings = self.index.get(keyword)
+            if not postings:
+                continue
 
-    def query(self, query: str) -> List[Dict]:
-        """Query the knowledge base using semantic search"""
-        results = []
+            doc_freq = len(postings) // 2
+            query_freq = keywords.count(keyword)
+            idf = math.log(1 + (total - doc_freq + 0.5) / (doc_freq + 0.5))
+            max_score += query_freq * idf * (k1 + 1)
+
+            pairs = iter(postings)
+            for entry_id, pattern_id in zip(pairs, pairs):
+                weighted = 0.0
+                for field, freq in enumerate(patterns[pattern_id]):
+                    if freq:
+                        norm = 1 - b + b * lengths[field][entry_id] / avg_lengths[field]
+                        weighted += weights[field] * freq / norm
+                scores[entry_id] = scores.get(entry_id, 0.0) + query_freq * idf * weighted * (k1 + 1) / (k1 + weighted)
+
+        return scores, max_score
+
+    def semantic_query(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Nearest leads to the query in embedding space with cosine similarity of
+        at least semantic_min_similarity; confidence is the similarity
+        """
+        return self._cached(('semantic', query, limit), lambda: self._run_semantic_query(query, limit))
+
+    def _run_semantic_query(self, query: str, limit: int) -> List[Dict]:
+        self._flush_embeddings()
+        query_vector = self.embedder.embed(query)
+
+        if self.store is not None:
+            # Exact scan over the stored vectors, one chunk in memory at a time
+            matches = search_chunks(self.store.iter_embeddings(self.vector_index.dim),
+                                    self.vector_index.dim, query_vector, k=limit)
+        else:
+            matches = self.vector_index.search(query_vector, k=limit)
 
-        # Simple keyword search (in production: use vector similarity)
-        query_lower = query.lower()
-        keywords = query_lower.split()
-
-        for entry in self.leads_db:
-            lead = entry['lead']
-
-            # Search across multiple fields
-            search_fields = [
-                lead.address,
-                lead.owner,
-                lead.status.value,
-                lead.source or '',
-                str(lead.estimated_value or ''),
-                json.dumps(lead.roi_analysis or {})
-            ]
-
-            search_text = ' '.join(search_fields).lower()
-
-            # Calculate simple relevance score
-            score = 0
-            for keyword in keywords:
-                if keyword in search_text:
-                    score += 1
-
-            # Check for high ROI
-            if 'high' in query_lower and 'roi' in query_lower:
-                cap_rate = lead.roi_analysis.get('cap_rate', 0) if lead.roi_analysis else 0
-                if cap_rate >= 7:
-                    score += 2
-
-            if score > 0:
-                results.append({
-                    'address': lead.address,
-                    'owner': lead.owner,
-                    'status': lead.status.value,
-                    'estimated_value': lead.estimated_value,
-                    'cap_rate': lead.roi_analysis.get('cap_rate', 0) if lead.roi_analysis else 0,
-                    'confidence': min(1.0, score / len(keywords)),
-                    'related_leads': entry['relationships'],
-                    'tags': entry['tags']
-                })
+        return [
+            self._result(entry_id, similarity) for similarity, entry_id in matches
+            if similarity >= self.semantic_min_similarity
+        ]
 
-        # Sort by confidence
-        results.sort(key=lambda x: x['confidence'], reverse=True)
+    def _cached(self, key: Tuple, compute: Callable[[], List[Dict]]) -> List[Dict]:
+        """Serve results computed at the current generation, else compute and cache them"""
+        if self.query_cache_size <= 0:
+            return compute()
+
+        # Queries differing only in case or spacing share an entry
+        kind, query, limit = key
+        key = (kind, ' '.join(query.lower().split()), limit)
+
+        cached = self._query_cache.get(key)
+        if cached is not None and cached[0] == self.generation:
+            self.cache_hits += 1
+            self._query_cache.move_to_end(key)
+            results = cached[1]
+        else:
+            self.cache_misses += 1
+            results = compute()
+            self._query_cache[key] = (self.generation, results)
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+
+        # Copies, so callers editing a result do not change the cached one
+        return [{**r, 'related_leads': list(r['related_leads']), 'tags': list(r['tags'])} for r in results]
+
+    def cache_stats(self) -> Dict:
+        """Query cache hit/miss counters"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            'entries': len(self._query_cache),
+            'max_entries': self.query_cache_size,
+            'generation': self.generation,
+            'hits': self.cache_hits,
+            'misses': self.cache_misses,
+            'hit_rate': self.cache_hits / lookups if lookups else 0.0
+        }
+
+    def _result(self, entry_id: int, confidence: float) -> Dict:
+        """Query result for one entry"""
+        if self.store is not None:
+            record = self.store.get(entry_id)
+        else:
+            lead = self.leads_db[entry_id]
+            record = {
+                'address': lead.address,
+                'owner': lead.owner,
+                'status': lead.status.value,
+                'estimated_value': lead.estimated_value,
+                'cap_rate': lead.cap_rate or 0,
+                'tags': lead.tags
+            }
 
-        return results
+        return {
+            'address': record['address'],
+            'owner': record['owner'],
+            'status': record['status'],
+            'estimated_value': record['estimated_value'],
+            'cap_rate': record['cap_rate'],
+            'confidence': confidence,
+            'related_leads': self.get_related_leads(entry_id),
+            'tags': record['tags']
+        }
 
     def get_insights(self) -> Dict:
         """Generate insights from the knowledge base"""
@@ -85,11 +426,19 @@ class KnowledgeManager:
         }
         return insights
 
-    def _create_embeddings(self, lead: Any) -> List[float]:
-        """Create vector embeddings for semantic search"""
-        # Placeholder - in production use embedding model
-        # Could use OpenAI embeddings, sentence-transformers, etc.
-        return []
+    def _flush_embeddings(self):
+        """Embed every lead waiting for a vector in one batch"""
+        if not self._pending_embeddings:
+            return
+
+        entry_ids = [entry_id for entry_id, _ in self._pending_embeddings]
+        vectors = self.embedder.embed_batch(text for _, text in self._pending_embeddings)
+        self._pending_embeddings = []
+
+        if self.store is not None:
+            self.store.set_embeddings(entry_ids, vectors, self.vector_index.dim)
+        else:
+            self.vector_index.add_batch(vectors)
 
     def _generate_tags(self, lead: Any) -> List[str]:
         """Generate tags for categorization"""
@@ -125,66 +474,104 @@ class KnowledgeManager:
 
         return tags
 
-    def _find_relationships(self, lead: Any) -> List[str]:
-        """Find related leads based on location, owner, or other factors"""
-        relationships = []
+    def get_related_leads(self, entry_id: int, limit: int = None) -> List[str]:
+        """
+        Find related leads based on owner or area, looked up lazily from the
+        relationship indexes so the cost is proportional to the matches returned
+        """
+        if limit is None:
+            limit = self.max_related_leads
 
-        for entry in self.leads_db:
-            existing_lead = entry['lead']
+        if self.store is not None:
+            return self.store.related_addresses(entry_id, limit)
 
-            # Same owner
-            if existing_lead.owner == lead.owner:
-                relationships.append(f"same_owner:{existing_lead.address}")
+        addresses = self.leads_db.addresses
+        lead = self.leads_db[entry_id]
+        relationships = []
 
-            # Same neighborhood
-            if lead.address and existing_lead.address:
-                lead_parts = lead.address.split(',')
-                existing_parts = existing_lead.address.split(',')
+        # Same owner
+        for other_id in _get_ids(self.owner_index, lead.owner):
+            if len(relationships) >= limit:
+                return relationships
+            if other_id != entry_id:
+                relationships.append(f"same_owner:{addresses[other_id]}")
 
-                if len(lead_parts) > 1 and len(existing_parts) > 1:
-                    if lead_parts[-1].strip() == existing_parts[-1].strip():
-                        relationships.append(f"same_area:{existing_lead.address}")
+        # Same neighborhood
+        for other_id in _get_ids(self.area_index, self._area_key(lead.address)):
+            if len(relationships) >= limit:
+                break
+            if other_id != entry_id:
+                relationships.append(f"same_area:{addresses[other_id]}")
 
         return relationships
 
-    def _identify_hot_zones(self) -> List[Dict]:
-        """Identify areas with high investment potential"""
-        zone_data = {}
-
-        for entry in self.leads_db:
-            lead = entry['lead']
-            if not lead.address:
-                continue
-
-            # Extract neighborhood
-            parts = lead.address.split(',')
-            neighborhood = parts[-1].strip() if len(parts) > 1 else "Unknown"
-
-            if neighborhood not in zone_data:
-                zone_data[neighborhood] = {
-                    'count': 0,
-                    'total_value': 0,
-                    'avg_cap_rate': 0,
-                    'cap_rates': []
-                }
+    @staticmethod
+    def _area_key(address: str) -> str:
+        """Area an address belongs to: its ZIP, else the text after the last comma"""
+        if not address:
+            return ''
+
+        parts = address.split(',')
+        if len(parts) < 2:
+            return ''
+
+        area = parts[-1].strip()
+        zip_match = ZIP_PATTERN.search(area)
+        return zip_match.group(0) if zip_match else area.lower()
+
+    @staticmethod
+    def _zone(address: str) -> Optional[str]:
+        """Hot-zone name: the text after the last comma, None without an address"""
+        if not address:
+            return None
+
+        parts = address.split(',')
+        return parts[-1].strip() if len(parts) > 1 else "Unknown"
+
+    def hot_zones(self, precision: int = None, limit: int = 5) -> List[Dict]:
+        """
+        Geohash cells of geocoded leads with the best mean cap rate; cells with
+        fewer than hot_zone_min_leads leads are left out
+        """
+        precision = precision or self.hot_zone_precision
+        if self.store is not None:
+            return self.store.geo_hot_zones(precision, limit, self.hot_zone_min_leads)
+        return self.geo_cells.hot_zones(precision, limit, self.hot_zone_min_leads)
+
+    def zones_in_viewport(self, south: float, west: float, north: float, east: float,
+                          precision: int = None) -> List[Dict]:
+        """
+        Per-cell lead count, mean cap rate and total value for a map viewport
+
+        Args:
+            precision: Geohash length; by default the finest of geo_precisions
+                that covers the viewport in at most max_viewport_cells cells
+        """
+        if precision is None:
+            precision = viewport_precision(south, west, north, east, self.geo_precisions,
+                                           self.max_viewport_cells)
+        if self.store is not None:
+            return self.store.geo_viewport(south, west, north, east, precision)
+        return self.geo_cells.viewport(south, west, north, east, precision)
 
-            zone_data[neighborhood]['count'] += 1
-
-            if lead.estimated_value:
-                zone_data[neighborhood]['total_value'] += lead.estimated_value
+    def _identify_hot_zones(self) -> List[Dict]:
+        """
+        Identify areas with high investment potential: geohash cells once leads
+        are geocoded, else the text after the last comma of the address
+        """
+        geocoded = self.store.geocoded_count() if self.store is not None else len(self.geo_cells)
+        if geocoded:
+            return self.hot_zones()
 
-            if lead.roi_analysis and 'cap_rate' in lead.roi_analysis:
-                zone_data[neighborhood]['cap_rates'].append(lead.roi_analysis['cap_rate'])
+        zone_stats = self.store.zone_stats() if self.store is not None else self.zone_stats
 
-        # Calculate averages
         hot_zones = []
-        for zone, data in zone_data.items():
-            if data['cap_rates']:
-                avg_cap_rate = sum(data['cap_rates']) / len(data['cap_rates'])
+        for zone, data in zone_stats.items():
+            if data['cap_rate_count']:
                 hot_zones.append({
                     'zone': zone,
-                    'lead_count': data['count'],
-                    'avg_cap_rate': avg_cap_rate,
+                    'lead_count': data['lead_count'],
+                    'avg_cap_rate': data['cap_rate_sum'] / data['cap_rate_count'],
                     'total_value': data['total_value']
                 })
 
@@ -195,26 +582,15 @@ class KnowledgeManager:
 
     def _identify_owner_patterns(self) -> Dict:
         """Identify patterns in owner behavior"""
-        owner_counts = {}
-
-        for entry in self.leads_db:
-            lead = entry['lead']
-            owner = lead.owner
-
-            if owner not in owner_counts:
-                owner_counts[owner] = 0
-            owner_counts[owner] += 1
-
-        # Find owners with multiple properties
-        multi_property_owners = {
-            owner: count
-            for owner, count in owner_counts.items()
-            if count > 1
-        }
+        if self.store is not None:
+            return {
+                'total_unique_owners': self.store.totals()['owner_count'],
+                'multi_property_owners': self.store.multi_property_owners()
+            }
 
         return {
-            'total_unique_owners': len(owner_counts),
-            'multi_property_owners': multi_property_owners
+            'total_unique_owners': len(self.owner_index),
+            'multi_property_owners': dict(self.multi_property_owners)
         }
 
     def _analyze_successful_outreach(self) -> List[str]:
@@ -228,27 +604,15 @@ class KnowledgeManager:
 
     def _detect_market_trends(self) -> Dict:
         """Detect market trends from lead data"""
-        if not self.leads_db:
+        totals = self.store.totals() if self.store is not None else self.totals
+        if not totals['lead_count']:
             return {}
 
-        total_value = sum(
-            entry['lead'].estimated_value
-            for entry in self.leads_db
-            if entry['lead'].estimated_value
-        )
-
-        avg_value = total_value / len(self.leads_db) if self.leads_db else 0
-
-        cap_rates = [
-            entry['lead'].roi_analysis.get('cap_rate', 0)
-            for entry in self.leads_db
-            if entry['lead'].roi_analysis
-        ]
-
-        avg_cap_rate = sum(cap_rates) / len(cap_rates) if cap_rates else 0
+        avg_value = totals['total_value'] / totals['lead_count']
+        avg_cap_rate = totals['cap_rate_sum'] / totals['analyzed_count'] if totals['analyzed_count'] else 0
 
         return {
-            'total_leads': len(self.leads_db),
+            'total_leads': totals['lead_count'],
             'avg_property_value': avg_value,
             'avg_cap_rate': avg_cap_rate,
             'market_sentiment': 'bullish' if avg_cap_rate > 7 else 'neutral' if avg_cap_rate > 5 else 'bearish'
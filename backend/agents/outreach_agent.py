@@ -1,8 +1,29 @@
 """Claude-powered agent for human-like empathetic messaging"""
 import asyncio
-from typing import Dict, Optional
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
 import httpx
 
+from utils.adaptive_limiter import AdaptiveConcurrencyLimiter, send_with_backoff
+from utils.message_cache import MessageSkeletonCache, OWNER_PLACEHOLDER, STREET_PLACEHOLDER
+from utils.single_flight import SingleFlight, normalize_prompt
+
+# Fixed parts of the template message around the per-lead fields
+MESSAGE_GREETING = "Hi "
+MESSAGE_INTRO = ",\n\nI hope this message finds you well. My name is Alex Rodriguez, and I was researching properties in "
+MESSAGE_PROPERTY = " when I came across your property at "
+MESSAGE_CLOSING = """Would you be open to a brief conversation about your plans for the property? I'm happy to share more detailed market analysis specific to your neighborhood.
+
+Best regards,
+Alex Rodriguez
+Real Estate Investment Specialist
+Phone: (555) 123-4567
+Email: alex.rodriguez@realestateinvest.com
+"""
 
 class OutreachAgent:
     """Claude-powered agent for human-like empathetic messaging"""
@@ -10,9 +31,42 @@ class OutreachAgent:
     def __init__(self, config: Dict):
         self.config = config
         self.api_key = config.get('api_key')
+        self.base_url = config.get('base_url', 'https://api.anthropic.com')
         self.model = config.get('model', 'claude-3-5-sonnet-20241022')
         self.temperature = config.get('temperature', 0.7)
         self.templates = self._load_templates()
+        # Message bodies after the street, one per combination of template choices
+        self._compiled_bodies: Dict[Tuple[int, bool, int], str] = {}
+
+        # Optional cache of Claude messages shared by leads with the same
+        # area, recommendation and cap-rate band
+        self.cap_rate_band = float(config.get('cache_cap_rate_band', 1.0))
+        self.message_cache = None
+        if config.get('message_cache_path'):
+            self.message_cache = MessageSkeletonCache(
+                config['message_cache_path'],
+                max_entries=int(config.get('message_cache_size', 1000))
+            )
+
+        self._client: Optional[httpx.AsyncClient] = None
+
+        # Back off on 429/529/5xx instead of dropping to templates; retries for
+        # one message stop at request_deadline seconds
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=int(config.get('initial_concurrency', 4)),
+            max_limit=int(config.get('max_concurrency', 16))
+        )
+        self.request_deadline = float(config.get('request_deadline', 90))
+
+        # Identical prompts in flight at the same time share one request
+        self.single_flight = SingleFlight()
+
+        # Pending Message Batches jobs, persisted so polling survives restarts
+        self.batch_state_path = Path(config.get('batch_state_path', 'data/outreach_batches.json'))
+
+    @property
+    def claude_enabled(self) -> bool:
+        return bool(self.api_key) and self.api_key != 'your_claude_api_key_here'
 
     async def create_message(self, owner_name: str, address: str, roi_data: Dict) -> str:
         """
@@ -21,7 +75,7 @@ class OutreachAgent:
         """
 
         # Use Claude API if available
-        if self.api_key and self.api_key != 'your_claude_api_key_here':
+        if self.claude_enabled:
             claude_message = await self._claude_generate_message(owner_name, address, roi_data)
             if claude_message:
                 return claude_message
@@ -29,15 +83,102 @@ class OutreachAgent:
         # Fallback to template-based generation
         return self._template_based_message(owner_name, address, roi_data)
 
+    async def stream_message(self, owner_name: str, address: str, roi_data: Dict) -> AsyncIterator[str]:
+        """
+        Yield the outreach message in chunks as Claude produces them
+
+        Same message as create_message, for interactive drafting where the
+        first words should show up as soon as possible. Falls back to the
+        template message (as a single chunk) when Claude is unavailable or
+        fails before sending any text.
+        """
+        if self.claude_enabled:
+            started = False
+            try:
+                async for chunk in self._claude_stream_message(owner_name, address, roi_data):
+                    started = True
+                    yield chunk
+            except Exception as e:
+                print(f"  Error streaming from Claude API: {e}")
+
+            if started:
+                return
+
+        yield self._template_based_message(owner_name, address, roi_data)
+
     async def _claude_generate_message(self, owner_name: str, address: str, roi_data: Dict) -> Optional[str]:
         """Use Claude API to generate personalized outreach message"""
         try:
-            # Extract key metrics
-            cap_rate = roi_data.get('cap_rate', 0)
-            estimated_value = roi_data.get('estimated_value', 0)
-            recommendation = roi_data.get('recommendation', '')
+            if self.message_cache is None:
+                return await self._claude_request(self._message_prompt(owner_name, address, roi_data))
+
+            street, _ = self._split_address(address)
+            key, prompt = self._skeleton_request(address, roi_data)
+
+            skeleton = self.message_cache.get(key)
+            if skeleton is None:
+                skeleton = await self._claude_request(prompt)
+                if not skeleton:
+                    return None
+                if not MessageSkeletonCache.is_reusable(skeleton, owner_name, street):
+                    # Hard-coded names or streets must not reach other owners
+                    print("  Claude skeleton lacks placeholders; writing this message for the lead alone")
+                    return await self._claude_request(self._message_prompt(owner_name, address, roi_data))
+                self.message_cache.put(key, skeleton)
+
+            return MessageSkeletonCache.fill(skeleton, owner_name, street)
+
+        except Exception as e:
+            print(f"  Error using Claude API: {e}")
+            return None
+
+    async def _claude_stream_message(self, owner_name: str, address: str, roi_data: Dict) -> AsyncIterator[str]:
+        """Stream a Claude message, going through the skeleton cache when enabled"""
+        if self.message_cache is None:
+            async for chunk in self._claude_stream(self._message_prompt(owner_name, address, roi_data)):
+                yield chunk
+            return
 
-            prompt = f"""You are a professional real estate investor reaching out to a property owner. Write a personalized, empathetic message to {owner_name} about their property at {address}.
+        street, _ = self._split_address(address)
+        key, prompt = self._skeleton_request(address, roi_data)
+
+        skeleton = self.message_cache.get(key)
+        if skeleton is not None:
+            yield MessageSkeletonCache.fill(skeleton, owner_name, street)
+            return
+
+        # Placeholders can be split across chunks, so hold back any tail that
+        # could still turn into one before filling it in
+        parts = []
+        pending = ''
+        async for chunk in self._claude_stream(prompt):
+            parts.append(chunk)
+            pending += chunk
+            cut = pending.rfind('{')
+            while cut > 0 and pending[cut - 1] == '{':
+                cut -= 1
+            if cut == -1 or '}}' in pending[cut:]:
+                cut = len(pending)
+            ready, pending = pending[:cut], pending[cut:]
+            if ready:
+                yield MessageSkeletonCache.fill(ready, owner_name, street)
+
+        if pending:
+            yield MessageSkeletonCache.fill(pending, owner_name, street)
+
+        # Already sent to this lead either way; only reusable skeletons are cached
+        skeleton = ''.join(parts).strip()
+        if skeleton and MessageSkeletonCache.is_reusable(skeleton, owner_name, street):
+            self.message_cache.put(key, skeleton)
+
+    def _message_prompt(self, owner_name: str, address: str, roi_data: Dict) -> str:
+        """Prompt for a message written to one specific lead"""
+        # Extract key metrics
+        cap_rate = roi_data.get('cap_rate', 0)
+        estimated_value = roi_data.get('estimated_value', 0)
+        recommendation = roi_data.get('recommendation', '')
+
+        return f"""You are a professional real estate investor reaching out to a property owner. Write a personalized, empathetic message to {owner_name} about their property at {address}.
 
 Key details:
 - Property estimated value: ${estimated_value:,.2f}
@@ -55,49 +196,401 @@ Requirements:
 
 Write the message now:"""
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 1024,
-                        "temperature": self.temperature,
-                        "messages": [
-                            {"role": "user", "content": prompt}
-                        ]
-                    },
-                    timeout=30.0
-                )
-
-                if response.status_code == 200:
-                    result = response.json()
-                    message = result['content'][0]['text']
-                    return message.strip()
-                else:
-                    print(f"  Claude API error: {response.status_code}")
+    def _skeleton_request(self, address: str, roi_data: Dict) -> Tuple[str, str]:
+        """
+        Cache key and prompt for a reusable message skeleton: Claude writes one
+        message per (area, recommendation, cap-rate band) with placeholders for
+        the owner and street, which are filled in per lead
+        """
+        _, area = self._split_address(address)
+        recommendation = roi_data.get('recommendation', '')
+        band_low = (roi_data.get('cap_rate', 0) // self.cap_rate_band) * self.cap_rate_band
+        key = '|'.join([' '.join(area.lower().split()), recommendation.lower(), f"{band_low:g}"])
+
+        prompt = f"""You are a professional real estate investor reaching out to a property owner. Write a personalized, empathetic message to {OWNER_PLACEHOLDER} about their property at {STREET_PLACEHOLDER} in {area or "the area"}.
+
+Key details:
+- Cap rate: between {band_low:g}% and {band_low + self.cap_rate_band:g}%
+- Investment assessment: {recommendation}
+
+Requirements:
+1. Be warm and professional, not salesy
+2. Show genuine interest in the property and neighborhood
+3. Mention specific details about the area
+4. Keep it concise (200-300 words)
+5. End with a soft call-to-action
+6. No preamble or meta-commentary - just the message itself
+7. Sign as "Alex Rodriguez, Real Estate Investment Specialist"
+8. Write {OWNER_PLACEHOLDER} and {STREET_PLACEHOLDER} exactly as shown wherever the owner's name or the street belongs, and do not quote exact prices
+
+Write the message now:"""
+
+        return key, prompt
+
+    async def _claude_request(self, prompt: str) -> Optional[str]:
+        """Send a single-turn prompt to Claude and return the message text"""
+        return await self.single_flight.do(normalize_prompt(prompt), lambda: self._send_claude_request(prompt))
+
+    async def _send_claude_request(self, prompt: str) -> Optional[str]:
+        client = self._get_client()
+
+        async def send(time_left: float) -> httpx.Response:
+            return await client.post(
+                f"{self.base_url}/v1/messages",
+                headers=self._claude_headers(),
+                json=self._claude_payload(prompt),
+                timeout=min(30.0, time_left)
+            )
+
+        response = await send_with_backoff(self.limiter, send, time.monotonic() + self.request_deadline)
+
+        if response.status_code == 200:
+            result = response.json()
+            message = result['content'][0]['text']
+            return message.strip()
+        else:
+            print(f"  Claude API error: {response.status_code}")
+            return None
+
+    async def _claude_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Send a streaming request to Claude and yield text deltas as they arrive"""
+        client = self._get_client()
+        payload = self._claude_payload(prompt)
+        payload['stream'] = True
+
+        async def send(time_left: float) -> httpx.Response:
+            request = client.build_request(
+                "POST",
+                f"{self.base_url}/v1/messages",
+                headers=self._claude_headers(),
+                json=payload,
+                timeout=min(30.0, time_left)
+            )
+            return await client.send(request, stream=True)
+
+        # Retries only cover getting the stream started; once text flows it is final
+        response = await send_with_backoff(self.limiter, send, time.monotonic() + self.request_deadline)
+
+        try:
+            if response.status_code != 200:
+                await response.aread()
+                print(f"  Claude API error: {response.status_code}")
+                return
+
+            leading = True
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+
+                event = json.loads(line[5:])
+                if event.get('type') == 'content_block_delta':
+                    text = event.get('delta', {}).get('text', '')
+                    if leading:
+                        # Match the stripped non-streaming message
+                        text = text.lstrip()
+                        leading = not text
+                    if text:
+                        yield text
+                elif event.get('type') == 'error':
+                    raise RuntimeError(event.get('error', {}).get('message', 'stream error'))
+                elif event.get('type') == 'message_stop':
+                    break
+        finally:
+            await response.aclose()
+
+    def _claude_headers(self) -> Dict:
+        return {
+            "x-api-key": self.api_key,
+            "anthropic-version": "2023-06-01",
+            "Content-Type": "application/json"
+        }
+
+    def _claude_payload(self, prompt: str) -> Dict:
+        return {
+            "model": self.model,
+            "max_tokens": 1024,
+            "temperature": self.temperature,
+            "messages": [
+                {"role": "user", "content": prompt}
+            ]
+        }
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared client so repeated requests reuse the open connection"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient()
+        return self._client
+
+    async def aclose(self):
+        """Close the shared HTTP client and the skeleton cache"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.message_cache is not None:
+            self.message_cache.close()
+            self.message_cache = None
+
+    async def submit_batch(self, leads: List[Tuple[str, str, Dict]]) -> Optional[str]:
+        """
+        Submit one Claude Message Batches job covering many leads
+
+        Args:
+            leads: (owner_name, address, roi_data) tuples, at most 100,000 per job
+
+        Returns:
+            Batch job ID, or None if the submission failed. The job and its
+            leads are persisted to `batch_state_path`, so polling can resume
+            after a restart.
+        """
+        if not self.claude_enabled:
+            print("  Claude API key not configured; batch mode unavailable")
+            return None
+
+        requests = []
+        job_leads = {}
+        for index, (owner_name, address, roi_data) in enumerate(leads):
+            custom_id = f"lead-{index}"
+            requests.append({
+                "custom_id": custom_id,
+                "params": self._claude_payload(self._message_prompt(owner_name, address, roi_data))
+            })
+            job_leads[custom_id] = {'owner': owner_name, 'address': address, 'roi_data': roi_data}
+
+        try:
+            response = await self._get_client().post(
+                f"{self.base_url}/v1/messages/batches",
+                headers=self._claude_headers(),
+                json={"requests": requests},
+                timeout=120.0
+            )
+
+            if response.status_code != 200:
+                print(f"  Claude batch API error: {response.status_code}")
+                return None
+
+            job = response.json()
+        except Exception as e:
+            print(f"  Error submitting Claude batch: {e}")
+            return None
+
+        state = self._load_batch_state()
+        state[job['id']] = {
+            'submitted_at': datetime.now().isoformat(),
+            'processing_status': job.get('processing_status', 'in_progress'),
+            'leads': job_leads
+        }
+        self._save_batch_state(state)
+
+        print(f"  Submitted Claude batch {job['id']} with {len(requests)} messages")
+        return job['id']
+
+    async def poll_batch(self, job_id: str) -> Optional[Dict]:
+        """Fetch the current status of a batch job and record it in the job state"""
+        try:
+            response = await self._get_client().get(
+                f"{self.base_url}/v1/messages/batches/{job_id}",
+                headers=self._claude_headers(),
+                timeout=30.0
+            )
+
+            if response.status_code != 200:
+                print(f"  Claude batch API error: {response.status_code}")
+                return None
+
+            job = response.json()
+        except Exception as e:
+            print(f"  Error polling Claude batch {job_id}: {e}")
+            return None
+
+        state = self._load_batch_state()
+        if job_id in state and state[job_id].get('processing_status') != job.get('processing_status'):
+            state[job_id]['processing_status'] = job.get('processing_status')
+            self._save_batch_state(state)
+
+        return job
+
+    async def wait_for_batch(self, job_id: str, poll_interval: float = 60.0, timeout: float = 86400.0,
+                             max_poll_errors: int = 5) -> Optional[List[str]]:
+        """
+        Poll a batch job until it ends, then collect its messages
+
+        Args:
+            timeout: Seconds to keep polling; Claude expires unfinished batches after 24 hours
+            max_poll_errors: Consecutive failed polls (missing job, API errors) before giving up
+
+        Returns:
+            The messages, or None when the job is unknown, keeps failing to
+            poll or times out. Canceled and expired jobs still end; their
+            unfinished requests get template messages (see collect_batch)
+        """
+        if job_id not in self._load_batch_state():
+            print(f"  Unknown Claude batch {job_id}")
+            return None
+
+        deadline = time.monotonic() + timeout
+        poll_errors = 0
+        while True:
+            job = await self.poll_batch(job_id)
+            if job is None:
+                poll_errors += 1
+                if poll_errors >= max_poll_errors:
+                    print(f"  Giving up on Claude batch {job_id} after {poll_errors} failed polls")
                     return None
+            else:
+                poll_errors = 0
+                # 'in_progress' and 'canceling' both end up 'ended'
+                if job.get('processing_status') == 'ended':
+                    return await self.collect_batch(job_id, job.get('results_url'))
+
+            if time.monotonic() + poll_interval > deadline:
+                print(f"  Timed out waiting for Claude batch {job_id}")
+                return None
+            await asyncio.sleep(poll_interval)
+
+    async def collect_batch(self, job_id: str, results_url: str = None) -> Optional[List[str]]:
+        """
+        Download an ended batch job's results and map them back to its leads
+
+        Returns:
+            One message per lead in submission order. Requests that errored,
+            expired or were canceled get the template message instead.
+        """
+        state = self._load_batch_state()
+        job_state = state.get(job_id)
+        if job_state is None:
+            print(f"  Unknown Claude batch {job_id}")
+            return None
+
+        try:
+            response = await self._get_client().get(
+                results_url or f"{self.base_url}/v1/messages/batches/{job_id}/results",
+                headers=self._claude_headers(),
+                timeout=120.0
+            )
 
+            if response.status_code != 200:
+                print(f"  Claude batch API error: {response.status_code}")
+                return None
+
+            generated = {}
+            # Requests that did not succeed, by result type (errored, canceled, expired)
+            unfinished: Dict[str, int] = {}
+            for line in response.text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                result = entry.get('result', {})
+                if result.get('type') == 'succeeded':
+                    generated[entry['custom_id']] = result['message']['content'][0]['text'].strip()
+                else:
+                    unfinished[result.get('type')] = unfinished.get(result.get('type'), 0) + 1
         except Exception as e:
-            print(f"  Error using Claude API: {e}")
+            print(f"  Error collecting Claude batch {job_id}: {e}")
             return None
 
+        messages = []
+        for custom_id, lead in sorted(job_state['leads'].items(), key=lambda item: int(item[0].split('-')[1])):
+            message = generated.get(custom_id)
+            if not message:
+                message = self._template_based_message(lead['owner'], lead['address'], lead['roi_data'])
+            messages.append(message)
+
+        failed = len(job_state['leads']) - len(generated)
+        print(f"  Collected Claude batch {job_id}: {len(generated)} generated"
+              + (f", {failed} from templates" if failed else ""))
+        if unfinished:
+            print("  Not generated: " + ", ".join(f"{count} {kind}" for kind, count in sorted(unfinished.items())))
+
+        del state[job_id]
+        self._save_batch_state(state)
+        return messages
+
+    async def resume_batches(self, poll_interval: float = 60.0, timeout: float = 86400.0) -> Dict[str, List[str]]:
+        """Wait for every batch job left in the state file, e.g. after a restart"""
+        results = {}
+        for job_id in list(self._load_batch_state()):
+            messages = await self.wait_for_batch(job_id, poll_interval, timeout)
+            if messages is not None:
+                results[job_id] = messages
+        return results
+
+    def _load_batch_state(self) -> Dict:
+        if not self.batch_state_path.exists():
+            return {}
+        with open(self.batch_state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_batch_state(self, state: Dict):
+        """Write the batch job state atomically so a crash never leaves it half-written"""
+        self.batch_state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.batch_state_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.batch_state_path)
+
+    def cache_stats(self) -> Optional[Dict]:
+        """Hit-rate metrics for the message skeleton cache, if enabled"""
+        return self.message_cache.stats() if self.message_cache is not None else None
+
+    def create_template_messages(self, leads: Iterable[Tuple[str, str, Dict]],
+                                 output_path: str = None) -> Union[List[str], int]:
+        """
+        Render template messages for many leads without calling Claude. Each
+        message is rendered exactly as the per-lead template fallback renders
+        it; this is a convenience for campaigns, not a faster path
+
+        Args:
+            leads: (owner_name, address, roi_data) tuples
+            output_path: Optional JSONL file to stream messages to instead of
+                keeping them in memory
+
+        Returns:
+            The messages in input order, or the number written when output_path is set
+        """
+        render = self._template_based_message
+
+        if output_path is None:
+            return [render(owner_name, address, roi_data) for owner_name, address, roi_data in leads]
+
+        count = 0
+        with open(output_path, 'w', encoding='utf-8', buffering=1 << 20) as f:
+            for owner_name, address, roi_data in leads:
+                f.write(json.dumps({
+                    'owner': owner_name,
+                    'address': address,
+                    'message': render(owner_name, address, roi_data)
+                }))
+                f.write('\n')
+                count += 1
+
+        return count
+
     def _template_based_message(self, owner_name: str, address: str, roi_data: Dict) -> str:
         """Generate message using templates"""
-        template = self._select_template(roi_data)
+        key = self._template_key(roi_data)
+        body = self._compiled_bodies.get(key)
+        if body is None:
+            body = self._compile_body(roi_data)
+            self._compiled_bodies[key] = body
 
         # Extract location details
         address_parts = address.split(',')
         street = address_parts[0].strip() if address_parts else address
         neighborhood = address_parts[-1].strip() if len(address_parts) > 1 else "the area"
 
-        message = f"""Hi {owner_name},
+        return ''.join((MESSAGE_GREETING, owner_name, MESSAGE_INTRO, neighborhood, MESSAGE_PROPERTY, street, body))
+
+    @staticmethod
+    def _split_address(address: str) -> Tuple[str, str]:
+        """Split an address into its street and the area after it"""
+        street, _, area = address.partition(',')
+        return street.strip(), area.strip()
+
+    def _compile_body(self, roi_data: Dict) -> str:
+        """Build the message text that follows the street for this template choice"""
+        template = self._select_template(roi_data)
 
-I hope this message finds you well. My name is Alex Rodriguez, and I was researching properties in {neighborhood} when I came across your property at {street}.
+        return f""".
 
 {self._personalize_content(roi_data)}
 
@@ -105,16 +598,26 @@ I hope this message finds you well. My name is Alex Rodriguez, and I was researc
 
 {self._add_value_proposition(roi_data)}
 
-Would you be open to a brief conversation about your plans for the property? I'm happy to share more detailed market analysis specific to your neighborhood.
+{MESSAGE_CLOSING}"""
 
-Best regards,
-Alex Rodriguez
-Real Estate Investment Specialist
-Phone: (555) 123-4567
-Email: alex.rodriguez@realestateinvest.com
-"""
+    @staticmethod
+    def _template_key(roi_data: Dict) -> Tuple[int, bool, int]:
+        """
+        Identify which template text roi_data selects; must mirror the branches
+        in _select_template, _personalize_content and _add_value_proposition
+        """
+        cap_rate = roi_data.get('cap_rate', 0)
+        cap_band = 3 if cap_rate > 10 else 2 if cap_rate > 8 else 1 if cap_rate > 7 else 0
+
+        recommendation = roi_data.get('recommendation', '')
+        if 'Strong Buy' in recommendation or 'Excellent' in recommendation:
+            recommendation_band = 2
+        elif 'Good' in recommendation:
+            recommendation_band = 1
+        else:
+            recommendation_band = 0
 
-        return message
+        return cap_band, roi_data.get('risk_score', 5) < 3, recommendation_band
 
     def _select_template(self, roi_data: Dict) -> Dict:
         """Select appropriate message template based on ROI analysis"""
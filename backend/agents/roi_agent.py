@@ -1,8 +1,17 @@
 """DeepSeek-powered agent for mathematical ROI analysis"""
 import asyncio
-from typing import Dict, Optional
+import json
+import re
+import time
+from typing import Dict, List, Optional
 import httpx
 
+from utils.adaptive_limiter import AdaptiveConcurrencyLimiter, send_with_backoff
+from utils.comps_index import ComparableSalesIndex
+from utils.financing import FinancingEngine, LoanTerms
+from utils.location_index import LocationFeatures, LocationIndex
+from utils.single_flight import SingleFlight, normalize_prompt
+
 
 class ROIAnalysisAgent:
     """DeepSeek-powered agent for complex ROI calculations"""
@@ -12,6 +21,34 @@ class ROIAnalysisAgent:
         self.api_key = config.get('api_key')
         self.base_url = config.get('base_url', 'https://api.deepseek.com')
         self.model = config.get('model', 'deepseek-chat')
+        self.batch_size = max(1, int(config.get('analysis_batch_size', 10)))
+        # 'single' retries failed batch elements one by one, 'local' goes straight to manual math
+        self.batch_fallback = config.get('batch_fallback', 'single')
+
+        # Back off on 429/5xx instead of dropping to manual math; retries for
+        # one analysis stop at request_deadline seconds
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=int(config.get('initial_concurrency', 4)),
+            max_limit=int(config.get('max_concurrency', 16))
+        )
+        self.request_deadline = float(config.get('request_deadline', 90))
+
+        # Identical prompts in flight at the same time share one request
+        self.single_flight = SingleFlight()
+
+        # Optional comparable-sales dataset for coordinate-based valuation
+        self.comps_k = int(config.get('comps_k', 5))
+        self.comps_index = self._load_comps(config.get('comps_path'))
+
+        # Neighborhood/ZIP multipliers, rent ratios and risk adjustments
+        self.locations = self._load_locations(config.get('locations_path'))
+
+        # Loan terms behind cash-on-cash, DSCR and equity build-up
+        self.financing = FinancingEngine(LoanTerms.from_config(config.get('financing')))
+
+    @property
+    def deepseek_enabled(self) -> bool:
+        return bool(self.api_key) and self.api_key != 'your_deepseek_api_key_here'
 
     async def analyze_property(self, address: str, property_data: Dict) -> Dict:
         """
@@ -25,16 +62,93 @@ class ROIAnalysisAgent:
         """
 
         # Extract property details
-        purchase_price = self._estimate_value(property_data)
-        monthly_rent = self._estimate_rent(purchase_price)
+        location = self.locations.resolve(property_data.get('address', address))
+        purchase_price = self._estimate_value(property_data, location)
+        monthly_rent = self._estimate_rent(purchase_price, location.rent_ratio)
+        financing = self.financing.analyze(purchase_price, self._calculate_noi(monthly_rent))
 
         # Use DeepSeek for advanced analysis if API key is available
-        if self.api_key and self.api_key != 'your_deepseek_api_key_here':
+        if self.deepseek_enabled:
             advanced_analysis = await self._deepseek_analysis(address, purchase_price, monthly_rent)
             if advanced_analysis:
-                return advanced_analysis
+                return self._with_financing(advanced_analysis, financing)
 
         # Fallback to manual calculations
+        return self._local_analysis(address, property_data, purchase_price, monthly_rent, financing, location)
+
+    async def analyze_properties(self, properties: List[Dict]) -> List[Dict]:
+        """
+        Analyze many properties, packing up to `analysis_batch_size` of them
+        into each DeepSeek request.
+
+        Each property dict needs an 'address' key (the same shape that
+        analyze_property takes as property_data). Results come back in input
+        order. Elements the batch response does not cover, or that fail
+        validation, fall back to a per-property request or to the manual
+        calculations depending on `batch_fallback`. Properties whose batch
+        request failed outright (transport error or non-200) go straight to
+        the manual calculations: the same endpoint would fail them again.
+        """
+        estimates = []
+        locations = []
+        for property_data in properties:
+            location = self.locations.resolve(property_data.get('address', ''))
+            purchase_price = self._estimate_value(property_data, location)
+            estimates.append((
+                property_data.get('address', ''),
+                purchase_price,
+                self._estimate_rent(purchase_price, location.rent_ratio)
+            ))
+            locations.append(location)
+
+        financing = self.financing.analyze_batch(
+            [purchase_price for _, purchase_price, _ in estimates],
+            [self._calculate_noi(monthly_rent) for _, _, monthly_rent in estimates]
+        )
+
+        results: List[Optional[Dict]] = [None] * len(properties)
+        # Elements of batches DeepSeek answered, the only ones worth a single retry
+        answered = set()
+
+        if self.deepseek_enabled:
+            # Batches run concurrently; the limiter decides how many are in flight
+            batches = await asyncio.gather(*[
+                self._deepseek_batch_analysis([
+                    (i, *estimates[i])
+                    for i in range(start, min(start + self.batch_size, len(properties)))
+                ])
+                for start in range(0, len(properties), self.batch_size)
+            ])
+            for start, batch_results in zip(range(0, len(properties), self.batch_size), batches):
+                if batch_results is None:
+                    continue
+                answered.update(range(start, min(start + self.batch_size, len(properties))))
+                for i, analysis in batch_results.items():
+                    results[i] = self._with_financing(analysis, financing[i])
+
+        missing = [i for i in sorted(answered) if results[i] is None]
+        if missing and self.batch_fallback == 'single':
+            # Per-property retries also run concurrently under the limiter
+            analyses = await asyncio.gather(*[self._deepseek_analysis(*estimates[i]) for i in missing])
+            for i, analysis in zip(missing, analyses):
+                if analysis:
+                    results[i] = self._with_financing(analysis, financing[i])
+
+        for i, property_data in enumerate(properties):
+            if results[i] is None:
+                address, purchase_price, monthly_rent = estimates[i]
+                results[i] = self._local_analysis(
+                    address, property_data, purchase_price, monthly_rent, financing[i], locations[i]
+                )
+
+        return results
+
+    def _local_analysis(self, address: str, property_data: Dict, purchase_price: float, monthly_rent: float,
+                        financing: Optional[Dict] = None, location: Optional[LocationFeatures] = None) -> Dict:
+        """Manual ROI calculations used when DeepSeek is unavailable"""
+        if financing is None:
+            financing = self.financing.analyze(purchase_price, self._calculate_noi(monthly_rent))
+
         analysis = {
             'address': address,
             'estimated_value': purchase_price,
@@ -43,13 +157,20 @@ class ROIAnalysisAgent:
             'vacancy_rate': 0.05,  # 5%
             'operating_expenses_rate': 0.35,  # 35%
             'cap_rate': self._calculate_cap_rate(purchase_price, monthly_rent),
-            'cash_on_cash_return': self._calculate_cash_on_cash(purchase_price, monthly_rent),
+            'cash_on_cash_return': financing['cash_on_cash_return'],
             'five_year_irr': self._calculate_irr(purchase_price, monthly_rent),
             'noi': self._calculate_noi(monthly_rent),
-            'risk_score': self._calculate_risk_score(property_data),
+            'risk_score': self._calculate_risk_score(property_data, location),
             'recommendation': self._generate_recommendation(purchase_price, monthly_rent)
         }
 
+        return self._with_financing(analysis, financing)
+
+    @staticmethod
+    def _with_financing(analysis: Dict, financing: Dict) -> Dict:
+        """Attach loan metrics without overriding figures the analysis already has"""
+        for key, value in financing.items():
+            analysis.setdefault(key, value)
         return analysis
 
     async def _deepseek_analysis(self, address: str, purchase_price: float, monthly_rent: float) -> Optional[Dict]:
@@ -81,8 +202,123 @@ Provide your response in JSON format with the following structure:
 }}
 """
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+            content = await self._chat_completion(prompt, max_tokens=2000)
+            if content is None:
+                return None
+
+            analysis = json.loads(self._extract_json(content))
+
+            # Add property details
+            return self._with_property_details(analysis, address, purchase_price, monthly_rent)
+
+        except Exception as e:
+            print(f"  Error using DeepSeek API: {e}")
+            return None
+
+    async def _deepseek_batch_analysis(self, items: List[tuple]) -> Optional[Dict[int, Dict]]:
+        """
+        Analyze several properties in a single DeepSeek request
+
+        Args:
+            items: (index, address, purchase_price, monthly_rent) tuples
+
+        Returns:
+            Mapping of index -> analysis for every element that came back valid,
+            or None when the request itself failed
+        """
+        properties = [
+            {
+                'id': index,
+                'address': address,
+                'purchase_price': round(purchase_price, 2),
+                'monthly_rent': round(monthly_rent, 2)
+            }
+            for index, address, purchase_price, monthly_rent in items
+        ]
+
+        # Keep the instructions first and the per-property numbers last so the
+        # shared prefix is identical across batches
+        prompt = f"""Analyze each of the real estate investment opportunities listed below and provide detailed ROI calculations.
+
+For every property calculate:
+1. Cap Rate (Capitalization Rate)
+2. Cash-on-Cash Return (assuming 20% down payment)
+3. Net Operating Income (NOI) - assume 5% vacancy and 35% operating expenses
+4. 5-Year IRR projection (assuming 3% annual appreciation)
+5. Risk Score (1-10 scale)
+6. Investment Recommendation
+
+Provide your response as a JSON array with exactly one object per property, using the property's "id":
+[
+  {{
+    "id": <number>,
+    "cap_rate": <number>,
+    "cash_on_cash_return": <number>,
+    "noi": <number>,
+    "five_year_irr": <number>,
+    "risk_score": <number>,
+    "recommendation": "<string>",
+    "analysis_details": "<one sentence>"
+  }}
+]
+
+Properties:
+{json.dumps(properties, indent=2)}
+"""
+
+        try:
+            content = await self._chat_completion(
+                prompt,
+                max_tokens=min(8000, 500 + 350 * len(items)),
+                request_timeout=120.0
+            )
+        except Exception as e:
+            print(f"  Error using DeepSeek batch API: {e}")
+            return None
+        if content is None:
+            return None
+
+        try:
+            elements = json.loads(self._extract_json(content, array=True))
+        except ValueError as e:
+            print(f"  DeepSeek batch response was not valid JSON: {e}")
+            return {}
+
+        if not isinstance(elements, list):
+            print("  DeepSeek batch response was not a JSON array")
+            return {}
+
+        by_index = {index: (address, purchase_price, monthly_rent) for index, address, purchase_price, monthly_rent in items}
+        results = {}
+
+        for element in elements:
+            if not self._is_valid_analysis(element):
+                continue
+
+            index = element.pop('id')
+            if index not in by_index or index in results:
+                continue
+
+            results[index] = self._with_property_details(element, *by_index[index])
+
+        if len(results) < len(items):
+            print(f"  DeepSeek batch: {len(items) - len(results)}/{len(items)} elements missing or invalid")
+
+        return results
+
+    async def _chat_completion(self, prompt: str, max_tokens: int, request_timeout: float = 30.0) -> Optional[str]:
+        """Send a single-turn chat completion to DeepSeek and return the message text"""
+        return await self.single_flight.do(
+            (normalize_prompt(prompt), max_tokens),
+            lambda: self._send_chat_completion(prompt, max_tokens, request_timeout)
+        )
+
+    async def _send_chat_completion(self, prompt: str, max_tokens: int, request_timeout: float) -> Optional[str]:
+        deadline = time.monotonic() + self.request_deadline
+
+        async with httpx.AsyncClient() as client:
+            async def send(time_left: float) -> httpx.Response:
+                return await client.post(
                     f"{self.base_url}/v1/chat/completions",
                     headers={
                         "Authorization": f"Bearer {self.api_key}",
@@ -94,78 +330,124 @@ Provide your response in JSON format with the following structure:
                             {"role": "user", "content": prompt}
                         ],
                         "temperature": 0.1,  # Low temperature for consistent calculations
-                        "max_tokens": 2000
+                        "max_tokens": max_tokens
                     },
-                    timeout=30.0
+                    timeout=min(request_timeout, time_left)
                 )
 
-                if response.status_code == 200:
-                    result = response.json()
-                    content = result['choices'][0]['message']['content']
-
-                    # Try to parse JSON from response
-                    import json
-                    import re
-
-                    # Extract JSON from markdown code blocks if present
-                    json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-                    if json_match:
-                        content = json_match.group(1)
-                    else:
-                        # Try to find JSON object
-                        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                        if json_match:
-                            content = json_match.group(0)
+            response = await send_with_backoff(self.limiter, send, deadline)
+
+            if response.status_code != 200:
+                print(f"  DeepSeek API error: {response.status_code}")
+                return None
+
+            result = response.json()
+            return result['choices'][0]['message']['content']
+
+    @staticmethod
+    def _extract_json(content: str, array: bool = False) -> str:
+        """Pull the JSON payload out of a model response"""
+        # Extract JSON from markdown code blocks if present
+        json_match = re.search(r'```(?:json)?\s*(.*?)\s*```', content, re.DOTALL)
+        if json_match:
+            return json_match.group(1)
+
+        # Try to find a bare JSON object (or array)
+        pattern = r'\[.*\]' if array else r'\{.*\}'
+        json_match = re.search(pattern, content, re.DOTALL)
+        if json_match:
+            return json_match.group(0)
+
+        return content
+
+    @staticmethod
+    def _is_valid_analysis(element) -> bool:
+        """Check that a batch element has an id and every numeric metric"""
+        if not isinstance(element, dict) or not isinstance(element.get('id'), int):
+            return False
+
+        for key in ('cap_rate', 'cash_on_cash_return', 'noi', 'five_year_irr', 'risk_score'):
+            value = element.get(key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+
+        return isinstance(element.get('recommendation'), str)
+
+    @staticmethod
+    def _with_property_details(analysis: Dict, address: str, purchase_price: float, monthly_rent: float) -> Dict:
+        """Attach the inputs and fixed assumptions to a DeepSeek analysis"""
+        analysis['address'] = address
+        analysis['estimated_value'] = purchase_price
+        analysis['monthly_rent_estimate'] = monthly_rent
+        analysis['annual_rent'] = monthly_rent * 12
+        analysis['vacancy_rate'] = 0.05
+        analysis['operating_expenses_rate'] = 0.35
+        return analysis
 
-                    analysis = json.loads(content)
+    def _estimate_value(self, property_data: Dict, location: Optional[LocationFeatures] = None) -> float:
+        """Complex property valuation using comps and algorithms"""
+        # Nearest comparable sales when the property has coordinates
+        comps_value = self._comps_value(property_data)
+        if comps_value:
+            return comps_value
 
-                    # Add property details
-                    analysis['address'] = address
-                    analysis['estimated_value'] = purchase_price
-                    analysis['monthly_rent_estimate'] = monthly_rent
-                    analysis['annual_rent'] = monthly_rent * 12
-                    analysis['vacancy_rate'] = 0.05
-                    analysis['operating_expenses_rate'] = 0.35
+        # Base value - used when no comps cover the property
+        base_value = 300000
 
-                    return analysis
+        # Location-based adjustment from the neighborhood/ZIP table
+        if location is None:
+            location = self.locations.resolve(property_data.get('address', ''))
 
-                else:
-                    print(f"  DeepSeek API error: {response.status_code}")
-                    return None
+        return base_value * location.value_multiplier
 
-        except Exception as e:
-            print(f"  Error using DeepSeek API: {e}")
+    def _comps_value(self, property_data: Dict) -> Optional[float]:
+        """k-nearest comparable-sales valuation, or None without coordinates or comps"""
+        if self.comps_index is None:
             return None
 
-    def _estimate_value(self, property_data: Dict) -> float:
-        """Complex property valuation using comps and algorithms"""
-        # Base value - in production would use actual market data
-        base_value = 300000
-
-        # Location-based adjustments
-        location_multipliers = {
-            'Manhattan': 2.5,
-            'Brooklyn': 1.8,
-            'Queens': 1.4,
-            'Bronx': 1.0,
-            'Staten Island': 1.2
-        }
+        latitude = property_data.get('latitude', property_data.get('lat'))
+        longitude = property_data.get('longitude', property_data.get('lon'))
+        if latitude is None or longitude is None:
+            return None
 
-        address = property_data.get('address', '')
-        multiplier = 1.2  # Default
+        try:
+            return self.comps_index.estimate_value(
+                float(latitude),
+                float(longitude),
+                k=self.comps_k,
+                sqft=property_data.get('sqft')
+            )
+        except (TypeError, ValueError):
+            return None
 
-        for location, mult in location_multipliers.items():
-            if location in address:
-                multiplier = mult
-                break
+    @staticmethod
+    def _load_locations(path: Optional[str]) -> LocationIndex:
+        """Build the location matcher, layering a configured table over the borough defaults"""
+        if path:
+            try:
+                return LocationIndex.from_file(path)
+            except Exception as e:
+                print(f"  Error loading location table from {path}: {e}")
+
+        return LocationIndex()
+
+    @staticmethod
+    def _load_comps(path: Optional[str]) -> Optional[ComparableSalesIndex]:
+        """Load the comparable-sales index if a dataset is configured"""
+        if not path:
+            return None
 
-        return base_value * multiplier
+        try:
+            return ComparableSalesIndex.from_csv(path)
+        except Exception as e:
+            print(f"  Error loading comparable sales from {path}: {e}")
+            return None
 
-    def _estimate_rent(self, purchase_price: float) -> float:
+    def _estimate_rent(self, purchase_price: float, rent_ratio: float = 0.009) -> float:
         """Estimate monthly rent based on property value"""
-        # Rule of thumb: 0.8% to 1.1% of property value per month
-        rent_percentage = 0.009  # 0.9% average
-        return purchase_price * rent_percentage
+        # Rule of thumb: 0.8% to 1.1% of property value per month, 0.9% unless
+        # the location table says otherwise
+        return purchase_price * rent_ratio
 
     def _calculate_noi(self, monthly_rent: float) -> float:
         """Calculate Net Operating Income"""
@@ -181,16 +463,8 @@ Provide your response in JSON format with the following structure:
         return (noi / value) * 100 if value > 0 else 0
 
     def _calculate_cash_on_cash(self, value: float, monthly_rent: float) -> float:
-        """Cash-on-cash return (assuming 20% down payment)"""
-        down_payment = value * 0.20
-        annual_cashflow = self._calculate_noi(monthly_rent)
-
-        # Subtract mortgage payments (simplified)
-        loan_amount = value * 0.80
-        annual_mortgage = loan_amount * 0.06  # Approximate 6% annual cost
-        net_cashflow = annual_cashflow - annual_mortgage
-
-        return (net_cashflow / down_payment) * 100 if down_payment > 0 else 0
+        """Cash-on-cash return after debt service on the configured loan terms"""
+        return self.financing.analyze(value, self._calculate_noi(monthly_rent))['cash_on_cash_return']
 
     def _calculate_irr(self, investment: float, monthly_cashflow: float) -> float:
         """5-year IRR calculation (simplified)"""
@@ -205,20 +479,15 @@ Provide your response in JSON format with the following structure:
 
         return annualized_return
 
-    def _calculate_risk_score(self, property_data: Dict) -> int:
+    def _calculate_risk_score(self, property_data: Dict, location: Optional[LocationFeatures] = None) -> int:
         """Calculate risk score (1-10, where 10 is highest risk)"""
         # Simplified risk assessment
         base_risk = 5
 
-        address = property_data.get('address', '')
-
         # Location-based risk adjustments
-        if 'Manhattan' in address:
-            base_risk -= 1  # Lower risk
-        elif 'Brooklyn' in address:
-            base_risk -= 0.5
-        elif 'Bronx' in address:
-            base_risk += 1  # Higher risk
+        if location is None:
+            location = self.locations.resolve(property_data.get('address', ''))
+        base_risk += location.risk_adjustment
 
         return max(1, min(10, int(base_risk)))
 
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark template-based outreach rendering (no LLM calls)
+Run from the backend directory: python benchmarks/bench_outreach_templates.py [num_leads]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Add backend directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from agents.outreach_agent import OutreachAgent
+
+
+def make_leads(count: int):
+    """Synthetic leads covering every template branch"""
+    random.seed(42)
+    recommendations = [
+        "Strong Buy - Excellent ROI potential",
+        "Buy - Good investment opportunity",
+        "Hold - Consider other factors",
+        "Pass - Below market expectations"
+    ]
+    boroughs = ["Brooklyn, NY 11201", "Queens, NY 11375", "Manhattan, NY 10001", "Bronx, NY 10451"]
+
+    return [
+        (
+            f"Owner {i}",
+            f"{random.randint(1, 9999)} Main Street, {random.choice(boroughs)}",
+            {
+                'cap_rate': random.uniform(2, 12),
+                'risk_score': random.randint(1, 9),
+                'recommendation': random.choice(recommendations)
+            }
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    agent = OutreachAgent({})
+    leads = make_leads(count)
+
+    print("=" * 60)
+    print(f"Template outreach benchmark - {count:,} leads")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    messages = agent.create_template_messages(leads)
+    elapsed = time.perf_counter() - start
+    print(f"  In memory:        {len(messages) / elapsed:>12,.0f} messages/sec")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "messages.jsonl")
+        start = time.perf_counter()
+        written = agent.create_template_messages(leads, output_path=output_path)
+        elapsed = time.perf_counter() - start
+        size_mb = os.path.getsize(output_path) / 1e6
+        print(f"  To JSONL:         {written / elapsed:>12,.0f} messages/sec ({size_mb:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
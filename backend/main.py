@@ -1,5 +1,6 @@
 import os
 import json
+import math
 import asyncio
 from typing import Dict, Any, List, Optional
 from dataclasses import dataclass
@@ -10,6 +11,8 @@ from agents.sourcing_agent import LeadSourcingAgent
 from agents.roi_agent import ROIAnalysisAgent
 from agents.outreach_agent import OutreachAgent
 from agents.knowledge_manager import KnowledgeManager
+from utils.geocoder import Geocoder
+from utils.lead_columns import LeadColumns
 from utils.sheets_logger import GoogleSheetsLogger
 from utils.config_loader import load_config
 
@@ -32,6 +35,8 @@ class Lead:
     outreach_message: Optional[str] = None
     source: Optional[str] = None
     timestamp: str = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
     def __post_init__(self):
         if not self.timestamp:
@@ -46,7 +51,8 @@ class RealEstateAIAgentSystem:
 
     def __init__(self, config_path: str = None):
         self.config = load_config(config_path)
-        self.leads_pipeline = []
+        # Compact lead table; analyses and messages are kept on disk, not in RAM
+        self.leads_pipeline = LeadColumns(self.config.get('pipeline_spill_dir'))
 
         # Initialize specialized agents
         self.sourcing_agent = LeadSourcingAgent(self.config.get('gemini', {}))
@@ -54,6 +60,9 @@ class RealEstateAIAgentSystem:
         self.outreach_agent = OutreachAgent(self.config.get('claude', {}))
         self.knowledge_agent = KnowledgeManager(self.config.get('notebooklm', {}))
 
+        # Offline geocoder; None unless a gazetteer file is configured
+        self.geocoder = Geocoder.from_config(self.config.get('geocoder', {}))
+
         # Initialize Google Sheets logger
         self.sheet_logger = GoogleSheetsLogger(
             sheet_id=self.config.get('google_sheet_id'),
@@ -83,17 +92,21 @@ class RealEstateAIAgentSystem:
             return []
 
         processed_leads = []
+        batch = raw_leads[:batch_size]
+
+        # Coordinates feed comps valuation and geohash hot zones
+        if self.geocoder is not None:
+            self._geocode_leads(batch)
+
+        # Step 2: Analyze ROI with DeepSeek (several properties per request)
+        print(f"📊 Analyzing ROI for {len(batch)} properties with DeepSeek...")
+        roi_analyses = await self.roi_agent.analyze_properties(batch)
 
-        for i, lead_data in enumerate(raw_leads[:batch_size]):
-            print(f"\n📝 Processing lead {i+1}/{min(len(raw_leads), batch_size)}")
+        for i, lead_data in enumerate(batch):
+            print(f"\n📝 Processing lead {i+1}/{len(batch)}")
 
             try:
-                # Step 2: Analyze ROI with DeepSeek
-                print("  📊 Analyzing ROI with DeepSeek...")
-                roi_analysis = await self.roi_agent.analyze_property(
-                    address=lead_data['address'],
-                    property_data=lead_data
-                )
+                roi_analysis = roi_analyses[i]
 
                 # Step 3: Create outreach message with Claude
                 print("  ✍️  Crafting outreach with Claude...")
@@ -111,7 +124,9 @@ class RealEstateAIAgentSystem:
                     estimated_value=roi_analysis.get('estimated_value'),
                     roi_analysis=roi_analysis,
                     outreach_message=outreach_message,
-                    source=lead_data.get('source')
+                    source=lead_data.get('source'),
+                    latitude=lead_data.get('latitude', lead_data.get('lat')),
+                    longitude=lead_data.get('longitude', lead_data.get('lon'))
                 )
 
                 # Step 4: Add to knowledge base
@@ -135,9 +150,9 @@ class RealEstateAIAgentSystem:
         print(f"\n✅ Pipeline complete! Processed {len(processed_leads)} leads.")
         return processed_leads
 
-    def query_knowledge_base(self, query: str) -> List[Dict]:
+    def query_knowledge_base(self, query: str, limit: int = 10) -> List[Dict]:
         """Query the knowledge base for insights"""
-        return self.knowledge_agent.query(query)
+        return self.knowledge_agent.query(query, limit=limit)
 
     def generate_report(self) -> Dict:
         """Generate a pipeline report"""
@@ -159,13 +174,29 @@ class RealEstateAIAgentSystem:
             status_counts[status] = status_counts.get(status, 0) + 1
         return status_counts
 
+    def _geocode_leads(self, batch: List[Dict]):
+        """Fill in latitude/longitude for sourced leads that came without them"""
+        missing = [
+            lead_data for lead_data in batch
+            if lead_data.get('latitude', lead_data.get('lat')) is None
+            or lead_data.get('longitude', lead_data.get('lon')) is None
+        ]
+        if not missing:
+            return
+
+        results = self.geocoder.geocode_batch([lead_data.get('address', '') for lead_data in missing])
+        for lead_data, result in zip(missing, results):
+            if result is not None:
+                lead_data['latitude'] = result.latitude
+                lead_data['longitude'] = result.longitude
+
+        located = sum(result is not None for result in results)
+        print(f"📍 Geocoded {located}/{len(missing)} addresses offline")
+
     def _calculate_avg_roi(self) -> float:
         """Calculate average ROI across all leads"""
-        rois = [
-            lead.roi_analysis.get('cap_rate', 0)
-            for lead in self.leads_pipeline
-            if lead.roi_analysis and 'cap_rate' in lead.roi_analysis
-        ]
+        # Read the cap rate column instead of loading every spilled analysis
+        rois = [rate for rate in self.leads_pipeline.cap_rates if not math.isnan(rate)]
         return sum(rois) / len(rois) if rois else 0.0
 
 
@@ -185,9 +216,9 @@ async def main():
     # Query the knowledge base
     if processed_leads:
         print("\n🧠 Querying Knowledge Base...")
-        results = ai_system.query_knowledge_base("high ROI properties")
+        results = ai_system.query_knowledge_base("high ROI properties", limit=3)
 
-        for result in results[:3]:
+        for result in results:
             print(f"  - {result['address']}: ${result.get('estimated_value', 0):,.0f}")
 
     # Generate report
@@ -195,6 +226,11 @@ async def main():
     report = ai_system.generate_report()
     print(json.dumps(report, indent=2))
 
+    await ai_system.outreach_agent.aclose()
+    ai_system.knowledge_agent.close()
+    if ai_system.geocoder is not None:
+        ai_system.geocoder.close()
+
 
 if __name__ == "__main__":
     asyncio.run(main())
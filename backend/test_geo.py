@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Geocoding and geohash tests
+Offline gazetteer lookups and the memo cache, built from small temporary
+gazetteer files, and geohash cell aggregates for hot zones and map viewports
+"""
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from main import Lead, LeadStatus
+from agents.knowledge_manager import KnowledgeManager
+from utils.geocoder import Gazetteer, Geocoder, normalize_address
+from utils.geohash import (
+    GeoCellAggregates, cell_count, decode, decode_bbox, encode, encode_batch, viewport_precision
+)
+
+
+def _write(path: Path, text: str) -> str:
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def test_normalize_address():
+    """Test house number, street and ZIP extraction"""
+
+    print("\n" + "=" * 60)
+    print("Testing Address Normalization")
+    print("=" * 60)
+
+    assert normalize_address("123 Main Street, Brooklyn, NY 11201") == (123, "main st", "11201")
+    assert normalize_address("37-12 West 82nd Avenue Apt 4B, Queens, NY 11372-1234") == (3712, "w 82nd ave", "11372")
+    assert normalize_address("Saint Marks Place, New York") == (None, "st marks pl", None)
+    assert normalize_address("") == (None, '', None)
+    print("   ✅ Abbreviations, unit words and Queens numbers normalized")
+
+
+def test_gazetteer_lookup():
+    """Test range interpolation, parity, overlapping ranges and the ZIP fallback"""
+
+    print("\n" + "=" * 60)
+    print("Testing Gazetteer Lookups")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gazetteer = Gazetteer()
+        gazetteer.load_zip_centroids(_write(Path(tmp) / "zcta.txt", (
+            "GEOID\tALAND\tINTPTLAT   \tINTPTLONG\n"
+            "11201\t1\t40.6940\t-73.9903\n"
+        )))
+        gazetteer.load_address_ranges(_write(Path(tmp) / "ranges.csv", (
+            "street,zip,from_number,to_number,from_latitude,from_longitude,to_latitude,to_longitude\n"
+            "Main Street,11201,100,198,40.0,-73.0,40.1,-73.1\n"
+            "Main Street,11201,101,199,41.0,-74.0,41.1,-74.1\n"
+            "Court St,11201,0,1000,42.0,-75.0,43.0,-76.0\n"
+            "Court St,11201,10,20,44.0,-77.0,44.1,-77.1\n"
+        )))
+
+        even = gazetteer.lookup(*normalize_address("150 Main St, Brooklyn, NY 11201"))
+        assert even.match == 'range' and abs(even.latitude - 40.05102) < 1e-4
+        odd = gazetteer.lookup(*normalize_address("151 Main St, Brooklyn, NY 11201"))
+        assert abs(odd.latitude - 41.05102) < 1e-4
+
+        # 500 is past the short overlapping range but inside the long one before it
+        covered = gazetteer.lookup(*normalize_address("500 Court Street, Brooklyn, NY 11201"))
+        assert covered.match == 'range' and abs(covered.latitude - 42.5) < 1e-9
+
+        fallback = gazetteer.lookup(*normalize_address("900 Main St, Brooklyn, NY 11201"))
+        assert (fallback.match, fallback.latitude) == ('zip', 40.6940)
+        assert gazetteer.lookup(*normalize_address("1 Nowhere Rd, Albany, NY 12207")) is None
+        print("   ✅ Interpolated, overlapping and ZIP-centroid lookups")
+
+
+def test_gazetteer_overlap_matches_scan():
+    """Test bisection over many overlapping ranges against a linear scan"""
+
+    print("\n" + "=" * 60)
+    print("Testing Overlapping Range Search")
+    print("=" * 60)
+
+    rng = random.Random(7)
+    rows = []
+    for _ in range(400):
+        low = rng.randrange(0, 5000)
+        high = low + rng.choice((0, 2, 10, 50, 2000))
+        rows.append(f"Broadway,10001,{low},{high},1,1,2,2")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gazetteer = Gazetteer()
+        gazetteer.load_address_ranges(_write(Path(tmp) / "ranges.csv", (
+            "street,zip,from_number,to_number,from_latitude,from_longitude,to_latitude,to_longitude,parity\n"
+            + "\n".join(row + ",B" for row in rows) + "\n"
+        )))
+        spans = [tuple(map(int, row.split(',')[2:4])) for row in rows]
+
+        for number in range(0, 8000, 7):
+            result = gazetteer.lookup(number, "broadway", "10001")
+            covered = any(low <= number <= high for low, high in spans)
+            assert (result is not None) == covered, number
+        print("   ✅ Same coverage as a linear scan over 400 ranges")
+
+
+def test_geocoder_from_config_and_memo():
+    """Test that each gazetteer file loads on its own and results are memoized"""
+
+    print("\n" + "=" * 60)
+    print("Testing Geocoder Config and Memo Cache")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ranges_path = _write(Path(tmp) / "ranges.csv", (
+            "street,zip,from_number,to_number,from_latitude,from_longitude,to_latitude,to_longitude\n"
+            "Main St,11201,100,198,40.0,-73.0,40.1,-73.1\n"
+        ))
+        config = {
+            'zip_centroids_path': str(Path(tmp) / "missing.txt"),
+            'address_ranges_path': ranges_path,
+            'cache_path': str(Path(tmp) / "geocodes.db")
+        }
+
+        # The missing ZIP file must not keep the ranges from loading
+        geocoder = Geocoder.from_config(config)
+        assert geocoder is not None and len(geocoder.gazetteer) == 1
+
+        addresses = ["150 Main Street, Brooklyn, NY 11201", "150 Main St., Brooklyn, NY 11201", "1 Elm St, NY 10001"]
+        first = geocoder.geocode_batch(addresses)
+        assert first[0] == first[1] and first[0].match == 'range' and first[2] is None
+        assert geocoder.stats()['misses'] == 2
+        geocoder.close()
+
+        # A fresh process reuses the memoized results, misses included
+        geocoder = Geocoder.from_config(config)
+        assert geocoder.geocode_batch(addresses) == first
+        assert (geocoder.stats()['hits'], geocoder.stats()['misses']) == (2, 0)
+        geocoder.close()
+
+        assert Geocoder.from_config({'zip_centroids_path': str(Path(tmp) / "missing.txt")}) is None
+        assert Geocoder.from_config({}) is None
+        print("   ✅ Partial gazetteer loaded and memo reused across restarts")
+
+
+def _random_points(count: int, seed: int = 1):
+    """Deterministic points around New York, a few of them far away"""
+    rng = random.Random(seed)
+    points = [(40.5 + rng.random() * 0.4, -74.1 + rng.random() * 0.4) for _ in range(count)]
+    return points + [(-33.87, 151.21), (89.99, 179.99), (-90.0, -180.0)]
+
+
+def test_geohash_encoding():
+    """Test known geohashes, batch encoding, prefixes and that every cell contains its points"""
+
+    print("\n" + "=" * 60)
+    print("Testing Geohash Encoding")
+    print("=" * 60)
+
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode(42.6, -5.6, 5) == "ezs42"
+    latitude, longitude = decode("ezs42")
+    assert abs(latitude - 42.605) < 0.03 and abs(longitude + 5.603) < 0.03
+
+    points = _random_points(500)
+    latitudes, longitudes = zip(*points)
+    for precision in (1, 4, 7, 9):
+        codes = encode_batch(latitudes, longitudes, precision)
+        assert codes == [encode(lat, lon, precision) for lat, lon in points], precision
+        for (lat, lon), code in zip(points, codes):
+            south, west, north, east = decode_bbox(code)
+            assert south <= lat <= north and west <= lon <= east, (lat, lon, code)
+            # A coarser cell is a prefix of the finer one
+            assert encode(lat, lon, precision + 2).startswith(code)
+    assert encode_batch([], [], 7) == []
+    print(f"   ✅ {len(points)} points encoded consistently at four precisions")
+
+
+def test_geo_cell_aggregates():
+    """Test batched aggregation, hot-zone ordering and viewports against a brute-force scan"""
+
+    print("\n" + "=" * 60)
+    print("Testing Geohash Cell Aggregates")
+    print("=" * 60)
+
+    rng = random.Random(2)
+    points = _random_points(2000, seed=2)
+    values = [rng.choice([None, rng.randint(200, 900) * 1000]) for _ in points]
+    cap_rates = [rng.choice([None, round(rng.uniform(3, 10), 2)]) for _ in points]
+
+    single = GeoCellAggregates()
+    for (lat, lon), value, cap_rate in zip(points, values, cap_rates):
+        single.add(lat, lon, value, cap_rate)
+    batched = GeoCellAggregates()
+    batched.add_batch([p[0] for p in points], [p[1] for p in points], values, cap_rates)
+    assert len(single) == len(batched) == len(points)
+    for precision in single.precisions:
+        assert single.cells[precision].keys() == batched.cells[precision].keys()
+        for cell, stats in single.cells[precision].items():
+            assert all(abs(a - b) < 1e-6 for a, b in zip(stats, batched.cells[precision][cell])), cell
+
+    # Hot zones: best mean cap rate first, small cells left out
+    zones = single.hot_zones(5, limit=1000, min_leads=3)
+    assert zones and all(zone['lead_count'] >= 3 for zone in zones)
+    assert all(a['avg_cap_rate'] >= b['avg_cap_rate'] for a, b in zip(zones, zones[1:]))
+    expected = sum(1 for stats in single.cells[5].values() if stats[0] >= 3 and stats[3])
+    assert len(zones) == expected and single.hot_zones(5, limit=4) == single.hot_zones(5, limit=1000)[:4]
+
+    # Viewports small enough to probe cells and large enough to filter them
+    boxes = [(40.6, -74.0, 40.7, -73.9), (40.70001, -73.95, 40.70002, -73.94999), (40.0, -75.0, 41.0, -73.0)]
+    for _ in range(20):
+        south, north = sorted(rng.uniform(40.5, 40.9) for _ in range(2))
+        west, east = sorted(rng.uniform(-74.1, -73.7) for _ in range(2))
+        boxes.append((south, west, north, east))
+    for south, west, north, east in boxes:
+        for precision in (4, 6, 7):
+            expected = sorted(
+                cell for cell in single.cells[precision]
+                if GeoCellAggregates._intersects(decode_bbox(cell), south, west, north, east)
+            )
+            found = single.viewport(south, west, north, east, precision)
+            assert [zone['zone'] for zone in found] == expected, (south, west, north, east, precision)
+
+    # The finest precision that still fits the cell budget
+    box = (40.6, -74.0, 40.7, -73.9)
+    chosen = viewport_precision(*box, precisions=(4, 5, 6, 7), max_cells=256)
+    assert cell_count(*box, chosen) <= 256 and (chosen == 7 or cell_count(*box, chosen + 1) > 256)
+    assert viewport_precision(-90, -180, 90, 180, (4, 5, 6, 7), max_cells=16) == 4
+    print(f"   ✅ {len(points):,} leads aggregated; {len(boxes)} viewports matched a scan")
+
+
+def test_hot_zones_memory_and_store():
+    """Test that the in-memory and SQLite backends report the same geohash zones"""
+
+    print("\n" + "=" * 60)
+    print("Testing Geohash Hot Zones")
+    print("=" * 60)
+
+    rng = random.Random(4)
+    leads = [
+        Lead(
+            address=f"{i} Main St, Brooklyn, NY 11201",
+            owner=f"Owner {i % 50}",
+            status=LeadStatus.NEW,
+            estimated_value=rng.randint(200, 900) * 1000,
+            roi_analysis={'cap_rate': round(rng.uniform(3, 10), 2)},
+            latitude=40.6 + rng.random() * 0.1 if i % 10 else None,
+            longitude=-74.0 + rng.random() * 0.1
+        )
+        for i in range(800)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'hot_zone_precision': 5, 'hot_zone_min_leads': 2}
+        memory = KnowledgeManager(config)
+        # Nothing geocoded yet: hot zones fall back to the address text
+        memory.add_leads([lead for lead in leads if lead.latitude is None][:5])
+        assert [zone['zone'] for zone in memory._identify_hot_zones()] == ["NY 11201"]
+
+        memory = KnowledgeManager(config)
+        stored = KnowledgeManager({**config, 'db_path': str(Path(tmp) / "k.db")})
+        for km in (memory, stored):
+            km.add_leads(leads)
+
+        geocoded = [lead for lead in leads if lead.latitude is not None]
+        assert len(memory.geo_cells) == stored.store.geocoded_count() == len(geocoded)
+        for precision in (5, 6):
+            a, b = memory.hot_zones(precision, limit=20), stored.hot_zones(precision, limit=20)
+            assert [zone['zone'] for zone in a] == [zone['zone'] for zone in b]
+            assert all(abs(x['avg_cap_rate'] - y['avg_cap_rate']) < 1e-9 for x, y in zip(a, b))
+        assert memory._identify_hot_zones() == memory.hot_zones()
+        assert all(len(zone['zone']) == 5 for zone in stored._identify_hot_zones())
+
+        for box in [(40.62, -73.98, 40.65, -73.95), (40.0, -75.0, 41.0, -73.0), (41.0, -73.0, 41.1, -72.9)]:
+            a, b = memory.zones_in_viewport(*box), stored.zones_in_viewport(*box)
+            assert [(z['zone'], z['lead_count']) for z in a] == [(z['zone'], z['lead_count']) for z in b], box
+            assert sum(zone['lead_count'] for zone in a) <= len(geocoded)
+        assert memory.zones_in_viewport(41.0, -73.0, 41.1, -72.9) == []
+
+        stored.close()
+        # A fresh process sees the same cells from disk
+        reopened = KnowledgeManager({**config, 'db_path': str(Path(tmp) / "k.db")})
+        assert [z['zone'] for z in reopened.hot_zones(limit=20)] == [z['zone'] for z in memory.hot_zones(limit=20)]
+        reopened.close()
+        memory.close()
+    print(f"   ✅ {len(geocoded)} geocoded leads gave matching zones in memory and on disk")
+
+
+if __name__ == "__main__":
+    test_normalize_address()
+    test_gazetteer_lookup()
+    test_gazetteer_overlap_matches_scan()
+    test_geocoder_from_config_and_memo()
+    test_geohash_encoding()
+    test_geo_cell_aggregates()
+    test_hot_zones_memory_and_store()
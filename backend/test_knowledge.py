@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Knowledge base tests
+Ranking, relationships, insights and caching of the Knowledge Manager, in
+memory and with the SQLite store, on generated leads
+"""
+import random
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from main import Lead, LeadStatus
+from agents.knowledge_manager import KnowledgeManager
+from utils.knowledge_store import search_texts
+from utils.lead_columns import LeadColumns
+from utils.text import tokenize
+
+STREETS = ['Atlantic Ave', 'Main St', 'Broadway', 'Ocean Pkwy', 'Grand Concourse', 'Court St', 'Jamaica Ave']
+AREAS = ['Brooklyn, NY 11201', 'Bronx, NY 10451', 'Queens, NY 11372', 'Manhattan, NY 10001']
+OWNERS = ['John Smith', 'Maria Garcia', 'Wei Chen', 'Ann Lee', 'Tom Brown']
+
+
+def _sample_leads(count: int, seed: int = 1):
+    """Deterministic leads spread over a few streets, areas and owners"""
+    rng = random.Random(seed)
+    return [
+        Lead(
+            address=f"{i} {rng.choice(STREETS)}, {rng.choice(AREAS)}",
+            owner=rng.choice(OWNERS),
+            status=LeadStatus.NEW,
+            estimated_value=rng.randint(200, 900) * 1000,
+            roi_analysis={'cap_rate': round(rng.uniform(3, 10), 2), 'recommendation': 'Hold'}
+        )
+        for i in range(count)
+    ]
+
+
+def _scan_matches(km: KnowledgeManager, leads, query: str):
+    """Addresses of the leads sharing a token with the query, by a linear scan"""
+    keywords = set(tokenize(query.lower()))
+    return {
+        lead.address for lead in leads
+        if keywords & set(tokenize(' '.join(search_texts(
+            lead.address, lead.owner, km._generate_tags(lead), lead.source, lead.estimated_value, lead.roi_analysis
+        ))))
+    }
+
+
+def test_inverted_index_matches_scan():
+    """Test that indexed queries find exactly the leads a linear scan finds, as leads keep arriving"""
+
+    print("\n" + "=" * 60)
+    print("Testing Inverted Index")
+    print("=" * 60)
+
+    leads = _sample_leads(600)
+    queries = ["Atlantic", "wei chen", "Court St Bronx", "premium", "11372 hold", "Garcia-Smith", "zzz"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = KnowledgeManager({})
+        stored = KnowledgeManager({'db_path': str(Path(tmp) / "k.db")})
+        for added in (300, 600):
+            for km in (memory, stored):
+                km.add_leads(leads[added - 300:added])
+            for query in queries:
+                expected = _scan_matches(memory, leads[:added], query)
+                for km in (memory, stored):
+                    assert {r['address'] for r in km.query(query, limit=added)} == expected, (query, added)
+        assert memory.query("") == [] and memory.query("  !! ") == []
+        memory.close()
+        stored.close()
+    print(f"   ✅ {len(queries)} queries matched a linear scan at 300 and 600 leads")
+
+
+def test_related_leads_match_scan():
+    """Test owner and area relationships against a scan, with limits and addresses without a ZIP"""
+
+    print("\n" + "=" * 60)
+    print("Testing Relationship Indexes")
+    print("=" * 60)
+
+    rng = random.Random(5)
+    leads = _sample_leads(300)
+    for i, lead in enumerate(leads):
+        lead.owner = f"Owner {rng.randrange(40)}"
+        if i % 10 == 0:
+            lead.address = f"{i} Main St, Brooklyn"
+        elif i % 10 == 1:
+            lead.address = f"{i} Main St"
+
+    def scan(entry_id, limit):
+        lead = leads[entry_id]
+        area = KnowledgeManager._area_key(lead.address)
+        related = [f"same_owner:{other.address}" for j, other in enumerate(leads)
+                   if j != entry_id and other.owner == lead.owner]
+        if area:
+            related += [f"same_area:{other.address}" for j, other in enumerate(leads)
+                        if j != entry_id and KnowledgeManager._area_key(other.address) == area]
+        return related[:limit]
+
+    assert KnowledgeManager._area_key("3 Main St, Brooklyn, NY 11201") == "11201"
+    assert KnowledgeManager._area_key("3 Main St, Brooklyn") == "brooklyn"
+    assert KnowledgeManager._area_key("3 Main St") == ""
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = KnowledgeManager({'max_related_leads': 12})
+        stored = KnowledgeManager({'max_related_leads': 12, 'db_path': str(Path(tmp) / "k.db")})
+        for km in (memory, stored):
+            km.add_leads(leads)
+            for entry_id in range(len(leads)):
+                assert km.get_related_leads(entry_id) == scan(entry_id, 12), entry_id
+                assert km.get_related_leads(entry_id, limit=3) == scan(entry_id, 3)
+            assert km.get_related_leads(1, limit=500) == scan(1, 500)
+            assert km.query("Owner 7", limit=1)[0]['related_leads'][0].startswith("same_owner:")
+        memory.close()
+        stored.close()
+    print(f"   ✅ Relationships of {len(leads)} leads matched a scan, in memory and in SQLite")
+
+
+def test_store_persists_across_restarts():
+    """Test that a reopened store answers like before and keeps numbering new leads"""
+
+    print("\n" + "=" * 60)
+    print("Testing Persistent Knowledge Store")
+    print("=" * 60)
+
+    leads = _sample_leads(500)
+    queries = ["Atlantic", "maria garcia", "premium Queens", "high roi"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'db_path': str(Path(tmp) / "knowledge.db"), 'commit_interval': 64}
+        km = KnowledgeManager(config)
+        km.add_leads(leads[:400])
+        before = {query: km.query(query) for query in queries}
+        insights = km.get_insights()
+        km.close()
+
+        km = KnowledgeManager(config)
+        assert len(km.store) == 400
+        assert {query: km.query(query) for query in queries} == before
+        assert km.get_insights() == insights
+
+        km.add_leads(leads[400:])
+        memory = KnowledgeManager({})
+        memory.add_leads(leads)
+        # Stored records come back as the in-memory table returns them
+        for entry_id in (0, 399, 400, 499):
+            assert km._result(entry_id, 1.0) == memory._result(entry_id, 1.0)
+        assert km.get_insights() == memory.get_insights()
+        newest = km.query(leads[499].address.split(',')[0], limit=1)[0]
+        assert newest['address'] == leads[499].address
+        km.close()
+        memory.close()
+    print("   ✅ Same answers after a restart; new leads continued the numbering")
+
+
+def test_store_shared_between_managers():
+    """Test that a second manager opens a store another one is writing to, and that lock errors surface"""
+
+    print("\n" + "=" * 60)
+    print("Testing Shared Knowledge Store")
+    print("=" * 60)
+
+    leads = _sample_leads(3)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = {'db_path': str(Path(tmp) / "knowledge.db"), 'busy_timeout': 0.2}
+        first = KnowledgeManager(config)
+        first.add_lead(leads[0])
+        # A batch in progress holds a write transaction
+        first._add_lead(leads[1])
+
+        second = KnowledgeManager(config)
+        assert second.store is not None and len(second.store) == 1
+        assert [r['address'] for r in second.query(leads[0].address)][:1] == [leads[0].address]
+        second.close()
+        first.close()
+
+        # A store that cannot be created is an error, not a silently empty in-memory KB
+        locked_path = str(Path(tmp) / "locked.db")
+        holder = sqlite3.connect(locked_path)
+        holder.execute("BEGIN IMMEDIATE")
+        try:
+            KnowledgeManager({'db_path': locked_path, 'busy_timeout': 0.2})
+            raise AssertionError("opened a locked store")
+        except sqlite3.OperationalError as e:
+            assert 'locked' in str(e)
+        holder.rollback()
+        holder.close()
+    print("   ✅ Second manager read the committed leads; lock errors were raised")
+
+
+def _scan_insights(leads):
+    """Hot zones, owner patterns and market trends recomputed from every lead"""
+    zones, owners = {}, {}
+    for lead in leads:
+        owners[lead.owner] = owners.get(lead.owner, 0) + 1
+        if not lead.address:
+            continue
+        parts = lead.address.split(',')
+        zone = zones.setdefault(parts[-1].strip() if len(parts) > 1 else "Unknown", [0, 0, []])
+        zone[0] += 1
+        zone[1] += lead.estimated_value or 0
+        if lead.roi_analysis and 'cap_rate' in lead.roi_analysis:
+            zone[2].append(lead.roi_analysis['cap_rate'])
+
+    hot_zones = sorted((
+        {'zone': name, 'lead_count': count, 'avg_cap_rate': sum(caps) / len(caps), 'total_value': value}
+        for name, (count, value, caps) in zones.items() if caps
+    ), key=lambda zone: zone['avg_cap_rate'], reverse=True)[:5]
+
+    analyzed = [lead.roi_analysis.get('cap_rate', 0) for lead in leads if lead.roi_analysis]
+    avg_cap_rate = sum(analyzed) / len(analyzed) if analyzed else 0
+    return {
+        'hot_zones': hot_zones,
+        'owner_patterns': {
+            'total_unique_owners': len(owners),
+            'multi_property_owners': {owner: count for owner, count in owners.items() if count > 1}
+        },
+        'market_trends': {
+            'total_leads': len(leads),
+            'avg_property_value': sum(lead.estimated_value or 0 for lead in leads) / len(leads),
+            'avg_cap_rate': avg_cap_rate,
+            'market_sentiment': 'bullish' if avg_cap_rate > 7 else 'neutral' if avg_cap_rate > 5 else 'bearish'
+        }
+    }
+
+
+def _assert_close(actual, expected, path="insights"):
+    """Equal, with floats compared to a relative 1e-9"""
+    if isinstance(expected, float):
+        assert abs(actual - expected) <= 1e-9 * max(1.0, abs(expected)), (path, actual, expected)
+    elif isinstance(expected, dict):
+        assert actual.keys() == expected.keys(), (path, actual.keys(), expected.keys())
+        for key in expected:
+            _assert_close(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, list):
+        assert len(actual) == len(expected), (path, actual, expected)
+        for i, (a, e) in enumerate(zip(actual, expected)):
+            _assert_close(a, e, f"{path}[{i}]")
+    else:
+        assert actual == expected, (path, actual, expected)
+
+
+def test_insights_match_scan():
+    """Test that running aggregates give the insights a full recomputation gives, after every batch"""
+
+    print("\n" + "=" * 60)
+    print("Testing Incremental Insights")
+    print("=" * 60)
+
+    rng = random.Random(9)
+    leads = _sample_leads(450, seed=4)
+    for i, lead in enumerate(leads):
+        lead.owner = f"Owner {rng.randrange(300)}"
+        if i % 7 == 0:
+            lead.roi_analysis = None
+        elif i % 11 == 0:
+            lead.roi_analysis = {'recommendation': 'Hold'}
+        if i % 13 == 0:
+            lead.estimated_value = None
+        if i % 17 == 0:
+            lead.address = f"{i} Main St"
+    # Later leads raise one zone's cap rate, so the ranking changes as they arrive
+    for lead in leads[300:]:
+        if lead.roi_analysis and 'cap_rate' in lead.roi_analysis and 'Bronx' in lead.address:
+            lead.roi_analysis['cap_rate'] += 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = KnowledgeManager({})
+        stored = KnowledgeManager({'db_path': str(Path(tmp) / "k.db")})
+        assert memory.get_insights()['market_trends'] == {} == stored.get_insights()['market_trends']
+
+        rankings = set()
+        for start in range(0, len(leads), 150):
+            expected = _scan_insights(leads[:start + 150])
+            rankings.add(tuple(zone['zone'] for zone in expected['hot_zones']))
+            for km in (memory, stored):
+                km.add_leads(leads[start:start + 150])
+                insights = km.get_insights()
+                del insights['successful_outreach_templates']
+                _assert_close(insights, expected)
+        assert len(rankings) > 1
+        memory.close()
+        stored.close()
+    print(f"   ✅ Insights matched a recomputation over {len(leads)} leads in three batches")
+
+
+def test_bm25_ranking():
+    """Test field weights, rarity, the high-ROI boost and that top-k equals the head of the full ranking"""
+
+    print("\n" + "=" * 60)
+    print("Testing BM25 Ranking")
+    print("=" * 60)
+
+    small = [
+        Lead(address="1 Garcia Pl, Bronx, NY 10451", owner="Tom Brown", status=LeadStatus.NEW, estimated_value=400000),
+        Lead(address="2 Main St, Bronx, NY 10451", owner="Maria Garcia", status=LeadStatus.NEW, estimated_value=400000)
+    ] + [
+        Lead(address=f"{i} Court St, Queens, NY 11372", owner="Ann Lee", status=LeadStatus.NEW, estimated_value=400000)
+        for i in range(3, 20)
+    ]
+    leads = _sample_leads(500, seed=2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ("memory", "store"):
+            def config(db_name):
+                return {'db_path': str(Path(tmp) / db_name)} if name == "store" else {}
+
+            # A match in the address outweighs one in the owner until owners are weighted up
+            for weights, first in (({}, "1 Garcia Pl"), ({'owner': 5.0}, "2 Main St")):
+                km = KnowledgeManager({**config(f"small-{len(weights)}.db"), 'field_weights': weights})
+                km.add_leads(small)
+                assert km.query("garcia")[0]['address'].startswith(first), (name, weights)
+                # A rare word outranks a common one
+                assert km.query("court garcia", limit=19)[0]['address'].startswith(first)
+                km.close()
+
+            km = KnowledgeManager(config("k.db"))
+            km.add_leads(leads)
+            for query in ("Atlantic Ave Brooklyn", "wei chen", "premium hold", "high roi", "high roi queens"):
+                full = km.query(query, limit=len(leads))
+                confidences = [r['confidence'] for r in full]
+                assert confidences == sorted(confidences, reverse=True) and 0 < confidences[-1] <= confidences[0] <= 1
+                for k in (1, 3, 10):
+                    assert km.query(query, limit=k) == full[:k], (name, query, k)
+
+            high_roi = [lead.address for lead in leads if lead.roi_analysis['cap_rate'] >= 7]
+            top = km.query("high roi", limit=len(high_roi))
+            assert {r['address'] for r in top} == set(high_roi)
+            assert all(r['cap_rate'] >= 7 and 'Queens' in r['address'] for r in km.query("high roi queens", limit=5))
+            km.close()
+    print("   ✅ Weighted, boosted and top-k rankings in memory and SQLite")
+
+
+def test_query_cache():
+    """Test cache hits for repeated queries, invalidation by new leads, LRU eviction and result copies"""
+
+    print("\n" + "=" * 60)
+    print("Testing Query Result Cache")
+    print("=" * 60)
+
+    leads = _sample_leads(200)
+    km = KnowledgeManager({'query_cache_size': 2})
+    km.add_leads(leads[:199])
+
+    first = km.query("Atlantic Ave", limit=5)
+    # Case and spacing differences share the entry; another limit does not
+    assert km.query("  atlantic   AVE ", limit=5) == first
+    assert km.query("Atlantic Ave", limit=6)[:5] == first
+    assert (km.cache_stats()['hits'], km.cache_stats()['misses']) == (1, 2)
+
+    # Callers may edit what they get back
+    first[0]['related_leads'].append("edited")
+    first[0]['address'] = "edited"
+    assert km.query("Atlantic Ave", limit=5)[0]['address'] != "edited"
+    assert "edited" not in km.query("Atlantic Ave", limit=5)[0]['related_leads']
+
+    # A new lead makes every cached result stale
+    generation = km.generation
+    km.add_lead(leads[199])
+    assert km.generation == generation + 1
+    misses = km.cache_stats()['misses']
+    after = km.query(leads[199].address.split(',')[0], limit=1)
+    assert after[0]['address'] == leads[199].address and km.cache_stats()['misses'] == misses + 1
+    km.query("Atlantic Ave", limit=5)
+    assert km.cache_stats()['misses'] == misses + 2
+
+    # Least recently used entries go first
+    km.query("broadway")
+    km.query("Atlantic Ave", limit=5)
+    km.query("court")
+    stats = km.cache_stats()
+    km.query("Atlantic Ave", limit=5)
+    km.query("broadway")
+    assert km.cache_stats()['hits'] == stats['hits'] + 1 and km.cache_stats()['entries'] == 2
+    assert 0 < km.cache_stats()['hit_rate'] < 1
+    km.close()
+
+    uncached = KnowledgeManager({'query_cache_size': 0})
+    uncached.add_leads(leads)
+    uncached.query("Atlantic Ave")
+    uncached.query("Atlantic Ave")
+    assert uncached.cache_stats()['hits'] == 0 and uncached.cache_stats()['entries'] == 0
+    uncached.close()
+    print("   ✅ Repeats served from the cache until a new lead arrived")
+
+
+def test_semantic_fallback_threshold():
+    """Test that misspellings find leads through embeddings while nonsense finds none"""
+
+    print("\n" + "=" * 60)
+    print("Testing Semantic Search Fallback")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = KnowledgeManager({'semantic_search': True, 'query_cache_size': 0})
+        stored = KnowledgeManager({'semantic_search': True, 'query_cache_size': 0, 'db_path': str(Path(tmp) / "k.db")})
+        for km in (memory, stored):
+            km.add_leads(_sample_leads(300))
+
+        # Keyword search finds nothing for these; the fallback must not invent matches
+        for query in ("zzzqqq", "Staten Island"):
+            assert memory.query(query) == [] and stored.query(query) == []
+
+        results = memory.query("Jamaca", limit=3)
+        assert results and all('Jamaica Ave' in r['address'] for r in results)
+        assert all(r['confidence'] >= memory.semantic_min_similarity for r in results)
+
+        # Streaming the stored vectors ranks exactly like the in-memory matrix
+        assert stored.semantic_query("Atlantc Avenue", 5) == memory.semantic_query("Atlantc Avenue", 5)
+        memory.close()
+        stored.close()
+        print(f"   ✅ Misspelling matched {len(results)} leads, nonsense matched none")
+
+    km = KnowledgeManager({})
+    assert km.semantic_search is False
+    km.close()
+    print("   ✅ Semantic search is off unless configured")
+
+
+def test_lead_columns_round_trip():
+    """Test that the columnar table returns what was stored, past 65,535 distinct sources"""
+
+    print("\n" + "=" * 60)
+    print("Testing Columnar Lead Table")
+    print("=" * 60)
+
+    columns = LeadColumns()
+    leads = _sample_leads(3)
+    leads[1].roi_analysis = None
+    leads[2].timestamp = "2024-05-01T09:30:00+02:00"
+    for lead in leads:
+        columns.append(lead, tags=['New', 'premium'])
+
+    for lead, record in zip(leads, columns):
+        assert (record.address, record.owner, record.status) == (lead.address, lead.owner, lead.status)
+        assert (record.estimated_value, record.roi_analysis, record.timestamp) == \
+            (lead.estimated_value, lead.roi_analysis, lead.timestamp)
+        assert record.tags == ['New', 'premium']
+    assert columns[1].cap_rate is None and columns[0].cap_rate == leads[0].roi_analysis['cap_rate']
+
+    # Interned codes start at 16 bits and widen instead of overflowing
+    for i in range(70000):
+        columns.append(Lead(address=f"{i} Main St", owner="Owner", status=LeadStatus.NEW, source=f"listing-{i}"))
+    assert columns.source_ids.typecode == 'I' and columns.status_ids.typecode == 'H'
+    assert columns[len(columns) - 1].source == "listing-69999" and columns[3].source == "listing-0"
+    assert columns[0].source is None
+    columns.close()
+    print(f"   ✅ {len(columns):,} leads round-tripped, source codes widened to 32 bits")
+
+
+def test_lead_columns_shared_spill_dir():
+    """Test that tables spilling to the same directory do not overwrite each other"""
+
+    print("\n" + "=" * 60)
+    print("Testing Shared Spill Directory")
+    print("=" * 60)
+
+    leads = _sample_leads(40)
+    with tempfile.TemporaryDirectory() as tmp:
+        spill_dir = str(Path(tmp) / "payloads")
+        first = KnowledgeManager({'spill_dir': spill_dir})
+        first.add_leads(leads[:20])
+        # A second instance (or process) configured the same way
+        second = KnowledgeManager({'spill_dir': spill_dir})
+        second.add_leads(leads[20:])
+
+        assert [record.roi_analysis for record in first.leads_db] == [lead.roi_analysis for lead in leads[:20]]
+        assert [record.roi_analysis for record in second.leads_db] == [lead.roi_analysis for lead in leads[20:]]
+        first.close()
+        second.close()
+    print("   ✅ Each table kept its own payloads")
+
+
+if __name__ == "__main__":
+    test_inverted_index_matches_scan()
+    test_related_leads_match_scan()
+    test_store_persists_across_restarts()
+    test_store_shared_between_managers()
+    test_insights_match_scan()
+    test_bm25_ranking()
+    test_query_cache()
+    test_semantic_fallback_threshold()
+    test_lead_columns_round_trip()
+    test_lead_columns_shared_spill_dir()
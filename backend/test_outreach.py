@@ -0,0 +1,554 @@
+#!/usr/bin/env python3
+"""
+Outreach and LLM client tests
+Template rendering, streaming, skeleton caching, batch mode, rate limiting and
+request coalescing, all without API keys (Claude is replaced by local stubs)
+"""
+import asyncio
+import itertools
+import json
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from email.utils import formatdate
+from pathlib import Path
+
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from agents.outreach_agent import OutreachAgent
+from utils.adaptive_limiter import AdaptiveConcurrencyLimiter, parse_retry_after, send_with_backoff
+from utils.single_flight import SingleFlight, normalize_prompt
+
+
+def _reference_message(agent: OutreachAgent, owner_name: str, address: str, roi_data: dict) -> str:
+    """The template message as it was built per lead before templates were precompiled"""
+    address_parts = address.split(',')
+    street = address_parts[0].strip() if address_parts else address
+    neighborhood = address_parts[-1].strip() if len(address_parts) > 1 else "the area"
+
+    return f"""Hi {owner_name},
+
+I hope this message finds you well. My name is Alex Rodriguez, and I was researching properties in {neighborhood} when I came across your property at {street}.
+
+{agent._personalize_content(roi_data)}
+
+{agent._select_template(roi_data)['body']}
+
+{agent._add_value_proposition(roi_data)}
+
+Would you be open to a brief conversation about your plans for the property? I'm happy to share more detailed market analysis specific to your neighborhood.
+
+Best regards,
+Alex Rodriguez
+Real Estate Investment Specialist
+Phone: (555) 123-4567
+Email: alex.rodriguez@realestateinvest.com
+"""
+
+
+def test_template_messages():
+    """Test that precompiled template messages match per-lead rendering on every branch"""
+
+    print("\n" + "=" * 60)
+    print("Testing Template Messages")
+    print("=" * 60)
+
+    agent = OutreachAgent({})
+    addresses = ["12 Main St, Brooklyn, NY 11201", "7 Grand Concourse", "3 Court St, Brooklyn"]
+    cap_rates = [3, 7, 7.5, 8, 9, 10, 12]
+    risk_scores = [1, 3, 6]
+    recommendations = ["Strong Buy - Excellent ROI potential", "Buy - Good investment opportunity",
+                       "Hold - Consider other factors", ""]
+
+    leads = [
+        (f"Owner {i}", address, {'cap_rate': cap_rate, 'risk_score': risk, 'recommendation': recommendation})
+        for i, (address, cap_rate, risk, recommendation)
+        in enumerate(itertools.product(addresses, cap_rates, risk_scores, recommendations))
+    ]
+    leads.append(("Ann Lee", "1 Ocean Pkwy, Brooklyn, NY", {}))
+
+    expected = [_reference_message(agent, *lead) for lead in leads]
+    assert [agent._template_based_message(*lead) for lead in leads] == expected
+    assert agent.create_template_messages(iter(leads)) == expected
+    # One compiled body per distinct template choice, not per lead
+    assert len(agent._compiled_bodies) <= 4 * 2 * 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = Path(tmp) / "messages.jsonl"
+        assert agent.create_template_messages(leads, output_path=str(output_path)) == len(leads)
+        rows = [json.loads(line) for line in output_path.read_text(encoding='utf-8').splitlines()]
+        assert [(row['owner'], row['address'], row['message']) for row in rows] == \
+            [(owner, address, message) for (owner, address, _), message in zip(leads, expected)]
+    print(f"   ✅ {len(leads)} messages matched, {len(agent._compiled_bodies)} bodies compiled")
+
+
+class StubClaudeHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for Claude's Messages endpoint, streaming events as they are produced"""
+    chunks = []
+    status = 200
+    delay = 0.0
+    requests = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(payload)
+
+        if self.status != 200 or not payload.get("stream"):
+            body = json.dumps({"error": {"type": "invalid_request_error"}} if self.status != 200 else
+                              {"content": [{"type": "text", "text": "".join(self.chunks)}]}).encode()
+            self.send_response(self.status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        # No Content-Length: the stream ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        events = [{"type": "message_start"}]
+        events += [{"type": "content_block_delta", "delta": {"type": "text_delta", "text": c}} for c in self.chunks]
+        events.append({"type": "message_stop"})
+        for event in events:
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.delay)
+
+
+def _stub_claude(chunks, status=200, delay=0.0) -> ThreadingHTTPServer:
+    StubClaudeHandler.chunks, StubClaudeHandler.status, StubClaudeHandler.delay = chunks, status, delay
+    StubClaudeHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubClaudeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_streaming_messages():
+    """Test that streamed chunks arrive before the message ends and add up to the full message"""
+
+    print("\n" + "=" * 60)
+    print("Testing Streaming Messages (local stub server)")
+    print("=" * 60)
+
+    lead = ("Ann Lee", "12 Main St, Brooklyn, NY 11201", {'cap_rate': 6.5, 'recommendation': "Hold"})
+
+    async def run(server):
+        agent = OutreachAgent({'api_key': 'stub-key', 'base_url': f"http://127.0.0.1:{server.server_port}"})
+        start = time.monotonic()
+        chunks, first_chunk_at = [], None
+        async for chunk in agent.stream_message(*lead):
+            first_chunk_at = first_chunk_at or time.monotonic() - start
+            chunks.append(chunk)
+        total = time.monotonic() - start
+        whole = await agent.create_message(*lead)
+        await agent.aclose()
+        return chunks, first_chunk_at, total, whole
+
+    server = _stub_claude(["\n Dear Ann,", " your home on Main St", " stood out."], delay=0.15)
+    try:
+        chunks, first_chunk_at, total, whole = asyncio.run(run(server))
+    finally:
+        server.shutdown()
+
+    # Leading whitespace is stripped like the non-streaming message
+    assert chunks == ["Dear Ann,", " your home on Main St", " stood out."]
+    assert "".join(chunks) == whole == "Dear Ann, your home on Main St stood out."
+    assert first_chunk_at < total / 2
+    assert StubClaudeHandler.requests[0]["stream"] is True and "stream" not in StubClaudeHandler.requests[1]
+    print(f"   ✅ First chunk after {first_chunk_at * 1000:.0f} ms of a {total * 1000:.0f} ms stream")
+
+    # A request rejected before any text falls back to the template message
+    server = _stub_claude([], status=400)
+    try:
+        chunks = asyncio.run(run(server))[0]
+    finally:
+        server.shutdown()
+    assert chunks == [OutreachAgent({})._template_based_message(*lead)]
+    print("   ✅ Rejected stream fell back to one template chunk")
+
+
+def test_streaming_skeleton_cache():
+    """Test that placeholders split across chunks are filled and the skeleton is reused"""
+
+    print("\n" + "=" * 60)
+    print("Testing Streamed Skeleton Caching (local stub server)")
+    print("=" * 60)
+
+    roi_data = {'cap_rate': 6.5, 'recommendation': "Hold"}
+
+    async def run(server, cache_path):
+        agent = OutreachAgent({
+            'api_key': 'stub-key',
+            'base_url': f"http://127.0.0.1:{server.server_port}",
+            'message_cache_path': cache_path
+        })
+        first = [c async for c in agent.stream_message("Ann Lee", "12 Main St, Brooklyn, NY 11201", roi_data)]
+        second = [c async for c in agent.stream_message("Wei Chen", "7 Court St, Brooklyn, NY 11201", roi_data)]
+        await agent.aclose()
+        return first, second
+
+    server = _stub_claude(["Dear {", "{owner_name}}, I saw {{str", "eet}} in Brooklyn."])
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = asyncio.run(run(server, str(Path(tmp) / "skeletons.db")))
+    finally:
+        server.shutdown()
+
+    assert "".join(first) == "Dear Ann Lee, I saw 12 Main St in Brooklyn."
+    assert not any('{' in chunk for chunk in first)
+    # Same area, recommendation and cap-rate band: served from the cache in one chunk
+    assert second == ["Dear Wei Chen, I saw 7 Court St in Brooklyn."]
+    assert len(StubClaudeHandler.requests) == 1
+    print(f"   ✅ Filled placeholders across {len(first)} chunks, second lead served from the cache")
+
+
+class StubBatchHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for Claude's Message Batches endpoints"""
+    batches = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200, jsonl=False):
+        body = ("\n".join(json.dumps(p) for p in payload) if jsonl else json.dumps(payload)).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        batch_id = f"msgbatch_{len(self.batches) + 1}"
+        # By default the last request errors so the template fallback gets exercised
+        result_types = ["succeeded"] * (len(payload["requests"]) - 1) + ["errored"]
+        self.batches[batch_id] = {"requests": payload["requests"], "polls": 0, "result_types": result_types}
+        self._send_json({"id": batch_id, "processing_status": "in_progress"})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        batch = self.batches.get(parts[3]) if len(parts) > 3 else None
+        if batch is None or batch.get("deleted"):
+            return self._send_json({"error": "not found"}, status=404)
+
+        if parts[-1] == "results":
+            return self._send_json([
+                {
+                    "custom_id": request["custom_id"],
+                    "result": {"type": "succeeded", "message": {"content": [{"type": "text", "text": f"Batch message {i}"}]}}
+                    if result_type == "succeeded" else {"type": result_type}
+                }
+                for i, (request, result_type) in enumerate(zip(batch["requests"], batch["result_types"]))
+            ], jsonl=True)
+
+        batch["polls"] += 1
+        status = batch.get("final_status", "ended") if batch["polls"] > 1 else "in_progress"
+        self._send_json({"id": parts[3], "processing_status": status})
+
+
+def _stub_batches() -> ThreadingHTTPServer:
+    StubBatchHandler.batches = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubBatchHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_batch_messages():
+    """Test Claude batch submission, resume and result mapping"""
+
+    print("\n" + "=" * 60)
+    print("Testing Outreach Batch Mode (local stub server)")
+    print("=" * 60)
+
+    leads = [(f"Owner {i}", f"{i} Main Street, Brooklyn, NY 11201", {'cap_rate': 6.5}) for i in range(3)]
+
+    async def run(config):
+        agent = OutreachAgent(config)
+        job_id = await agent.submit_batch(leads)
+        await agent.aclose()
+
+        # A fresh agent picks the job up from the persisted state
+        resumed_agent = OutreachAgent(config)
+        results = await resumed_agent.resume_batches(poll_interval=0.01)
+        assert not resumed_agent._load_batch_state()
+        await resumed_agent.aclose()
+        return job_id, results
+
+    server = _stub_batches()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            job_id, results = asyncio.run(run({
+                'api_key': 'stub-key',
+                'base_url': f"http://127.0.0.1:{server.server_port}",
+                'batch_state_path': str(Path(tmp) / "batches.json")
+            }))
+    finally:
+        server.shutdown()
+
+    messages = results[job_id]
+    assert messages[:2] == ["Batch message 0", "Batch message 1"]
+    assert messages[2].startswith("Hi Owner 2")
+    print(f"   ✅ Resumed and collected {len(messages)} messages (1 template fallback)")
+
+
+def test_batch_messages_unfinished():
+    """Test canceled and expired requests, missing jobs and jobs that never end"""
+
+    print("\n" + "=" * 60)
+    print("Testing Outreach Batch Mode Exits (local stub server)")
+    print("=" * 60)
+
+    leads = [(f"Owner {i}", f"{i} Main Street, Brooklyn, NY 11201", {'cap_rate': 6.5}) for i in range(3)]
+
+    async def run(config):
+        agent = OutreachAgent(config)
+
+        # Canceled and expired batches still end; their unfinished requests get templates
+        job_id = await agent.submit_batch(leads)
+        StubBatchHandler.batches[job_id]["result_types"] = ["succeeded", "canceled", "expired"]
+        messages = await agent.wait_for_batch(job_id, poll_interval=0.01)
+        assert messages[0] == "Batch message 0"
+        assert [message.split(',')[0] for message in messages[1:]] == ["Hi Owner 1", "Hi Owner 2"]
+        assert job_id not in agent._load_batch_state()
+
+        # A job the server no longer knows fails every poll
+        job_id = await agent.submit_batch(leads[:1])
+        StubBatchHandler.batches[job_id]["deleted"] = True
+        assert await agent.wait_for_batch(job_id, poll_interval=0.01, max_poll_errors=3) is None
+
+        # Jobs that never end stop at the timeout
+        job_id = await agent.submit_batch(leads[:1])
+        StubBatchHandler.batches[job_id]["final_status"] = "canceling"
+        assert await agent.wait_for_batch(job_id, poll_interval=0.01, timeout=0.1) is None
+        assert job_id in agent._load_batch_state()
+        assert await agent.wait_for_batch("msgbatch_unknown", poll_interval=0.01) is None
+        await agent.aclose()
+
+    server = _stub_batches()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            asyncio.run(run({
+                'api_key': 'stub-key',
+                'base_url': f"http://127.0.0.1:{server.server_port}",
+                'batch_state_path': str(Path(tmp) / "batches.json")
+            }))
+    finally:
+        server.shutdown()
+    print("   ✅ Canceled and expired requests fell back to templates; missing and stuck jobs returned None")
+
+
+def test_adaptive_limiter():
+    """Test additive increase, one halving per wave of failures and Retry-After blocking"""
+
+    print("\n" + "=" * 60)
+    print("Testing Adaptive Concurrency Limiter")
+    print("=" * 60)
+
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, min_limit=1, max_limit=8)
+    for _ in range(4):
+        limiter.on_success()
+    assert 4.9 < limiter.limit < 5.0
+
+    # Requests started before a decrease do not shrink the limit again
+    wave_start = time.monotonic()
+    limiter.on_overload(wave_start)
+    limiter.on_overload(wave_start)
+    assert 2.4 < limiter.limit < 2.5
+    limiter.on_overload(time.monotonic())
+    limiter.on_overload(time.monotonic())
+    assert limiter.limit == 1
+
+    for _ in range(200):
+        limiter.on_success()
+    assert limiter.limit == 8 and limiter.stats()['overloads'] == 4
+
+    assert parse_retry_after("2.5") == 2.5 and parse_retry_after("-3") == 0.0
+    assert 55 < parse_retry_after(formatdate(time.time() + 60, usegmt=True)) <= 60
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+        running, peak = 0, 0
+
+        async def work():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*[work() for _ in range(10)])
+        assert peak == 2 and limiter.in_flight == 0
+
+        # Nothing starts until a Retry-After window has passed
+        limiter.on_overload(time.monotonic(), retry_after=0.1)
+        start = time.monotonic()
+        async with limiter.slot() as started_at:
+            assert started_at - start >= 0.09
+
+    asyncio.run(run())
+    print("   ✅ Limit rose by about one per window, halved once per wave and honored Retry-After")
+
+
+def test_send_with_backoff():
+    """Test retries on overload and timeouts, the deadline, and failing fast on refused connections and bad requests"""
+
+    print("\n" + "=" * 60)
+    print("Testing Send With Backoff")
+    print("=" * 60)
+
+    async def run():
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+        replies = [httpx.Response(529), httpx.Response(429, headers={'retry-after': '0.05'}),
+                   httpx.ReadTimeout("slow"), httpx.Response(200)]
+        timeouts = []
+
+        async def send(time_left):
+            timeouts.append(time_left)
+            reply = replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            return reply
+
+        response = await send_with_backoff(limiter, send, time.monotonic() + 10, base_delay=0.01)
+        assert response.status_code == 200 and not replies
+        assert limiter.stats()['overloads'] == 3 and limiter.stats()['successes'] == 1
+        assert all(0 < t <= 10 for t in timeouts)
+
+        # Past the deadline the last overload response is returned, not retried
+        calls = []
+
+        async def overloaded(time_left):
+            calls.append(time_left)
+            return httpx.Response(503)
+
+        response = await send_with_backoff(limiter, overloaded, time.monotonic() + 1, base_delay=5)
+        assert response.status_code == 503 and len(calls) == 1
+
+        # Non-overload errors come straight back to the caller
+        async def rejected(time_left):
+            return httpx.Response(400)
+
+        assert (await send_with_backoff(limiter, rejected, time.monotonic() + 1)).status_code == 400
+
+        async def refused(time_left):
+            calls.append(time_left)
+            raise httpx.ConnectError("refused")
+
+        calls.clear()
+        try:
+            await send_with_backoff(limiter, refused, time.monotonic() + 10)
+            raise AssertionError("retried a refused connection")
+        except httpx.ConnectError:
+            assert len(calls) == 1
+
+        # Dropped connections are retried; errors a retry cannot fix are not
+        replies = [httpx.ReadError("reset"), httpx.RemoteProtocolError("truncated"), httpx.Response(200)]
+        response = await send_with_backoff(limiter, send, time.monotonic() + 10, base_delay=0.01)
+        assert response.status_code == 200 and not replies
+
+        for permanent in (httpx.UnsupportedProtocol("no scheme"), httpx.LocalProtocolError("bad header")):
+            async def broken(time_left, error=permanent):
+                calls.append(time_left)
+                raise error
+
+            calls.clear()
+            started = time.monotonic()
+            try:
+                await send_with_backoff(limiter, broken, time.monotonic() + 10)
+                raise AssertionError(f"swallowed {permanent!r}")
+            except type(permanent):
+                assert len(calls) == 1 and time.monotonic() - started < 1
+
+        try:
+            await send_with_backoff(limiter, refused, time.monotonic() - 1)
+            raise AssertionError("sent past the deadline")
+        except httpx.TimeoutException:
+            pass
+
+    asyncio.run(run())
+    print("   ✅ Retried 529, 429 and a timeout, then stopped at the deadline")
+
+
+def test_single_flight():
+    """Test that identical concurrent calls share one result and distinct ones do not"""
+
+    print("\n" + "=" * 60)
+    print("Testing Single-Flight Request Coalescing")
+    print("=" * 60)
+
+    async def run():
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch(prompt):
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return f"reply to {prompt}"
+
+        prompts = ["Write to  Ann Lee", "Write to Ann Lee", "Write to ANN LEE"]
+        results = await asyncio.gather(*[
+            flight.do(normalize_prompt(prompt), lambda prompt=prompt: fetch(prompt)) for prompt in prompts
+        ])
+
+        # Whitespace differences collapse, case differences do not
+        assert calls == ["Write to  Ann Lee", "Write to ANN LEE"]
+        assert results == ["reply to Write to  Ann Lee", "reply to Write to  Ann Lee", "reply to Write to ANN LEE"]
+        assert flight.stats()['collapsed'] == 1 and flight.stats()['in_flight'] == 0
+
+        # Finished calls are not reused
+        assert await flight.do("Write to Ann Lee", lambda: fetch("again")) == "reply to again"
+        print(f"   ✅ {flight.stats()['calls']} calls for {len(prompts) + 1} requests")
+
+    asyncio.run(run())
+
+
+def test_single_flight_errors_and_cancellation():
+    """Test that waiters share a failure and one caller's cancellation spares the others"""
+
+    print("\n" + "=" * 60)
+    print("Testing Single-Flight Errors and Cancellation")
+    print("=" * 60)
+
+    async def run():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("provider down")
+
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert [str(result) for result in results] == ["provider down", "provider down"]
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        first = asyncio.ensure_future(flight.do("slow", slow))
+        second = asyncio.ensure_future(flight.do("slow", slow))
+        await asyncio.sleep(0)
+        first.cancel()
+        assert await second == "done"
+        print("   ✅ Shared failure and survived a cancelled caller")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    test_template_messages()
+    test_streaming_messages()
+    test_streaming_skeleton_cache()
+    test_batch_messages()
+    test_batch_messages_unfinished()
+    test_adaptive_limiter()
+    test_send_with_backoff()
+    test_single_flight()
+    test_single_flight_errors_and_cancellation()
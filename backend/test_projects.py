@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Project storage tests
+Segment store recovery and compaction, project counters, bulk and async
+saves, pagination and lead search, each in a temporary workspace
+"""
+import asyncio
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from utils.project_manager import LeadProjectManager
+from utils.segment_store import SegmentStore
+
+
+def _lead(i: int, **fields) -> dict:
+    return {'address': f"{i} Main St, Brooklyn, NY 11201", 'owner': f"Owner {i}", **fields}
+
+
+def test_segment_store_recovery():
+    """Test reads across segments and recovery from torn writes and lost index entries"""
+
+    print("\n" + "=" * 60)
+    print("Testing Segment Store Recovery")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, max_segment_bytes=2048, sync_every=1000)
+        records = [{'n': i, 'text': "x" * (i % 50)} for i in range(100)]
+        assert store.append_many(records[:60]) == list(range(60))
+        assert [store.append(record) for record in records[60:]] == list(range(60, 100))
+        assert store.active_segment > 1
+        assert store.get(42) == records[42] and store.get(100) is None and store.get(-1) is None
+        assert [record_id for record_id, _ in store.scan(reverse=True, start=5)] == [5, 4, 3, 2, 1, 0]
+        store.close()
+
+        directory = Path(tmp)
+        active = max(directory.glob("segment-*.jsonl"))
+        index = directory / "index.bin"
+
+        # Records written after their index entries were lost are indexed again;
+        # a torn last line is cut off, along with a torn index entry
+        index.write_bytes(index.read_bytes()[:-16 * 2] + b'\x01\x02\x03')
+        with open(active, 'ab') as f:
+            f.write(b'{"n": 100}\n{"n": 1')
+        # Leftovers of an interrupted compaction
+        (directory / "segment-999999.jsonl").write_bytes(b'{"stale": true}\n')
+        (directory / "index.bin.tmp").write_bytes(b'')
+
+        store = SegmentStore(tmp, max_segment_bytes=2048)
+        assert len(store) == 101 and store.get(99) == records[99] and store.get(100) == {'n': 100}
+        assert active.read_bytes().endswith(b'{"n": 100}\n')
+        assert not (directory / "segment-999999.jsonl").exists() and not (directory / "index.bin.tmp").exists()
+        store.close()
+
+        # Index entries whose data never reached the segment are dropped
+        active.write_bytes(active.read_bytes()[:-len(b'{"n": 100}\n') - 5])
+        store = SegmentStore(tmp, max_segment_bytes=2048)
+        assert len(store) == 99 and store.live_count == 99
+        assert [record for _, record in store.scan()] == records[:99]
+        assert store.append({'n': 'new'}) == 99
+        store.close()
+        print("   ✅ Recovered unindexed records and dropped torn or unwritten ones")
+
+
+def test_segment_store_compaction():
+    """Test that deletes keep IDs stable through compaction and restarts"""
+
+    print("\n" + "=" * 60)
+    print("Testing Segment Store Compaction")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SegmentStore(tmp, max_segment_bytes=1024, compact_ratio=0.5, min_compact_bytes=0)
+        store.append_many({'n': i, 'text': "y" * 30} for i in range(100))
+        segments_before = len(list(Path(tmp).glob("segment-*.jsonl")))
+
+        deleted = set(range(0, 100, 3)) | set(range(50, 90))
+        for record_id in sorted(deleted):
+            assert store.delete(record_id)
+        assert not store.delete(0) and not store.delete(100)
+
+        # Deleting past half the bytes compacted the store
+        assert store.deleted_bytes < store.live_bytes
+        assert len(list(Path(tmp).glob("segment-*.jsonl"))) < segments_before
+        live = [i for i in range(100) if i not in deleted]
+        assert [record['n'] for _, record in store.scan()] == live
+        assert all(store.get(i) is None for i in deleted)
+
+        store.compact()
+        assert store.append({'n': 100}) == 100
+        store.close()
+
+        store = SegmentStore(tmp, max_segment_bytes=1024)
+        assert len(store) == 101 and store.live_count == len(live) + 1
+        assert [record_id for record_id, _ in store.scan()] == live + [100]
+        assert store.get(live[-1]) == {'n': live[-1], 'text': "y" * 30}
+        store.close()
+        print(f"   ✅ {len(deleted)} deletes compacted away, {len(live) + 1} records kept their IDs")
+
+
+def test_delete_lead():
+    """Test that a deleted lead leaves the listing, the search index and the counters"""
+
+    print("\n" + "=" * 60)
+    print("Testing Lead Deletion")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp)
+        ids = manager.save_leads_bulk(_lead(i, cap_rate=i) for i in range(5))
+
+        assert manager.delete_lead(ids[2])
+        assert not manager.delete_lead(ids[2]) and not manager.delete_lead("99") and not manager.delete_lead("abc")
+        assert [lead['_id'] for lead in manager.get_all_leads()] == [4, 3, 1, 0]
+        assert manager.search_leads("owner 2") == [] and manager.search_leads("cap_rate=2") == []
+        assert [lead['_id'] for lead in manager.search_leads("cap_rate>=1")] == [4, 3, 1]
+        assert manager.get_project_summary()['leads'] == 4
+        manager.close()
+
+        manager = LeadProjectManager(tmp)
+        assert manager.get_project_summary()['leads'] == 4
+        assert manager.save_lead(_lead(5)) == "5"
+        assert [lead['_id'] for lead in manager.search_leads("main")] == [5, 4, 3, 1, 0]
+        manager.close()
+        print("   ✅ Deleted lead gone from listing, search and counts across a restart")
+
+
+def test_project_counters_across_restarts():
+    """Test that counters stay equal to the stored records across restarts, crashes and bulk saves"""
+
+    print("\n" + "=" * 60)
+    print("Testing Project Counters")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp, stats_every=1000)
+        for i in range(4):
+            manager.save_lead(_lead(i))
+        manager.save_outreach_message("1 Main St", "Hello")
+        manager.close()
+
+        # The first save after a restart loads (and reconciles) the counters
+        # before its own records are written, so they are counted once
+        manager = LeadProjectManager(tmp, stats_every=1000)
+        manager.save_lead(_lead(4))
+        assert manager.get_project_summary()['leads'] == 5
+        manager.close()
+
+        manager = LeadProjectManager(tmp, stats_every=1000)
+        manager.save_leads_bulk(_lead(i) for i in range(5, 15))
+        summary = manager.get_project_summary()
+        assert summary['leads'] == len(manager.get_all_leads()) == 15
+        assert (summary['outreach_messages'], summary['roi_analyses']) == (1, 0)
+        manager.close()
+
+        metadata_file = Path(tmp) / "projects" / "default" / "project.json"
+        assert json.loads(metadata_file.read_text())['total_leads'] == 15
+
+        # A crash loses unwritten counters; they are recounted from the stores
+        metadata = json.loads(metadata_file.read_text())
+        metadata['total_leads'] = 3
+        metadata_file.write_text(json.dumps(metadata))
+        manager = LeadProjectManager(tmp)
+        manager.save_lead(_lead(15))
+        assert manager.get_project_summary()['leads'] == 16
+        manager.close()
+
+        metadata_file.write_text("{not json")
+        manager = LeadProjectManager(tmp)
+        assert manager.get_project_summary()['leads'] == 16
+        manager.close()
+        print("   ✅ Counters matched the stores after restarts, a stale file and a corrupt file")
+
+
+def test_bulk_and_async_saves():
+    """Test that same-address saves get distinct IDs and queued writes are group-committed"""
+
+    print("\n" + "=" * 60)
+    print("Testing Bulk and Async Saves")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp)
+        same = {'address': "5 Court St, Brooklyn, NY 11201", 'owner': "Ann Lee"}
+        assert manager.save_leads_bulk([dict(same), dict(same)]) == ["0", "1"]
+        assert manager.save_lead(dict(same)) == "2"
+        assert manager.save_leads_bulk([]) == []
+
+        batches = []
+        commit_writes = manager._commit_writes
+
+        def counting_commit(batch):
+            batches.append(len(batch))
+            return commit_writes(batch)
+
+        manager._commit_writes = counting_commit
+
+        async def submit():
+            lead_futures = [manager.submit_lead(_lead(i)) for i in range(200)]
+            other_futures = [manager.submit_outreach_message(f"{i} Main St", "Hello") for i in range(50)]
+            other_futures.append(manager.submit_roi_analysis("1 Main St", {'cap_rate': 6.5}))
+            # The event loop keeps running while the writer is on its thread
+            await asyncio.sleep(0)
+            late = manager.submit_lead(_lead(200))
+            await manager.flush_writes()
+            return [f.result() for f in lead_futures + [late]], [f.result() for f in other_futures]
+
+        lead_ids, other_ids = asyncio.run(submit())
+        assert lead_ids == [str(i) for i in range(3, 204)]
+        assert other_ids == [str(i) for i in range(50)] + ["0"]
+        assert sum(batches) == 252 and len(batches) < 10
+        summary = manager.get_project_summary()
+        assert (summary['leads'], summary['outreach_messages'], summary['roi_analyses']) == (204, 50, 1)
+        manager.close()
+
+        manager = LeadProjectManager(tmp)
+        assert len(manager.get_all_leads()) == 204
+        assert len(manager.search_leads("court")) == 3
+        manager.close()
+        print(f"   ✅ 252 queued records written in {len(batches)} group commits")
+
+
+def test_leads_pagination():
+    """Test cursor pages, field projection and limit validation"""
+
+    print("\n" + "=" * 60)
+    print("Testing Lead Pagination")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp)
+        assert manager.get_leads_page(limit=10) == {'leads': [], 'next_cursor': None}
+        manager.save_leads_bulk(_lead(i, estimated_value=i * 1000) for i in range(25))
+
+        pages, cursor = [], None
+        while True:
+            page = manager.get_leads_page(limit=10, cursor=cursor, fields=['address'])
+            pages.append(page['leads'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+
+        assert [len(page) for page in pages] == [10, 10, 5]
+        ids = [lead['_id'] for page in pages for lead in page]
+        assert ids == list(range(24, -1, -1))
+        assert pages[0][0] == {'address': "24 Main St, Brooklyn, NY 11201", '_id': 24}
+
+        # A full last page has no cursor to an empty one
+        assert manager.get_leads_page(limit=25)['next_cursor'] is None
+        assert manager.get_leads_page(limit=5, cursor="3")['leads'][-1]['_id'] == 0
+        assert manager.get_leads_page(cursor="0")['leads'] == []
+
+        for bad in ({'limit': 0}, {'limit': -1}, {'cursor': "abc"}):
+            try:
+                manager.get_leads_page(**bad)
+                raise AssertionError(f"accepted {bad}")
+            except ValueError:
+                pass
+        manager.close()
+        print(f"   ✅ {len(ids)} leads over {len(pages)} pages, invalid limits and cursors rejected")
+
+
+def test_reads_during_group_commit():
+    """Test that pages read on another thread while the async writer appends never see a partial record"""
+
+    print("\n" + "=" * 60)
+    print("Testing Reads During Group Commits")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Small segments so the writer also rolls files while pages are read
+        manager = LeadProjectManager(tmp, max_segment_bytes=32 << 10, sync_every=1 << 20)
+        errors = []
+        done = threading.Event()
+        reads = 0
+
+        def read_pages():
+            nonlocal reads
+            while not done.is_set():
+                try:
+                    page = manager.get_leads_page(limit=20)
+                    ids = [lead['_id'] for lead in page['leads']]
+                    assert ids == sorted(ids, reverse=True)
+                    reads += 1
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        async def write():
+            reader = threading.Thread(target=read_pages)
+            reader.start()
+            try:
+                for chunk in range(30):
+                    for i in range(100):
+                        manager.submit_lead(_lead(chunk * 100 + i, notes="x" * 200))
+                    await asyncio.sleep(0)
+                await manager.flush_writes()
+            finally:
+                done.set()
+                reader.join()
+
+        asyncio.run(write())
+        assert not errors, errors[0]
+        assert len(manager.get_all_leads()) == manager.get_project_summary()['leads'] == 3000
+        manager.close()
+        print(f"   ✅ {reads} pages read cleanly while 3,000 leads were committed")
+
+
+def test_search_leads():
+    """Test word prefix, field, phrase and numeric range queries, and that results come from the store"""
+
+    print("\n" + "=" * 60)
+    print("Testing Lead Search")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp)
+        manager.save_leads_bulk([
+            {'address': "12 Atlantic Ave, Brooklyn, NY 11201", 'owner': "John Smith", 'estimated_value': 450000,
+             'roi_analysis': {'cap_rate': 7.5, 'recommendation': 'Strong buy'}},
+            {'address': "40 Main St, Queens, NY 11372", 'owner': "Ann Smithers", 'estimated_value': 900000,
+             'Cap_Rate': 4.0, 'notes': "Corner lot near Atlantic Terminal"},
+            {'address': "7 Grand Concourse, Bronx, NY 10451", 'owner': "Wei Chen", 'estimated_value': 300000,
+             'roi_analysis': {'cap_rate': 9.1}},
+        ])
+
+        def addresses(query):
+            return [lead['address'].split(',')[0] for lead in manager.search_leads(query)]
+
+        # Words match from the start of a token, not anywhere inside it
+        assert addresses("atlan") == ["40 Main St", "12 Atlantic Ave"]
+        assert addresses("smith") == ["40 Main St", "12 Atlantic Ave"]
+        assert addresses("mith") == [] and addresses("lantic") == []
+
+        assert addresses("address:atlantic") == ["12 Atlantic Ave"]
+        assert addresses('"atlantic terminal"') == ["40 Main St"] and addresses('"terminal atlantic"') == []
+        assert addresses("strong buy") == ["12 Atlantic Ave"]
+        assert addresses("color:blue") == []
+
+        # Numeric fields compare whatever the case of the stored key or the query
+        assert addresses("cap_rate>=7") == ["7 Grand Concourse", "12 Atlantic Ave"]
+        assert addresses("CAP_RATE<5") == ["40 Main St"]
+        assert addresses("smith estimated_value<=500000") == ["12 Atlantic Ave"]
+
+        results = manager.search_leads("", limit=2)
+        assert [lead['_id'] for lead in results] == [2, 1] and results[0]['owner'] == "Wei Chen"
+        manager.close()
+
+        # The index holds IDs only; the leads themselves stay in the segment store
+        conn = sqlite3.connect(Path(tmp) / "projects" / "default" / "search.db")
+        assert [row[1] for row in conn.execute("PRAGMA table_info(leads)")] == ['id']
+        conn.close()
+        print("   ✅ Prefix, field, phrase and range queries matched")
+
+
+def test_search_index_recovery():
+    """Test that the index catches up with, and is rebuilt when ahead of, the lead store"""
+
+    print("\n" + "=" * 60)
+    print("Testing Search Index Recovery")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = LeadProjectManager(tmp)
+        manager.save_leads_bulk(_lead(i, owner=f"Owner{i}") for i in range(10))
+        manager.close()
+
+        # A crash where the index commit survived but the last two leads' bytes did not
+        leads_dir = Path(tmp) / "projects" / "default" / "leads"
+        segment = next(leads_dir.glob("segment-*.jsonl"))
+        lines = segment.read_bytes().splitlines(keepends=True)
+        segment.write_bytes(b''.join(lines[:-2]))
+
+        manager = LeadProjectManager(tmp)
+        assert manager.search_leads("owner8") == []
+        # The lost IDs are issued again without clashing with stale index rows
+        new_ids = manager.save_leads_bulk([{'address': "1 Ocean Pkwy", 'owner': "Maria Garcia"}])
+        assert new_ids == ["8"]
+        assert [lead['_id'] for lead in manager.search_leads("garcia")] == [8]
+        assert [lead['_id'] for lead in manager.search_leads("main")] == list(range(7, -1, -1))
+        manager.close()
+
+        # An index from before the store existed, or in an older layout, is rebuilt from the store
+        search_db = Path(tmp) / "projects" / "default" / "search.db"
+        conn = sqlite3.connect(search_db)
+        for table in ('leads', 'leads_fts', 'lead_numbers'):
+            conn.execute(f"DROP TABLE {table}")
+        conn.execute("CREATE TABLE leads (id INTEGER PRIMARY KEY, lead TEXT NOT NULL)")
+        conn.commit()
+        conn.close()
+        manager = LeadProjectManager(tmp)
+        assert len(manager.search_leads("")) == 9
+        assert [lead['owner'] for lead in manager.search_leads("ocean")] == ["Maria Garcia"]
+        manager.close()
+        print("   ✅ Rebuilt after losing store records and after a layout change")
+
+
+if __name__ == "__main__":
+    test_segment_store_recovery()
+    test_segment_store_compaction()
+    test_delete_lead()
+    test_project_counters_across_restarts()
+    test_bulk_and_async_saves()
+    test_leads_pagination()
+    test_reads_during_group_commit()
+    test_search_leads()
+    test_search_index_recovery()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+ROI analysis tests
+Comparable-sales valuation, financing schedules, location features and
+batched DeepSeek requests of the ROI agent, on small generated datasets and
+without a DeepSeek key (DeepSeek is replaced by a local stub)
+"""
+import asyncio
+import json
+import math
+import random
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from agents.roi_agent import ROIAnalysisAgent
+from utils.comps_index import KM_PER_DEGREE, ComparableSalesIndex
+from utils.financing import FinancingEngine, LoanTerms, amortization_schedule
+from utils.location_index import UNKNOWN_LOCATION, LocationFeatures, LocationIndex
+
+
+def test_comps_nearest_matches_scan():
+    """Test grid k-nearest lookups against a brute-force scan"""
+
+    print("\n" + "=" * 60)
+    print("Testing Comparable-Sales Nearest Neighbors")
+    print("=" * 60)
+
+    rng = random.Random(3)
+    index = ComparableSalesIndex(max_radius_km=3.0)
+    for _ in range(3000):
+        index.add(40.6 + rng.random() * 0.2, -74.0 + rng.random() * 0.2, rng.randint(200, 900) * 1000)
+    index.tune_cell_size()
+
+    def scan(latitude, longitude, k):
+        lon_scale = math.cos(math.radians(latitude))
+        distances = sorted(
+            (math.hypot(index.latitudes[p] - latitude, (index.longitudes[p] - longitude) * lon_scale)
+             * KM_PER_DEGREE, p)
+            for p in range(len(index))
+        )
+        return [(d, p) for d, p in distances if d <= index.max_radius_km][:k]
+
+    # Inside the data, on its edge and well outside it
+    queries = [(40.6 + rng.random() * 0.2, -74.0 + rng.random() * 0.2) for _ in range(50)]
+    queries += [(40.6, -74.0), (40.8, -73.79), (40.83, -73.77), (41.5, -73.0)]
+    for latitude, longitude in queries:
+        for k in (1, 5, 25):
+            found = index.nearest(latitude, longitude, k)
+            expected = scan(latitude, longitude, k)
+            assert [p for _, p in found] == [p for _, p in expected], (latitude, longitude, k)
+            assert all(abs(a - b) < 1e-9 for (a, _), (b, _) in zip(found, expected))
+
+    assert index.nearest(41.5, -73.0) == [] and index.estimate_value(41.5, -73.0) is None
+    assert ComparableSalesIndex().nearest(40.7, -74.0) == []
+    print(f"   ✅ {len(queries)} queries matched a scan over {len(index):,} sales")
+
+
+def test_comps_valuation():
+    """Test CSV loading, price-per-square-foot weighting and the agent's fallback"""
+
+    print("\n" + "=" * 60)
+    print("Testing Comparable-Sales Valuation")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "comps.csv"
+        path.write_text(
+            "lat,lng,price,square_feet\n"
+            "40.7000,-73.9500,500000,1000\n"
+            "40.7000,-73.9500,900000,1500\n"
+            "40.7010,-73.9500,600000,\n"
+            "not-a-number,-73.9500,100000,900\n"
+        )
+        index = ComparableSalesIndex.from_csv(str(path))
+        assert len(index) == 3
+
+        # Equal-distance comps with sqft: the weighted price per square foot
+        value = index.estimate_value(40.7000, -73.9500, k=2, sqft=2000)
+        assert abs(value - 2000 * (500 + 600) / 2) < 1e-6
+        # Without a subject size, prices are weighted by inverse distance
+        plain = index.estimate_value(40.7005, -73.9500, k=3)
+        assert abs(plain - (500000 + 900000 + 600000) / 3) < 1e-6
+
+        bad = Path(tmp) / "bad.csv"
+        bad.write_text("latitude,longitude\n40.7,-73.9\n")
+        try:
+            ComparableSalesIndex.from_csv(str(bad))
+            raise AssertionError("accepted a file without prices")
+        except ValueError:
+            pass
+
+        agent = ROIAnalysisAgent({'comps_path': str(path), 'comps_k': 2})
+        assert abs(agent._estimate_value({'latitude': 40.7, 'longitude': -73.95, 'sqft': 2000}) - value) < 1e-6
+        # No coordinates, or no comps nearby: the location table still prices it
+        assert agent._estimate_value({'address': "1 Main St, Bronx, NY 10451"}) == 300000
+        assert agent._estimate_value({'lat': 45.0, 'lon': -70.0, 'address': "1 Main St, Bronx, NY"}) == 300000
+        assert ROIAnalysisAgent({'comps_path': str(bad)}).comps_index is None
+        print("   ✅ Weighted comps valuation with location-table fallback")
+
+
+def _monthly_schedule(loan_amount, terms):
+    """Yearly totals of a month-by-month amortization, re-priced each year like the engine"""
+    balance, total_months = loan_amount, terms.term_years * 12
+    years = []
+    for year, annual_rate in enumerate(terms.annual_rates()):
+        r = annual_rate / 12
+        remaining = total_months - year * 12
+        if year < terms.interest_only_years:
+            payment = balance * r
+        elif r == 0:
+            payment = balance / remaining
+        else:
+            payment = balance * r / (1 - (1 + r) ** -remaining)
+        paid = interest = 0.0
+        for _ in range(12):
+            month_interest = balance * r
+            balance -= payment - month_interest
+            paid += payment
+            interest += month_interest
+        years.append((paid, interest, max(balance, 0.0)))
+    return years
+
+
+def test_amortization_schedules():
+    """Test yearly closed-form schedules against a monthly loop for fixed, interest-only, ARM and 0% loans"""
+
+    print("\n" + "=" * 60)
+    print("Testing Amortization Schedules")
+    print("=" * 60)
+
+    cases = [
+        LoanTerms(),
+        LoanTerms(rate=0.07, term_years=15, interest_only_years=3),
+        LoanTerms(rate=0.05, arm_fixed_years=5, arm_reset_rate=0.065, arm_adjust_years=1,
+                  arm_rate_step=0.01, arm_rate_cap=0.09),
+        LoanTerms(rate=0.0, term_years=10),
+    ]
+    for terms in cases:
+        schedule = amortization_schedule(240000, terms)
+        expected = _monthly_schedule(240000, terms)
+        assert len(schedule.payments) == terms.term_years
+        for year, (paid, interest, balance) in enumerate(expected):
+            assert abs(schedule.payments[year] - paid) < 1e-4, (terms, year)
+            assert abs(schedule.interest[year] - interest) < 1e-4, (terms, year)
+            assert abs(schedule.balance[year] - balance) < 1e-4, (terms, year)
+        assert abs(sum(schedule.principal) - 240000) < 1e-4 and schedule.balance[-1] < 1e-4
+
+    # $240k at 6% over 30 years is the textbook $1,438.92 a month
+    assert abs(amortization_schedule(240000, LoanTerms()).payments[0] / 12 - 1438.92) < 0.01
+
+    arm = cases[2].annual_rates()
+    assert arm[:5] == [0.05] * 5 and arm[5] == 0.065 and abs(arm[7] - 0.085) < 1e-12 and max(arm) == 0.09
+    assert LoanTerms.from_config({'rate': 0.04, 'lender': "ignored"}) == LoanTerms(rate=0.04)
+    print(f"   ✅ {len(cases)} loan shapes matched a month-by-month loop")
+
+
+def test_financing_metrics():
+    """Test cash-on-cash, DSCR and equity build-up, one at a time and batched"""
+
+    print("\n" + "=" * 60)
+    print("Testing Financing Metrics")
+    print("=" * 60)
+
+    terms = LoanTerms(rate=0.06, down_payment=0.25, points=0.01, closing_costs=0.02, interest_only_years=1)
+    engine = FinancingEngine(terms)
+    result = engine.analyze(400000, 30000)
+
+    loan = 300000
+    debt_service = loan * 0.06
+    assert abs(result['loan_amount'] - loan) < 1e-9
+    assert abs(result['cash_invested'] - (400000 * 0.27 + loan * 0.01)) < 1e-9
+    assert abs(result['annual_debt_service'] - debt_service) < 1e-6
+    assert abs(result['cash_on_cash_return'] - (30000 - debt_service) / 111000 * 100) < 1e-6
+    assert abs(result['dscr'] - 30000 / debt_service) < 1e-9
+    # Interest-only first year: no principal until year two
+    schedule = engine.schedule_for(400000)
+    assert result['equity_buildup_year1'] == 0
+    assert abs(result['equity_buildup_5yr'] - (loan - schedule.balance[4])) < 1e-6
+
+    prices = [250000, 400000, 1200000]
+    nois = [15000, 30000, 50000]
+    assert engine.analyze_batch(prices, nois) == [engine.analyze(p, n) for p, n in zip(prices, nois)]
+
+    cash = FinancingEngine(LoanTerms(down_payment=1.0)).analyze(400000, 30000)
+    assert cash['annual_debt_service'] == 0 and cash['dscr'] is None
+    assert abs(cash['cash_on_cash_return'] - 7.5) < 1e-9
+
+    # The agent's cash-on-cash follows the configured terms
+    agent = ROIAnalysisAgent({'financing': {'down_payment': 1.0}})
+    assert abs(agent._calculate_cash_on_cash(400000, 3000) - agent._calculate_noi(3000) / 4000) < 1e-9
+    print("   ✅ Leveraged, all-cash and batched metrics agree")
+
+
+def test_location_index():
+    """Test that the most specific area wins and street names are not mistaken for areas"""
+
+    print("\n" + "=" * 60)
+    print("Testing Location Features")
+    print("=" * 60)
+
+    index = LocationIndex([
+        (LocationFeatures('Park Slope', value_multiplier=2.2, rent_ratio=0.007), []),
+        (LocationFeatures('Long Island City', value_multiplier=2.0), ['11101']),
+        (LocationFeatures('11201', level='zip', value_multiplier=2.4), ['11201']),
+    ])
+
+    assert index.resolve("9 Main St, Bronx, NY 10451").name == 'Bronx'
+    assert index.resolve("9 Main St, Staten Island, NY").name == 'Staten Island'
+    assert index.resolve("9 5th Ave, Park Slope, Brooklyn, NY").name == 'Park Slope'
+    # ZIP beats neighborhood beats borough, wherever they appear
+    assert index.resolve("9 Court St, Park Slope, Brooklyn, NY 11201").name == '11201'
+    assert index.resolve("9 Jackson Ave, Queens, NY 11101-2233").name == 'Long Island City'
+    # The street part is skipped
+    assert index.resolve("9 Brooklyn Ave, Albany, NY 12207") is UNKNOWN_LOCATION
+    assert index.resolve("Brooklyn").name == 'Brooklyn'
+    assert index.resolve("") is UNKNOWN_LOCATION
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "locations.csv"
+        csv_path.write_text(
+            "name,level,zip_codes,value_multiplier,rent_ratio,risk_adjustment\n"
+            "Astoria,neighborhood,11102;11103,1.6,0.0085,\n"
+            ",,11372,1.3,,0.5\n"
+        )
+        loaded = LocationIndex.from_file(str(csv_path))
+        astoria = loaded.resolve("9 Ditmars Blvd, Queens, NY 11103")
+        assert (astoria.name, astoria.value_multiplier, astoria.rent_ratio) == ('Astoria', 1.6, 0.0085)
+        jackson = loaded.resolve("9 37th Ave, Queens, NY 11372")
+        assert (jackson.name, jackson.level, jackson.risk_adjustment) == ('11372', 'zip', 0.5)
+
+        json_path = Path(tmp) / "locations.json"
+        json_path.write_text(json.dumps([{'name': "Bushwick", 'zip_codes': ["11237"], 'value_multiplier': 1.5}]))
+        assert LocationIndex.from_file(str(json_path)).resolve("1 Main St, NY 11237").value_multiplier == 1.5
+
+        # The agent prices, rents and scores risk from the resolved area
+        agent = ROIAnalysisAgent({'locations_path': str(csv_path)})
+        property_data = {'address': "9 Ditmars Blvd, Queens, NY 11103"}
+        assert agent._estimate_value(property_data) == 300000 * 1.6
+        bronx = {'address': "9 Main St, Bronx, NY 10451"}
+        assert agent._calculate_risk_score(bronx) == 6 and agent._estimate_value(bronx) == 300000
+        assert ROIAnalysisAgent({'locations_path': str(Path(tmp) / "missing.csv")}).locations.by_name
+    print("   ✅ ZIP, neighborhood and borough features resolved from code, CSV and JSON tables")
+
+
+class StubDeepSeekHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for DeepSeek's chat completions endpoint"""
+    batch_reply = None  # properties -> list of elements, or raw content
+    status = 200
+    prompts = []
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = payload["messages"][0]["content"]
+        self.prompts.append((prompt, payload["max_tokens"]))
+
+        if "\nProperties:\n" in prompt:
+            properties = json.loads(prompt.split("\nProperties:\n", 1)[1])
+            content = type(self).batch_reply(properties)
+            if not isinstance(content, str):
+                content = f"```json\n{json.dumps(content)}\n```"
+        else:
+            content = json.dumps(_stub_analysis(7.0, "Single"))
+
+        body = json.dumps({"choices": [{"message": {"content": content}}]} if self.status == 200 else
+                          {"error": {"message": "invalid request"}}).encode()
+        self.send_response(self.status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _stub_analysis(cap_rate, recommendation, **fields):
+    return {'cap_rate': cap_rate, 'cash_on_cash_return': 4.0, 'noi': 20000, 'five_year_irr': 9.0,
+            'risk_score': 5, 'recommendation': recommendation, **fields}
+
+
+def _stub_deepseek(batch_reply, status=200) -> ThreadingHTTPServer:
+    StubDeepSeekHandler.batch_reply, StubDeepSeekHandler.status = staticmethod(batch_reply), status
+    StubDeepSeekHandler.prompts = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubDeepSeekHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def test_batch_analysis():
+    """Test batch prompts, element validation, id mapping and per-element fallbacks"""
+
+    print("\n" + "=" * 60)
+    print("Testing Batched DeepSeek Analysis (local stub server)")
+    print("=" * 60)
+
+    properties = [{'address': f"{i} Main St, Bronx, NY 10451"} for i in range(5)]
+
+    def reply(batch):
+        # Out of order, with an invalid element, an unknown id and a duplicate
+        elements = [_stub_analysis(5.0 + p['id'], "Batch", id=p['id']) for p in reversed(batch)]
+        for element in elements:
+            if element['id'] == 1:
+                element['cap_rate'] = "high"
+        elements.append(_stub_analysis(1.0, "Unknown", id=99))
+        elements.append(_stub_analysis(1.0, "Duplicate", id=batch[0]['id']))
+        return elements
+
+    server = _stub_deepseek(reply)
+    try:
+        config = {'api_key': 'stub-key', 'base_url': f"http://127.0.0.1:{server.server_port}",
+                  'analysis_batch_size': 3}
+        agent = ROIAnalysisAgent(config)
+        results = asyncio.run(agent.analyze_properties(properties))
+
+        batches = [(prompt, tokens) for prompt, tokens in StubDeepSeekHandler.prompts if "\nProperties:\n" in prompt]
+        assert [tokens for _, tokens in batches] == [500 + 350 * 3, 500 + 350 * 2]
+        sent = sorted((p['id'], p['address'], p['purchase_price'])
+                      for prompt, _ in batches for p in json.loads(prompt.split("\nProperties:\n", 1)[1]))
+        assert sent == [(i, properties[i]['address'], 300000) for i in range(5)]
+        # Instructions first, so every batch shares the same prefix
+        assert batches[0][0].split("\nProperties:\n")[0] == batches[1][0].split("\nProperties:\n")[0]
+
+        assert [r['address'] for r in results] == [p['address'] for p in properties]
+        assert [(r['cap_rate'], r['recommendation']) for r in results] == \
+            [(5.0, "Batch"), (7.0, "Single"), (7.0, "Batch"), (8.0, "Batch"), (9.0, "Batch")]
+        assert all('id' not in r and r['estimated_value'] == 300000 and 'dscr' in r for r in results)
+        assert len(StubDeepSeekHandler.prompts) == 3  # two batches, one single retry
+
+        # 'local' fills the gap with the manual calculations instead
+        StubDeepSeekHandler.prompts = []
+        agent = ROIAnalysisAgent({**config, 'batch_fallback': 'local'})
+        results = asyncio.run(agent.analyze_properties(properties))
+        assert len(StubDeepSeekHandler.prompts) == 2
+        assert results[1]['cap_rate'] == agent._calculate_cap_rate(300000, results[1]['monthly_rent_estimate'])
+
+        # An answer that is not JSON still counts as answered: every element is retried singly
+        StubDeepSeekHandler.batch_reply = staticmethod(lambda batch: "Sorry, I cannot help with that.")
+        StubDeepSeekHandler.prompts = []
+        results = asyncio.run(ROIAnalysisAgent(config).analyze_properties(properties))
+        assert [r['recommendation'] for r in results] == ["Single"] * 5 and len(StubDeepSeekHandler.prompts) == 7
+    finally:
+        server.shutdown()
+        server.server_close()
+    print("   ✅ Valid elements mapped by id; missing ones retried singly or computed locally")
+
+
+def test_batch_analysis_endpoint_failure():
+    """Test that a failing endpoint sends every property to the manual calculations without single retries"""
+
+    print("\n" + "=" * 60)
+    print("Testing Batched DeepSeek Analysis Failures")
+    print("=" * 60)
+
+    properties = [{'address': f"{i} Main St, Bronx, NY 10451"} for i in range(4)]
+    local = ROIAnalysisAgent({})
+    expected = [asyncio.run(local.analyze_property(p['address'], p)) for p in properties]
+
+    server = _stub_deepseek(lambda batch: [], status=400)
+    try:
+        agent = ROIAnalysisAgent({'api_key': 'stub-key', 'base_url': f"http://127.0.0.1:{server.server_port}",
+                                  'analysis_batch_size': 2})
+        assert asyncio.run(agent.analyze_properties(properties)) == expected
+        assert len(StubDeepSeekHandler.prompts) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Nothing listening: refused at once, no waiting out request_deadline
+    agent = ROIAnalysisAgent({'api_key': 'stub-key', 'base_url': f"http://127.0.0.1:{server.server_port}"})
+    assert asyncio.run(agent.analyze_properties(properties)) == expected
+    print("   ✅ Rejected and unreachable endpoints fell back to manual calculations")
+
+
+if __name__ == "__main__":
+    test_comps_nearest_matches_scan()
+    test_comps_valuation()
+    test_amortization_schedules()
+    test_financing_metrics()
+    test_location_index()
+    test_batch_analysis()
+    test_batch_analysis_endpoint_failure()
@@ -3,10 +3,12 @@
 from .config_loader import ConfigLoader, load_config
 from .sheets_logger import GoogleSheetsLogger
 from .project_manager import LeadProjectManager
+from .comps_index import ComparableSalesIndex
 
 __all__ = [
     'ConfigLoader',
     'load_config',
     'GoogleSheetsLogger',
-    'LeadProjectManager'
+    'LeadProjectManager',
+    'ComparableSalesIndex'
 ]
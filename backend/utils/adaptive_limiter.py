@@ -0,0 +1,173 @@
+"""
+Adaptive concurrency control for LLM provider calls
+AIMD limiter: the concurrency limit grows additively while requests succeed and
+halves when the provider signals overload (429/529/5xx), honoring Retry-After
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+# 529 is Anthropic's "overloaded" status
+OVERLOAD_STATUSES = {429, 529}
+
+
+def is_overload_status(status_code: int) -> bool:
+    """Whether a response status means back off and retry"""
+    return status_code in OVERLOAD_STATUSES or 500 <= status_code < 600
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit shared by all calls to one provider"""
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 decrease_factor: float = 0.5):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+
+        self.in_flight = 0
+        self.blocked_until = 0.0  # Monotonic time before which no request starts
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+        self.successes = 0
+        self.overloads = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one unit of concurrency; yields the monotonic start time"""
+        condition = self._get_condition()
+        async with condition:
+            while True:
+                wait = self.blocked_until - time.monotonic()
+                if wait > 0:
+                    # Sleep out the Retry-After window, then re-check
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                if self.in_flight < int(self.limit):
+                    break
+                await condition.wait()
+            self.in_flight += 1
+
+        try:
+            yield time.monotonic()
+        finally:
+            async with condition:
+                self.in_flight -= 1
+                condition.notify_all()
+
+    def on_success(self):
+        """Additive increase: roughly +1 to the limit per limit's worth of successes"""
+        self.successes += 1
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_overload(self, started_at: float, retry_after: Optional[float] = None):
+        """
+        Multiplicative decrease, at most once per wave of requests: failures
+        from requests started before the last decrease do not shrink it again
+        """
+        self.overloads += 1
+        if started_at >= self._last_decrease:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = time.monotonic()
+
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict:
+        return {
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'successes': self.successes,
+            'overloads': self.overloads
+        }
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so the limiter can be built outside a running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+
+# Transport errors worth another attempt; anything else is permanent
+RETRYABLE_ERRORS = (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError)
+
+
+async def send_with_backoff(limiter: AdaptiveConcurrencyLimiter,
+                            send: Callable[[float], Awaitable[httpx.Response]],
+                            deadline: float,
+                            base_delay: float = 1.0) -> httpx.Response:
+    """
+    Send a request through the limiter, retrying overload responses, timeouts
+    and dropped connections with exponential backoff until `deadline`
+    (monotonic). Refused connections and errors a retry cannot fix (a bad
+    URL, an invalid request) are raised at once, so callers fall back without
+    waiting out the deadline.
+
+    Args:
+        send: Called with the timeout left before the deadline; performs one attempt
+
+    Returns:
+        The first non-overload response, or the last overload response once
+        another attempt would not fit before the deadline. Transport errors
+        are re-raised in that case.
+    """
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise httpx.TimeoutException("deadline exceeded before request was sent")
+
+        async with limiter.slot() as started_at:
+            try:
+                response = await send(max(1.0, deadline - time.monotonic()))
+                error = None
+            except httpx.ConnectError:
+                raise
+            except RETRYABLE_ERRORS as e:
+                response, error = None, e
+
+        if response is not None and not is_overload_status(response.status_code):
+            limiter.on_success()
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('retry-after')) if response is not None else None
+        limiter.on_overload(started_at, retry_after)
+
+        delay = max(retry_after or 0.0, base_delay * (2 ** attempt) * random.uniform(0.5, 1.0))
+        if time.monotonic() + delay >= deadline:
+            if error is not None:
+                raise error
+            return response
+
+        if response is not None:
+            # Release the connection of a streamed response we are not going to read
+            await response.aclose()
+
+        attempt += 1
+        await asyncio.sleep(delay)
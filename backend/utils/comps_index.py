@@ -0,0 +1,195 @@
+"""
+Comparable-sales index for location-aware property valuation
+Sales are bucketed into a lat/lon grid so k-nearest lookups only touch a few cells
+"""
+import csv
+import heapq
+import math
+from array import array
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+KM_PER_DEGREE = 111.32
+
+# Accepted CSV column names for each field
+COLUMN_ALIASES = {
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng'),
+    'price': ('sale_price', 'price'),
+    'sqft': ('sqft', 'square_feet', 'living_area')
+}
+
+
+class ComparableSalesIndex:
+    """Grid-bucketed spatial index over comparable sales"""
+
+    def __init__(self, cell_size: float = 0.005, max_radius_km: float = 5.0):
+        """
+        Args:
+            cell_size: Grid cell edge in degrees (0.005 is roughly 500m)
+            max_radius_km: Comps further away than this are never used
+        """
+        self.cell_size = cell_size
+        self.max_radius_km = max_radius_km
+
+        # Column storage keeps each sale at 32 bytes instead of a dict per row
+        self.latitudes = array('d')
+        self.longitudes = array('d')
+        self.prices = array('d')
+        self.sqfts = array('d')
+
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> 'ComparableSalesIndex':
+        """
+        Load comparable sales from a CSV file
+
+        Expects latitude, longitude and sale_price columns (see COLUMN_ALIASES);
+        sqft is optional and enables price-per-square-foot valuation.
+        """
+        index = cls(**kwargs)
+
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            reader = csv.DictReader(f)
+            columns = {
+                field: next((name for name in aliases if name in (reader.fieldnames or [])), None)
+                for field, aliases in COLUMN_ALIASES.items()
+            }
+
+            if not (columns['latitude'] and columns['longitude'] and columns['price']):
+                raise ValueError(f"{path} needs latitude, longitude and sale_price columns")
+
+            skipped = 0
+            for row in reader:
+                try:
+                    sqft = row.get(columns['sqft']) if columns['sqft'] else None
+                    index.add(
+                        float(row[columns['latitude']]),
+                        float(row[columns['longitude']]),
+                        float(row[columns['price']]),
+                        float(sqft) if sqft else None
+                    )
+                except (TypeError, ValueError):
+                    skipped += 1
+
+        if 'cell_size' not in kwargs:
+            index.tune_cell_size()
+
+        print(f"[CompsIndex] Loaded {len(index)} comparable sales from {Path(path).name}"
+              + (f" ({skipped} rows skipped)" if skipped else ""))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def add(self, latitude: float, longitude: float, price: float, sqft: Optional[float] = None):
+        """Add one comparable sale"""
+        if price <= 0:
+            raise ValueError("price must be positive")
+
+        position = len(self.prices)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.prices.append(price)
+        self.sqfts.append(sqft if sqft and sqft > 0 else 0.0)
+
+        self.cells.setdefault(self._cell(latitude, longitude), []).append(position)
+
+    def tune_cell_size(self, target_per_cell: float = 4.0):
+        """
+        Re-bucket the sales so an average occupied cell holds about
+        `target_per_cell` of them, keeping k-nearest scans to a few dozen points
+        """
+        if len(self.prices) < 2:
+            return
+
+        lat_span = max(self.latitudes) - min(self.latitudes)
+        lon_span = max(self.longitudes) - min(self.longitudes)
+        area = max(lat_span * lon_span, 1e-8)
+
+        self.cell_size = max(math.sqrt(area * target_per_cell / len(self.prices)), 1e-4)
+        self.cells = {}
+        for position in range(len(self.prices)):
+            self.cells.setdefault(self._cell(self.latitudes[position], self.longitudes[position]), []).append(position)
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5) -> List[Tuple[float, int]]:
+        """
+        Find the k nearest comparable sales
+
+        Returns:
+            (distance_km, position) pairs, closest first
+        """
+        if not self.prices:
+            return []
+
+        cx, cy = self._cell(latitude, longitude)
+        lon_scale = math.cos(math.radians(latitude))
+        # Distance covered by one ring of cells in the narrower (longitude) direction
+        ring_km = self.cell_size * KM_PER_DEGREE * max(lon_scale, 1e-6)
+        max_ring = int(self.max_radius_km / ring_km) + 1
+
+        lats, lons = self.latitudes, self.longitudes
+        best: List[Tuple[float, int]] = []  # max-heap of (-distance, position)
+
+        for ring in range(max_ring + 1):
+            for cell in self._ring_cells(cx, cy, ring):
+                for position in self.cells.get(cell, ()):
+                    dlat = lats[position] - latitude
+                    dlon = (lons[position] - longitude) * lon_scale
+                    distance = math.sqrt(dlat * dlat + dlon * dlon) * KM_PER_DEGREE
+
+                    if distance > self.max_radius_km:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, position))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, position))
+
+            # Anything outside the rings scanned so far is at least this far away
+            if len(best) == k and -best[0][0] <= ring * ring_km:
+                break
+
+        return sorted((-negative, position) for negative, position in best)
+
+    def estimate_value(self, latitude: float, longitude: float, k: int = 5,
+                       sqft: Optional[float] = None) -> Optional[float]:
+        """
+        Inverse-distance weighted valuation from the k nearest comps
+
+        Uses price per square foot when the subject and the comps have sqft,
+        otherwise a weighted average of sale prices. Returns None when no comps
+        fall within max_radius_km.
+        """
+        comps = self.nearest(latitude, longitude, k)
+        if not comps:
+            return None
+
+        # 50m floor keeps an exact-address comp from taking all the weight
+        weights = [1.0 / (distance + 0.05) for distance, _ in comps]
+
+        if sqft and sqft > 0:
+            sized = [(w, self.prices[p] / self.sqfts[p]) for w, (_, p) in zip(weights, comps) if self.sqfts[p] > 0]
+            if sized:
+                total_weight = sum(w for w, _ in sized)
+                return sqft * sum(w * ppsf for w, ppsf in sized) / total_weight
+
+        total_weight = sum(weights)
+        return sum(w * self.prices[p] for w, (_, p) in zip(weights, comps)) / total_weight
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return int(math.floor(latitude / self.cell_size)), int(math.floor(longitude / self.cell_size))
+
+    @staticmethod
+    def _ring_cells(cx: int, cy: int, ring: int):
+        """Cells at Chebyshev distance `ring` from (cx, cy)"""
+        if ring == 0:
+            yield (cx, cy)
+            return
+
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
@@ -0,0 +1,167 @@
+"""
+Mortgage financing engine for ROI analysis
+Builds amortization schedules (interest-only periods, ARM resets, points) and
+derives cash-on-cash return, DSCR and equity build-up from them
+"""
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional, Sequence
+
+# Matches the five-year horizon used for the IRR projection
+HOLD_YEARS = 5
+
+
+@dataclass
+class LoanTerms:
+    """Financing assumptions; rates and percentages are fractions (0.06 = 6%)"""
+    rate: float = 0.06
+    term_years: int = 30
+    down_payment: float = 0.20
+    points: float = 0.0  # Fraction of the loan paid upfront
+    closing_costs: float = 0.0  # Fraction of the purchase price paid upfront
+    interest_only_years: int = 0
+    # Adjustable-rate mortgages: `rate` holds for arm_fixed_years, then resets
+    # to arm_reset_rate and moves by arm_rate_step every arm_adjust_years
+    arm_fixed_years: Optional[int] = None
+    arm_reset_rate: Optional[float] = None
+    arm_adjust_years: int = 1
+    arm_rate_step: float = 0.0
+    arm_rate_cap: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'LoanTerms':
+        """Build terms from a config dict, ignoring unknown keys"""
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in (config or {}).items() if k in known})
+
+    def annual_rates(self) -> List[float]:
+        """Note rate in effect for each loan year"""
+        rates = []
+        for year in range(self.term_years):
+            if self.arm_fixed_years is None or self.arm_reset_rate is None or year < self.arm_fixed_years:
+                rates.append(self.rate)
+                continue
+
+            adjustments = (year - self.arm_fixed_years) // max(1, self.arm_adjust_years)
+            rate = self.arm_reset_rate + adjustments * self.arm_rate_step
+            if self.arm_rate_cap is not None:
+                rate = min(rate, self.arm_rate_cap)
+            rates.append(max(rate, 0.0))
+        return rates
+
+
+@dataclass
+class AmortizationSchedule:
+    """Per-year loan totals; index 0 is the first loan year"""
+    payments: List[float]
+    interest: List[float]
+    principal: List[float]
+    balance: List[float]  # Balance at the end of each year
+
+    def scaled(self, factor: float) -> 'AmortizationSchedule':
+        return AmortizationSchedule(
+            payments=[v * factor for v in self.payments],
+            interest=[v * factor for v in self.interest],
+            principal=[v * factor for v in self.principal],
+            balance=[v * factor for v in self.balance]
+        )
+
+
+def amortization_schedule(loan_amount: float, terms: LoanTerms) -> AmortizationSchedule:
+    """
+    Build the yearly amortization schedule for a loan
+
+    Each year is priced in closed form (level payment at that year's rate over
+    the remaining term), so a 30-year loan costs 30 steps rather than 360.
+    """
+    schedule = AmortizationSchedule(payments=[], interest=[], principal=[], balance=[])
+    balance = loan_amount
+    total_months = terms.term_years * 12
+
+    for year, annual_rate in enumerate(terms.annual_rates()):
+        r = annual_rate / 12
+        remaining = total_months - year * 12
+
+        if balance <= 0:
+            payment_total, interest_total, end_balance = 0.0, 0.0, 0.0
+        elif year < terms.interest_only_years:
+            interest_total = balance * r * 12
+            payment_total = interest_total
+            end_balance = balance
+        else:
+            if r == 0:
+                payment = balance / remaining
+                end_balance = balance - payment * 12
+            else:
+                growth = (1 + r) ** remaining
+                payment = balance * r * growth / (growth - 1)
+                growth_year = (1 + r) ** 12
+                end_balance = balance * growth_year - payment * (growth_year - 1) / r
+
+            end_balance = max(end_balance, 0.0)
+            payment_total = payment * 12
+            interest_total = payment_total - (balance - end_balance)
+
+        schedule.payments.append(payment_total)
+        schedule.interest.append(interest_total)
+        schedule.principal.append(balance - end_balance)
+        schedule.balance.append(end_balance)
+        balance = end_balance
+
+    return schedule
+
+
+class FinancingEngine:
+    """Derives leveraged return metrics from a fixed set of loan terms"""
+
+    def __init__(self, terms: LoanTerms = None):
+        self.terms = terms or LoanTerms()
+        # Every amount in a schedule is proportional to the loan, so one
+        # schedule per $1 borrowed serves an entire batch
+        self.unit_schedule = amortization_schedule(1.0, self.terms)
+
+    def schedule_for(self, purchase_price: float) -> AmortizationSchedule:
+        """Full amortization schedule for a property at this price"""
+        return self.unit_schedule.scaled(self._loan_amount(purchase_price))
+
+    def analyze(self, purchase_price: float, noi: float) -> Dict:
+        """Financing metrics for one property"""
+        return self.analyze_batch([purchase_price], [noi])[0]
+
+    def analyze_batch(self, purchase_prices: Sequence[float], nois: Sequence[float]) -> List[Dict]:
+        """
+        Financing metrics for many properties sharing these terms
+
+        Returns one dict per property with loan_amount, cash_invested,
+        annual_debt_service, cash_on_cash_return (%), dscr,
+        equity_buildup_year1 and equity_buildup_5yr (principal repaid in the
+        first year and over the five-year hold).
+        """
+        unit = self.unit_schedule
+        hold = min(HOLD_YEARS, len(unit.balance))
+        debt_service_per_dollar = unit.payments[0] if unit.payments else 0.0
+        year1_principal_per_dollar = unit.principal[0] if unit.principal else 0.0
+        hold_principal_per_dollar = 1.0 - unit.balance[hold - 1] if hold else 0.0
+
+        results = []
+        for purchase_price, noi in zip(purchase_prices, nois):
+            loan_amount = self._loan_amount(purchase_price)
+            cash_invested = (
+                purchase_price * (self.terms.down_payment + self.terms.closing_costs)
+                + loan_amount * self.terms.points
+            )
+            debt_service = loan_amount * debt_service_per_dollar
+
+            results.append({
+                'loan_amount': loan_amount,
+                'cash_invested': cash_invested,
+                'annual_debt_service': debt_service,
+                'cash_on_cash_return': ((noi - debt_service) / cash_invested) * 100 if cash_invested > 0 else 0,
+                'dscr': noi / debt_service if debt_service > 0 else None,
+                'equity_buildup_year1': loan_amount * year1_principal_per_dollar,
+                'equity_buildup_5yr': loan_amount * hold_principal_per_dollar
+            })
+
+        return results
+
+    def _loan_amount(self, purchase_price: float) -> float:
+        return purchase_price * (1 - self.terms.down_payment)
@@ -0,0 +1,328 @@
+"""
+Offline geocoding of lead addresses
+Addresses are normalized and matched against a local gazetteer: TIGER-style
+street address ranges (interpolated along the segment) with ZIP centroids as
+the fallback. Results, misses included, are memoized in SQLite so each address
+is resolved once
+"""
+import csv
+import json
+import re
+import sqlite3
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from itertools import accumulate
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# "123", "123a" and Queens-style hyphenated "37-12"
+HOUSE_NUMBER_PATTERN = re.compile(r'^\s*(\d+)(?:-(\d+))?[a-z]?\b', re.IGNORECASE)
+
+# Street words reduced to the USPS abbreviations gazetteers use
+STREET_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'boulevard': 'blvd', 'road': 'rd',
+    'drive': 'dr', 'place': 'pl', 'lane': 'ln', 'court': 'ct', 'terrace': 'ter',
+    'parkway': 'pkwy', 'highway': 'hwy', 'expressway': 'expy', 'square': 'sq',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w', 'saint': 'st'
+}
+# Tokens that start a unit designator; they and everything after are dropped
+UNIT_WORDS = {'apt', 'apartment', 'unit', 'ste', 'suite', 'fl', 'floor', 'rm', 'room'}
+
+# Accepted gazetteer column names (matched case-insensitively)
+ZIP_COLUMNS = {
+    'zip': ('zip', 'zip_code', 'zcta', 'zcta5', 'geoid'),
+    'latitude': ('latitude', 'lat', 'intptlat'),
+    'longitude': ('longitude', 'lon', 'lng', 'intptlong')
+}
+RANGE_COLUMNS = {
+    'street': ('street', 'fullname', 'street_name'),
+    'zip': ('zip', 'zip_code'),
+    'from_number': ('from_number', 'fromhn', 'from_hn'),
+    'to_number': ('to_number', 'tohn', 'to_hn'),
+    'from_latitude': ('from_latitude', 'from_lat'),
+    'from_longitude': ('from_longitude', 'from_lon'),
+    'to_latitude': ('to_latitude', 'to_lat'),
+    'to_longitude': ('to_longitude', 'to_lon'),
+    'parity': ('parity',)
+}
+
+
+@dataclass(frozen=True)
+class GeocodeResult:
+    """Coordinates of an address and how they were found ('range' or 'zip')"""
+    latitude: float
+    longitude: float
+    match: str
+
+
+def street_key(street: str) -> str:
+    """Normalized street name: lowercase, abbreviated, unit designators dropped"""
+    words = []
+    for token in TOKEN_PATTERN.findall(street.lower()):
+        if token in UNIT_WORDS:
+            break
+        words.append(STREET_ABBREVIATIONS.get(token, token))
+    return ' '.join(words)
+
+
+def normalize_address(address: str) -> Tuple[Optional[int], str, Optional[str]]:
+    """(house number, street key, ZIP) of an address like "123 Main Street, Brooklyn, NY 11201" """
+    if not address:
+        return None, '', None
+
+    zip_matches = ZIP_PATTERN.findall(address)
+    street = address.split(',')[0].split('#')[0]
+
+    number = None
+    match = HOUSE_NUMBER_PATTERN.match(street)
+    if match:
+        number = int(match.group(1) + (match.group(2) or ''))
+        street = street[match.end():]
+
+    return number, street_key(street), zip_matches[-1] if zip_matches else None
+
+
+def _read_table(path: Path, aliases: Dict[str, Tuple[str, ...]], required: Sequence[str]):
+    """Rows of a CSV or tab-separated file as {field: value} using the alias table"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        header = f.readline()
+        f.seek(0)
+        reader = csv.DictReader(f, delimiter='\t' if '\t' in header else ',')
+        # Census gazetteer headers carry trailing padding
+        names = {name.strip().lower(): name for name in reader.fieldnames or []}
+        columns = {
+            field: next((names[alias] for alias in options if alias in names), None)
+            for field, options in aliases.items()
+        }
+
+        missing = [field for field in required if columns[field] is None]
+        if missing:
+            raise ValueError(f"{path} needs {', '.join(missing)} columns")
+
+        for row in reader:
+            yield {field: (row[column] or '').strip() for field, column in columns.items() if column}
+
+
+class Gazetteer:
+    """In-memory address-range and ZIP-centroid lookup tables"""
+
+    def __init__(self):
+        self.zip_centroids: Dict[str, Tuple[float, float]] = {}
+        # (street key, ZIP, parity) -> ranges sorted by low house number, with
+        # the low numbers and the running maximum of the high numbers alongside
+        # for bisection; parity is 0, 1 or None (both)
+        self.ranges: Dict[Tuple[str, str, Optional[int]], List[Tuple[int, int, int, float, float, float, float]]] = {}
+        self._range_lows: Dict[Tuple[str, str, Optional[int]], List[int]] = {}
+        self._range_reach: Dict[Tuple[str, str, Optional[int]], List[int]] = {}
+        self.sources: List[Path] = []
+
+    def __len__(self) -> int:
+        return len(self.zip_centroids) + sum(len(ranges) for ranges in self.ranges.values())
+
+    def load_zip_centroids(self, path: str) -> int:
+        """
+        Load ZIP centroids from CSV or a tab-separated Census ZCTA gazetteer file
+        (zip / GEOID, latitude / INTPTLAT, longitude / INTPTLONG columns)
+        """
+        path = Path(path)
+        loaded = 0
+        for row in _read_table(path, ZIP_COLUMNS, ('zip', 'latitude', 'longitude')):
+            try:
+                self.zip_centroids[row['zip'].zfill(5)] = (float(row['latitude']), float(row['longitude']))
+                loaded += 1
+            except ValueError:
+                continue
+
+        self.sources.append(path)
+        print(f"[Geocoder] Loaded {loaded} ZIP centroids from {path.name}")
+        return loaded
+
+    def load_address_ranges(self, path: str) -> int:
+        """
+        Load TIGER-style address ranges: one street segment per row with its
+        street name, ZIP, from/to house numbers and from/to coordinates; parity
+        (E, O or B) is inferred from the house numbers when absent
+        """
+        path = Path(path)
+        loaded = 0
+        for row in _read_table(path, RANGE_COLUMNS, tuple(field for field in RANGE_COLUMNS if field != 'parity')):
+            try:
+                from_number = int(float(row['from_number'].replace('-', '')))
+                to_number = int(float(row['to_number'].replace('-', '')))
+                segment = (
+                    float(row['from_latitude']), float(row['from_longitude']),
+                    float(row['to_latitude']), float(row['to_longitude'])
+                )
+            except ValueError:
+                continue
+
+            parity_code = row.get('parity', '').upper()[:1]
+            if parity_code in ('E', 'O'):
+                parity = 0 if parity_code == 'E' else 1
+            elif parity_code != 'B' and from_number % 2 == to_number % 2:
+                parity = from_number % 2
+            else:
+                parity = None
+
+            key = (street_key(row['street']), row['zip'].zfill(5) if row['zip'] else '', parity)
+            low, high = min(from_number, to_number), max(from_number, to_number)
+            self.ranges.setdefault(key, []).append((low, high, from_number, to_number, *segment))
+            loaded += 1
+
+        for key, ranges in self.ranges.items():
+            ranges.sort()
+            self._range_lows[key] = [r[0] for r in ranges]
+            self._range_reach[key] = list(accumulate((r[1] for r in ranges), max))
+
+        self.sources.append(path)
+        print(f"[Geocoder] Loaded {loaded} address ranges from {path.name}")
+        return loaded
+
+    def lookup(self, number: Optional[int], street: str, zip_code: Optional[str]) -> Optional[GeocodeResult]:
+        """Interpolated street position when a range covers the number, else the ZIP centroid"""
+        if number is not None and street:
+            for parity in (number % 2, None):
+                key = (street, zip_code or '', parity)
+                lows = self._range_lows.get(key)
+                if not lows:
+                    continue
+
+                # Ranges can overlap, so the one starting last below the number
+                # may end too early. The first range whose running maximum reaches
+                # the number is itself a covering range if it starts low enough
+                last = bisect_right(lows, number) - 1
+                position = bisect_left(self._range_reach[key], number, 0, last + 1)
+                if position <= last:
+                    low, high, from_number, to_number, lat1, lon1, lat2, lon2 = self.ranges[key][position]
+                    fraction = (number - from_number) / (to_number - from_number) if to_number != from_number else 0.5
+                    return GeocodeResult(lat1 + (lat2 - lat1) * fraction, lon1 + (lon2 - lon1) * fraction, 'range')
+
+        centroid = self.zip_centroids.get(zip_code) if zip_code else None
+        if centroid is not None:
+            return GeocodeResult(centroid[0], centroid[1], 'zip')
+        return None
+
+    def fingerprint(self) -> str:
+        """Identity of the loaded files, so memoized results are dropped when they change"""
+        return json.dumps([
+            [path.name, path.stat().st_size, path.stat().st_mtime_ns] for path in self.sources
+        ])
+
+
+class Geocoder:
+    """Gazetteer lookups behind a persistent memo cache"""
+
+    def __init__(self, gazetteer: Gazetteer, cache_path: str = None):
+        """
+        Args:
+            cache_path: SQLite file for memoized results; in memory when not given
+        """
+        self.gazetteer = gazetteer
+        self.hits = 0
+        self.misses = 0
+
+        if cache_path:
+            Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(cache_path or ':memory:')
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geocodes (
+                address TEXT PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                match TEXT
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        fingerprint = gazetteer.fingerprint()
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'gazetteer'").fetchone()
+        with self.conn:
+            if row is None or row[0] != fingerprint:
+                # Gazetteer files changed; earlier results (and misses) may be stale
+                self.conn.execute("DELETE FROM geocodes")
+                self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('gazetteer', ?)", (fingerprint,))
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['Geocoder']:
+        """Geocoder for the configured gazetteer files, None when none is configured"""
+        zip_path = config.get('zip_centroids_path')
+        ranges_path = config.get('address_ranges_path')
+        if not (zip_path or ranges_path):
+            return None
+
+        # Each file loads on its own, so one missing file does not disable the other
+        gazetteer = Gazetteer()
+        for path, load in ((zip_path, gazetteer.load_zip_centroids), (ranges_path, gazetteer.load_address_ranges)):
+            if path:
+                try:
+                    load(path)
+                except Exception as e:
+                    print(f"[Geocoder] Error loading gazetteer file {path}: {e}")
+
+        if not gazetteer.sources:
+            return None
+        return cls(gazetteer, config.get('cache_path'))
+
+    def geocode(self, address: str) -> Optional[GeocodeResult]:
+        return self.geocode_batch([address])[0]
+
+    def geocode_batch(self, addresses: Sequence[str], chunk_size: int = 500) -> List[Optional[GeocodeResult]]:
+        """
+        Geocode many addresses: memoized ones are read in chunks, the rest are
+        looked up and written back in one transaction
+        """
+        normalized = [normalize_address(address) for address in addresses]
+        keys = [self._cache_key(*parts) for parts in normalized]
+
+        known: Dict[str, Optional[GeocodeResult]] = {}
+        unique_keys = list(dict.fromkeys(key for key in keys if key))
+        for start in range(0, len(unique_keys), chunk_size):
+            chunk = unique_keys[start:start + chunk_size]
+            for key, latitude, longitude, match in self.conn.execute(
+                f"SELECT address, latitude, longitude, match FROM geocodes "
+                f"WHERE address IN ({', '.join('?' * len(chunk))})", chunk
+            ):
+                known[key] = None if latitude is None else GeocodeResult(latitude, longitude, match)
+        self.hits += len(known)
+
+        resolved: Dict[str, Optional[GeocodeResult]] = {}
+        for key, parts in zip(keys, normalized):
+            if key and key not in known and key not in resolved:
+                resolved[key] = self.gazetteer.lookup(*parts)
+        self.misses += len(resolved)
+
+        if resolved:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO geocodes (address, latitude, longitude, match) VALUES (?, ?, ?, ?)",
+                    (
+                        (key, *((result.latitude, result.longitude, result.match) if result else (None, None, None)))
+                        for key, result in resolved.items()
+                    )
+                )
+
+        known.update(resolved)
+        return [known.get(key) if key else None for key in keys]
+
+    @staticmethod
+    def _cache_key(number: Optional[int], street: str, zip_code: Optional[str]) -> str:
+        """Memo key shared by spellings that normalize alike; empty when there is nothing to look up"""
+        if not street and not zip_code:
+            return ''
+        return f"{'' if number is None else number}|{street}|{zip_code or ''}"
+
+    def stats(self) -> Dict:
+        """Memo hit/miss counters for this process plus the persisted size"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': self.conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()[0],
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,259 @@
+"""
+Geohash encoding and per-cell lead aggregates for hot-zone analytics
+A lead is encoded once at the finest precision; its coarser cells are prefixes
+of that code, so one encode feeds every resolution
+"""
+import math
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# numpy is optional; it vectorizes batch encoding and per-cell aggregation
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BASE32_INDEX = {char: i for i, char in enumerate(BASE32)}
+
+# Approximate cell sizes: 4 ~ 39x20 km, 5 ~ 4.9x4.9 km, 6 ~ 1.2x0.6 km, 7 ~ 153x153 m
+DEFAULT_PRECISIONS = (4, 5, 6, 7)
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """(longitude bits, latitude bits); longitude takes the extra bit when odd"""
+    total = precision * 5
+    return (total + 1) // 2, total // 2
+
+
+def _quantize(value: float, low: float, span: float, bits: int) -> int:
+    cells = 1 << bits
+    return min(cells - 1, max(0, int((value - low) / span * cells)))
+
+
+def encode(latitude: float, longitude: float, precision: int = 7) -> str:
+    """Geohash of a point"""
+    lon_bits, lat_bits = _bits(precision)
+    lon_q = _quantize(longitude, -180.0, 360.0, lon_bits)
+    lat_q = _quantize(latitude, -90.0, 180.0, lat_bits)
+
+    # Interleave, longitude first, most significant bit first
+    code = 0
+    for i in range(precision * 5):
+        if i % 2 == 0:
+            bit = (lon_q >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    return ''.join(BASE32[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def encode_batch(latitudes: Sequence[float], longitudes: Sequence[float], precision: int = 7) -> List[str]:
+    """Geohashes of many points"""
+    if not NUMPY_AVAILABLE:
+        return [encode(lat, lon, precision) for lat, lon in zip(latitudes, longitudes)]
+
+    lon_bits, lat_bits = _bits(precision)
+    lats = np.asarray(latitudes, dtype=np.float64)
+    lons = np.asarray(longitudes, dtype=np.float64)
+    lon_q = np.clip(((lons + 180.0) / 360.0 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    lat_q = np.clip(((lats + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+
+    code = np.zeros(len(lats), dtype=np.int64)
+    for i in range(precision * 5):
+        if i % 2 == 0:
+            bit = (lon_q >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (lat_q >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    alphabet = np.array(list(BASE32))
+    chars = [alphabet[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision)]
+    return [''.join(row) for row in zip(*chars)]
+
+
+def decode_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) bounds of a cell"""
+    precision = len(geohash)
+    lon_bits, lat_bits = _bits(precision)
+
+    code = 0
+    for char in geohash:
+        code = (code << 5) | BASE32_INDEX[char]
+
+    lon_q = lat_q = 0
+    for i in range(precision * 5):
+        bit = (code >> (precision * 5 - 1 - i)) & 1
+        if i % 2 == 0:
+            lon_q = (lon_q << 1) | bit
+        else:
+            lat_q = (lat_q << 1) | bit
+
+    lat_size, lon_size = cell_size(precision)
+    south = -90.0 + lat_q * lat_size
+    west = -180.0 + lon_q * lon_size
+    return south, west, south + lat_size, west + lon_size
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """(latitude, longitude) of a cell's center"""
+    south, west, north, east = decode_bbox(geohash)
+    return (south + north) / 2, (west + east) / 2
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(latitude degrees, longitude degrees) spanned by one cell"""
+    lon_bits, lat_bits = _bits(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def cell_count(south: float, west: float, north: float, east: float, precision: int) -> int:
+    """Number of cells at precision needed to cover a bounding box"""
+    lat_size, lon_size = cell_size(precision)
+    rows = math.floor((north + 90.0) / lat_size) - math.floor((south + 90.0) / lat_size) + 1
+    cols = math.floor((east + 180.0) / lon_size) - math.floor((west + 180.0) / lon_size) + 1
+    return max(0, rows) * max(0, cols)
+
+
+def viewport_precision(south: float, west: float, north: float, east: float,
+                       precisions: Sequence[int], max_cells: int = 256) -> int:
+    """Finest of precisions that covers a bounding box in at most max_cells cells"""
+    fitting = [p for p in precisions if cell_count(south, west, north, east, p) <= max_cells]
+    return max(fitting) if fitting else min(precisions)
+
+
+def lead_coordinates(lead: Any) -> Optional[Tuple[float, float]]:
+    """(latitude, longitude) of a geocoded lead, None when it has no usable coordinates"""
+    latitude = getattr(lead, 'latitude', None)
+    longitude = getattr(lead, 'longitude', None)
+    if latitude is None or longitude is None:
+        return None
+
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return None  # also rejects NaN
+    return latitude, longitude
+
+
+class GeoCellAggregates:
+    """Lead count, value and cap-rate sums per geohash cell at several precisions"""
+
+    def __init__(self, precisions: Iterable[int] = DEFAULT_PRECISIONS):
+        self.precisions = tuple(sorted(precisions))
+        # precision -> cell -> [lead_count, total_value, cap_rate_sum, cap_rate_count]
+        self.cells: Dict[int, Dict[str, List[float]]] = {p: {} for p in self.precisions}
+        self.lead_count = 0
+
+    def __len__(self) -> int:
+        """Leads aggregated"""
+        return self.lead_count
+
+    def add(self, latitude: float, longitude: float, value: Optional[float], cap_rate: Optional[float]):
+        self._add_code(encode(latitude, longitude, self.precisions[-1]), value, cap_rate)
+
+    def add_batch(self, latitudes: Sequence[float], longitudes: Sequence[float],
+                  values: Sequence[Optional[float]], cap_rates: Sequence[Optional[float]]):
+        """Aggregate many leads; each cell is updated once per batch"""
+        codes = encode_batch(latitudes, longitudes, self.precisions[-1])
+        if not codes:
+            return
+
+        if not NUMPY_AVAILABLE:
+            for code, value, cap_rate in zip(codes, values, cap_rates):
+                self._add_code(code, value, cap_rate)
+            return
+
+        self.lead_count += len(codes)
+        value_arr = np.array([v or 0.0 for v in values], dtype=np.float64)
+        cap_known = np.array([c is not None for c in cap_rates])
+        cap_arr = np.array([c if c is not None else 0.0 for c in cap_rates], dtype=np.float64)
+
+        for precision in self.precisions:
+            cells, inverse = np.unique([code[:precision] for code in codes], return_inverse=True)
+            counts = np.bincount(inverse, minlength=len(cells))
+            value_sums = np.bincount(inverse, weights=value_arr, minlength=len(cells))
+            cap_sums = np.bincount(inverse, weights=cap_arr, minlength=len(cells))
+            cap_counts = np.bincount(inverse, weights=cap_known, minlength=len(cells))
+
+            table = self.cells[precision]
+            for cell, count, value_sum, cap_sum, cap_count in zip(
+                    cells.tolist(), counts.tolist(), value_sums.tolist(), cap_sums.tolist(), cap_counts.tolist()):
+                stats = table.get(cell)
+                if stats is None:
+                    table[cell] = [count, value_sum, cap_sum, int(cap_count)]
+                else:
+                    stats[0] += count
+                    stats[1] += value_sum
+                    stats[2] += cap_sum
+                    stats[3] += int(cap_count)
+
+    def _add_code(self, code: str, value: Optional[float], cap_rate: Optional[float]):
+        self.lead_count += 1
+        for precision in self.precisions:
+            stats = self.cells[precision].get(code[:precision])
+            if stats is None:
+                stats = self.cells[precision][code[:precision]] = [0, 0.0, 0.0, 0]
+            stats[0] += 1
+            stats[1] += value or 0
+            if cap_rate is not None:
+                stats[2] += cap_rate
+                stats[3] += 1
+
+    def hot_zones(self, precision: int, limit: int = 5, min_leads: int = 1) -> List[Dict]:
+        """Cells with the best mean cap rate"""
+        zones = [
+            self.zone(cell, stats)
+            for cell, stats in self.cells[precision].items()
+            if stats[3] and stats[0] >= min_leads
+        ]
+        zones.sort(key=lambda zone: (-zone['avg_cap_rate'], zone['zone']))
+        return zones[:limit]
+
+    def viewport(self, south: float, west: float, north: float, east: float,
+                 precision: int) -> List[Dict]:
+        """Every non-empty cell at precision intersecting a bounding box, by geohash"""
+        table = self.cells[precision]
+        lat_size, lon_size = cell_size(precision)
+
+        if cell_count(south, west, north, east, precision) <= len(table):
+            # Small viewport: probe the covering cells directly
+            candidates = {}
+            row = 0
+            while south + row * lat_size < north + lat_size:
+                lat = min(south + row * lat_size, north)
+                col = 0
+                while west + col * lon_size < east + lon_size:
+                    candidates[encode(lat, min(west + col * lon_size, east), precision)] = None
+                    col += 1
+                row += 1
+            cells = ((cell, table[cell]) for cell in candidates if cell in table)
+        else:
+            # Large viewport: filter the populated cells instead
+            cells = (
+                (cell, stats) for cell, stats in table.items()
+                if self._intersects(decode_bbox(cell), south, west, north, east)
+            )
+
+        return [self.zone(cell, stats) for cell, stats in sorted(cells)]
+
+    @staticmethod
+    def _intersects(bbox: Tuple[float, float, float, float], south: float, west: float,
+                    north: float, east: float) -> bool:
+        # Cells are half-open, [south, north) x [west, east), as encode() assigns them
+        cell_south, cell_west, cell_north, cell_east = bbox
+        return cell_south <= north and cell_north > south and cell_west <= east and cell_east > west
+
+    @staticmethod
+    def zone(cell: str, stats: Sequence[float]) -> Dict:
+        """Hot-zone dict for one cell"""
+        count, total_value, cap_rate_sum, cap_rate_count = stats
+        latitude, longitude = decode(cell)
+        return {
+            'zone': cell,
+            'lead_count': int(count),
+            'avg_cap_rate': cap_rate_sum / cap_rate_count if cap_rate_count else 0.0,
+            'total_value': total_value,
+            'latitude': latitude,
+            'longitude': longitude
+        }
@@ -0,0 +1,506 @@
+"""
+Persistent SQLite backend for the knowledge base
+Leads live on disk (WAL mode) with an FTS5 index over their searchable text,
+so large knowledge bases open instantly and are not held in memory
+"""
+import json
+import math
+import sqlite3
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .geohash import DEFAULT_PRECISIONS, GeoCellAggregates, cell_size, decode, encode, lead_coordinates
+from .text import tokenize
+
+# Searchable fields of a lead, in FTS column order
+SEARCH_FIELDS = ('address', 'owner', 'tags', 'details')
+
+# Tokens come pre-split by utils.text.tokenize; keep its '.', '_' and "'"
+# characters inside tokens so "7.5" and "strong_buy" match as one term
+FTS_TOKENIZER = "unicode61 tokenchars '._'''"
+
+
+def search_texts(address: Optional[str], owner: Optional[str], tags: Sequence[str], source: Optional[str],
+                 estimated_value: Optional[float], roi_analysis: Optional[Dict]) -> Tuple[str, ...]:
+    """Text a lead can be found by, one string per SEARCH_FIELDS entry"""
+    details = [source or '', str(estimated_value or '')]
+
+    # Text values of the analysis (recommendation, details); the numeric
+    # metrics are matched through the high-ROI rule instead
+    details.extend(value for value in (roi_analysis or {}).values() if isinstance(value, str))
+
+    return address or '', owner or '', ' '.join(tags), ' '.join(details)
+
+
+class KnowledgeStore:
+    """Lead records, full-text index and embeddings in one SQLite file"""
+
+    def __init__(self, db_path: str, commit_interval: int = 500, field_weights: Sequence[float] = None,
+                 geo_precisions: Sequence[int] = DEFAULT_PRECISIONS, busy_timeout: float = 30.0):
+        """
+        Args:
+            commit_interval: Inserts are grouped into transactions of this many
+                rows; call commit() (or close()) to persist a partial group
+            field_weights: BM25 weight per SEARCH_FIELDS entry
+            geo_precisions: Geohash lengths to aggregate geocoded leads at
+            busy_timeout: Seconds to wait for another connection's write
+                transaction before failing with "database is locked"
+        """
+        self.db_path = Path(db_path)
+        self.commit_interval = commit_interval
+        self.field_weights = tuple(field_weights or (1.0,) * len(SEARCH_FIELDS))
+        self.geo_precisions = tuple(sorted(geo_precisions))
+        self._uncommitted = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=busy_timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS leads (
+                id INTEGER PRIMARY KEY,
+                address TEXT,
+                owner TEXT,
+                status TEXT,
+                source TEXT,
+                estimated_value REAL,
+                has_roi INTEGER NOT NULL DEFAULT 0,
+                cap_rate REAL,
+                area TEXT,
+                zone TEXT,
+                roi_analysis TEXT,
+                outreach_message TEXT,
+                lead_timestamp TEXT,
+                timestamp TEXT NOT NULL,
+                tags TEXT NOT NULL,
+                embedding BLOB,
+                latitude REAL,
+                longitude REAL
+            )
+        """)
+        lead_columns = {row[1] for row in self.conn.execute("PRAGMA table_info(leads)")}
+        for column in ('latitude', 'longitude'):
+            if column not in lead_columns:
+                # Store created before leads were geocoded
+                self.conn.execute(f"ALTER TABLE leads ADD COLUMN {column} REAL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_owner ON leads(owner)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_area ON leads(area)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_leads_cap_rate ON leads(cap_rate)")
+        self._create_fts()
+
+        # Running aggregates for insights, updated on every insert
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS zone_stats (
+                zone TEXT PRIMARY KEY,
+                lead_count INTEGER NOT NULL,
+                total_value REAL NOT NULL,
+                cap_rate_sum REAL NOT NULL,
+                cap_rate_count INTEGER NOT NULL,
+                first_id INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS owner_counts (
+                owner TEXT PRIMARY KEY,
+                lead_count INTEGER NOT NULL,
+                first_id INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_owner_counts_multi ON owner_counts(first_id) WHERE lead_count > 1"
+        )
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS totals (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                lead_count INTEGER NOT NULL,
+                total_value REAL NOT NULL,
+                cap_rate_sum REAL NOT NULL,
+                analyzed_count INTEGER NOT NULL,
+                owner_count INTEGER NOT NULL
+            )
+        """)
+        # Geocoded leads per geohash cell; latitude / longitude are the cell center
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS geo_cells (
+                precision INTEGER NOT NULL,
+                cell TEXT NOT NULL,
+                lead_count INTEGER NOT NULL,
+                total_value REAL NOT NULL,
+                cap_rate_sum REAL NOT NULL,
+                cap_rate_count INTEGER NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                PRIMARY KEY (precision, cell)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_geo_cells_center ON geo_cells(precision, latitude)")
+        self.conn.commit()
+
+        columns = tuple(d[0] for d in self.conn.execute("SELECT * FROM leads_fts LIMIT 0").description)
+        if columns != SEARCH_FIELDS:
+            # Index built with an older field layout
+            self.rebuild_fts()
+
+        # rank (used for ORDER BY rank) is persisted; keep it on the configured weights.
+        # Only written when it changes, so opening a store another connection is
+        # writing to does not have to wait for its transaction
+        rank = f"bm25({', '.join(str(float(w)) for w in self.field_weights)})"
+        stored_rank = self.conn.execute("SELECT v FROM leads_fts_config WHERE k = 'rank'").fetchone()
+        if stored_rank is None or stored_rank[0] != rank:
+            with self.conn:
+                self.conn.execute("INSERT INTO leads_fts (leads_fts, rank) VALUES ('rank', ?)", (rank,))
+
+        if self.conn.execute("SELECT 1 FROM totals").fetchone() is None:
+            # Store created before the aggregates existed
+            self.rebuild_aggregates()
+        else:
+            stored = {row[0] for row in self.conn.execute("SELECT DISTINCT precision FROM geo_cells")}
+            geocoded = self.conn.execute("SELECT 1 FROM leads WHERE latitude IS NOT NULL LIMIT 1").fetchone()
+            if stored != set(self.geo_precisions) and (stored or geocoded):
+                # Cells aggregated at other precisions (or not at all)
+                self.rebuild_geo_cells()
+
+        self.count = self.conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM leads").fetchone()[0]
+
+    def _create_fts(self):
+        # Contentless: the text is only needed for matching, the row holds the data
+        self.conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+                {', '.join(SEARCH_FIELDS)}, content='', tokenize="{FTS_TOKENIZER}"
+            )
+        """)
+        # Per-term document counts, for normalizing BM25 scores
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts_vocab USING fts5vocab(leads_fts, 'row')"
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, entry_id: int, lead: Any, timestamp: str, tags: List[str], area: str,
+            zone: Optional[str], texts: Sequence[str]):
+        """
+        Insert one lead
+
+        Args:
+            texts: Searchable text per SEARCH_FIELDS entry (see search_texts)
+        """
+        roi = lead.roi_analysis or {}
+        cap_rate = roi.get('cap_rate')
+        value = lead.estimated_value or 0
+        coordinates = lead_coordinates(lead)
+
+        self.conn.execute(
+            "INSERT INTO leads (id, address, owner, status, source, estimated_value, has_roi, "
+            "cap_rate, area, zone, roi_analysis, outreach_message, lead_timestamp, timestamp, tags, "
+            "latitude, longitude) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry_id, lead.address, lead.owner, lead.status.value, lead.source,
+                lead.estimated_value, 1 if roi else 0, cap_rate,
+                area or None, zone,
+                json.dumps(lead.roi_analysis, default=str) if lead.roi_analysis is not None else None,
+                lead.outreach_message, lead.timestamp, timestamp, json.dumps(tags),
+                *(coordinates or (None, None))
+            )
+        )
+        self._index_text(entry_id, texts)
+
+        if zone is not None:
+            self.conn.execute(
+                "INSERT INTO zone_stats (zone, lead_count, total_value, cap_rate_sum, cap_rate_count, first_id) "
+                "VALUES (?, 1, ?, ?, ?, ?) "
+                "ON CONFLICT(zone) DO UPDATE SET lead_count = lead_count + 1, "
+                "total_value = total_value + excluded.total_value, "
+                "cap_rate_sum = cap_rate_sum + excluded.cap_rate_sum, "
+                "cap_rate_count = cap_rate_count + excluded.cap_rate_count",
+                (zone, value, cap_rate or 0, 0 if cap_rate is None else 1, entry_id)
+            )
+
+        if coordinates is not None:
+            code = encode(*coordinates, precision=self.geo_precisions[-1])
+            self._upsert_geo_cells(
+                (precision, code[:precision], 1, value, cap_rate or 0, 0 if cap_rate is None else 1)
+                for precision in self.geo_precisions
+            )
+
+        new_owner = self.conn.execute(
+            "INSERT OR IGNORE INTO owner_counts (owner, lead_count, first_id) VALUES (?, 1, ?)",
+            (lead.owner, entry_id)
+        ).rowcount == 1
+        if not new_owner:
+            self.conn.execute("UPDATE owner_counts SET lead_count = lead_count + 1 WHERE owner = ?", (lead.owner,))
+
+        self.conn.execute(
+            "UPDATE totals SET lead_count = lead_count + 1, total_value = total_value + ?, "
+            "cap_rate_sum = cap_rate_sum + ?, analyzed_count = analyzed_count + ?, "
+            "owner_count = owner_count + ? WHERE id = 0",
+            (value, (cap_rate or 0) if roi else 0, 1 if roi else 0, 1 if new_owner else 0)
+        )
+        self.count = max(self.count, entry_id + 1)
+        self._written(1)
+
+    def set_embeddings(self, entry_ids: Sequence[int], vectors: array, dim: int):
+        """Store one row-major float32 vector per entry"""
+        self.conn.executemany(
+            "UPDATE leads SET embedding = ? WHERE id = ?",
+            (
+                (vectors[row * dim:(row + 1) * dim].tobytes(), entry_id)
+                for row, entry_id in enumerate(entry_ids)
+            )
+        )
+        self._written(len(entry_ids))
+
+    def iter_embeddings(self, dim: int, batch_size: int = 4096) -> Iterator[array]:
+        """
+        Stored vectors in ID order as row-major chunks; entries without one
+        (added while semantic search was off) come back as zero vectors
+        """
+        zero = bytes(4 * dim)
+        cursor = self.conn.execute("SELECT embedding FROM leads ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            chunk = array('f')
+            chunk.frombytes(b''.join(row[0] or zero for row in rows))
+            yield chunk
+
+    def search(self, tokens: Sequence[str], limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """
+        (entry ID, BM25 score) of entries containing any of tokens, best first
+
+        Args:
+            limit: Top-k to return; SQLite keeps only the best k while sorting.
+                None returns every match
+        """
+        # Double-quoted so tokens are plain terms, never FTS5 syntax
+        expression = ' OR '.join('"' + token.replace('"', '""') + '"' for token in tokens)
+        sql = "SELECT rowid, -rank FROM leads_fts WHERE leads_fts MATCH ? ORDER BY rank, rowid"
+        params = [expression]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return self.conn.execute(sql, params).fetchall()
+
+    def max_bm25(self, tokens: Sequence[str], k1: float = 1.2) -> float:
+        """Upper bound of a search() score for these tokens, for normalizing it to 0..1"""
+        if not self.count:
+            return 0.0
+
+        placeholders = ', '.join('?' * len(tokens))
+        doc_freqs = dict(self.conn.execute(
+            f"SELECT term, doc FROM leads_fts_vocab WHERE term IN ({placeholders})", list(tokens)
+        ))
+
+        bound = 0.0
+        for token in tokens:
+            if token in doc_freqs:
+                # FTS5's idf, including its floor for terms in most documents
+                idf = math.log((self.count - doc_freqs[token] + 0.5) / (doc_freqs[token] + 0.5))
+                bound += max(idf, 1e-6) * (k1 + 1)
+        return bound
+
+    def high_roi_ids(self, min_cap_rate: float = 7) -> List[int]:
+        return [row[0] for row in self.conn.execute(
+            "SELECT id FROM leads WHERE cap_rate >= ? ORDER BY id", (min_cap_rate,)
+        )]
+
+    def get(self, entry_id: int) -> Optional[Dict]:
+        """Summary fields of one entry"""
+        row = self.conn.execute(
+            "SELECT address, owner, status, estimated_value, COALESCE(cap_rate, 0), tags "
+            "FROM leads WHERE id = ?", (entry_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        return {
+            'address': row[0],
+            'owner': row[1],
+            'status': row[2],
+            'estimated_value': row[3],
+            'cap_rate': row[4],
+            'tags': json.loads(row[5])
+        }
+
+    def related_addresses(self, entry_id: int, limit: int) -> List[str]:
+        """Same-owner then same-area relationships, in insertion order"""
+        row = self.conn.execute("SELECT owner, area FROM leads WHERE id = ?", (entry_id,)).fetchone()
+        if row is None:
+            return []
+        owner, area = row
+
+        relationships = [
+            f"same_owner:{address}" for (address,) in self.conn.execute(
+                "SELECT address FROM leads WHERE owner = ? AND id != ? ORDER BY id LIMIT ?",
+                (owner, entry_id, limit)
+            )
+        ]
+
+        if area and len(relationships) < limit:
+            relationships.extend(
+                f"same_area:{address}" for (address,) in self.conn.execute(
+                    "SELECT address FROM leads WHERE area = ? AND id != ? ORDER BY id LIMIT ?",
+                    (area, entry_id, limit - len(relationships))
+                )
+            )
+
+        return relationships
+
+    def zone_stats(self) -> Dict[str, Dict]:
+        """Per-zone lead count, value and cap-rate accumulators, in first-seen order"""
+        return {
+            zone: {
+                'lead_count': lead_count,
+                'total_value': total_value,
+                'cap_rate_sum': cap_rate_sum,
+                'cap_rate_count': cap_rate_count
+            }
+            for zone, lead_count, total_value, cap_rate_sum, cap_rate_count in self.conn.execute(
+                "SELECT zone, lead_count, total_value, cap_rate_sum, cap_rate_count "
+                "FROM zone_stats ORDER BY first_id"
+            )
+        }
+
+    def geo_hot_zones(self, precision: int, limit: int = 5, min_leads: int = 1) -> List[Dict]:
+        """Cells with the best mean cap rate (see GeoCellAggregates.hot_zones)"""
+        return [
+            GeoCellAggregates.zone(row[0], row[1:]) for row in self.conn.execute(
+                "SELECT cell, lead_count, total_value, cap_rate_sum, cap_rate_count FROM geo_cells "
+                "WHERE precision = ? AND cap_rate_count > 0 AND lead_count >= ? "
+                "ORDER BY cap_rate_sum / cap_rate_count DESC, cell LIMIT ?",
+                (precision, min_leads, limit)
+            )
+        ]
+
+    def geo_viewport(self, south: float, west: float, north: float, east: float,
+                     precision: int) -> List[Dict]:
+        """Non-empty cells intersecting a bounding box (see GeoCellAggregates.viewport)"""
+        # A half-open cell intersects the box when its center is within half a cell of it
+        lat_half, lon_half = (size / 2 for size in cell_size(precision))
+        return [
+            GeoCellAggregates.zone(row[0], row[1:]) for row in self.conn.execute(
+                "SELECT cell, lead_count, total_value, cap_rate_sum, cap_rate_count FROM geo_cells "
+                "WHERE precision = ? AND latitude > ? AND latitude <= ? AND longitude > ? AND longitude <= ? "
+                "ORDER BY cell",
+                (precision, south - lat_half, north + lat_half, west - lon_half, east + lon_half)
+            )
+        ]
+
+    def geocoded_count(self) -> int:
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(lead_count), 0) FROM geo_cells WHERE precision = ?", (self.geo_precisions[0],)
+        ).fetchone()
+        return row[0]
+
+    def multi_property_owners(self) -> Dict[str, int]:
+        return dict(self.conn.execute(
+            "SELECT owner, lead_count FROM owner_counts WHERE lead_count > 1 ORDER BY first_id"
+        ))
+
+    def totals(self) -> Dict:
+        """Lead count, value and cap-rate sums, analyzed lead and unique owner counts"""
+        row = self.conn.execute(
+            "SELECT lead_count, total_value, cap_rate_sum, analyzed_count, owner_count FROM totals WHERE id = 0"
+        ).fetchone()
+        return dict(zip(('lead_count', 'total_value', 'cap_rate_sum', 'analyzed_count', 'owner_count'), row))
+
+    def rebuild_aggregates(self):
+        """Recompute the insight aggregates from the lead rows"""
+        with self.conn:
+            self.conn.execute("DELETE FROM zone_stats")
+            self.conn.execute("DELETE FROM owner_counts")
+            self.conn.execute("DELETE FROM totals")
+            self.conn.execute("""
+                INSERT INTO zone_stats
+                SELECT zone, COUNT(*), COALESCE(SUM(estimated_value), 0), COALESCE(SUM(cap_rate), 0),
+                       COUNT(cap_rate), MIN(id)
+                FROM leads WHERE zone IS NOT NULL GROUP BY zone
+            """)
+            self.conn.execute("""
+                INSERT INTO owner_counts SELECT owner, COUNT(*), MIN(id) FROM leads GROUP BY owner
+            """)
+            self.conn.execute("""
+                INSERT INTO totals
+                SELECT 0, COUNT(*), COALESCE(SUM(estimated_value), 0),
+                       COALESCE(SUM(CASE WHEN has_roi THEN COALESCE(cap_rate, 0) END), 0),
+                       COALESCE(SUM(has_roi), 0), (SELECT COUNT(*) FROM owner_counts)
+                FROM leads
+            """)
+            self._rebuild_geo_cells()
+        self._uncommitted = 0
+
+    def rebuild_geo_cells(self):
+        """Recompute the geohash cell aggregates from the lead rows"""
+        with self.conn:
+            self._rebuild_geo_cells()
+        self._uncommitted = 0
+
+    def _rebuild_geo_cells(self):
+        self.conn.execute("DELETE FROM geo_cells")
+        aggregates = GeoCellAggregates(self.geo_precisions)
+        cursor = self.conn.execute(
+            "SELECT latitude, longitude, estimated_value, cap_rate FROM leads WHERE latitude IS NOT NULL"
+        )
+        while True:
+            rows = cursor.fetchmany(4096)
+            if not rows:
+                break
+            aggregates.add_batch(*zip(*rows))
+
+        self._upsert_geo_cells(
+            (precision, cell, *stats)
+            for precision, cells in aggregates.cells.items()
+            for cell, stats in cells.items()
+        )
+
+    def _upsert_geo_cells(self, rows: Iterable[Tuple]):
+        """Fold (precision, cell, lead_count, total_value, cap_rate_sum, cap_rate_count) into geo_cells"""
+        self.conn.executemany(
+            "INSERT INTO geo_cells (precision, cell, lead_count, total_value, cap_rate_sum, cap_rate_count, "
+            "latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(precision, cell) DO UPDATE SET lead_count = lead_count + excluded.lead_count, "
+            "total_value = total_value + excluded.total_value, "
+            "cap_rate_sum = cap_rate_sum + excluded.cap_rate_sum, "
+            "cap_rate_count = cap_rate_count + excluded.cap_rate_count",
+            ((*row, *decode(row[1])) for row in rows)
+        )
+
+    def rebuild_fts(self):
+        """Recreate the full-text index from the lead rows"""
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS leads_fts_vocab")
+            self.conn.execute("DROP TABLE IF EXISTS leads_fts")
+            self._create_fts()
+
+            rows = self.conn.execute(
+                "SELECT id, address, owner, tags, source, estimated_value, roi_analysis FROM leads"
+            ).fetchall()
+            for entry_id, address, owner, tags, source, value, roi_analysis in rows:
+                texts = search_texts(address, owner, json.loads(tags), source, value,
+                                     json.loads(roi_analysis) if roi_analysis else None)
+                self._index_text(entry_id, texts)
+        self._uncommitted = 0
+
+    def _index_text(self, entry_id: int, texts: Sequence[str]):
+        self.conn.execute(
+            f"INSERT INTO leads_fts (rowid, {', '.join(SEARCH_FIELDS)}) "
+            f"VALUES (?, {', '.join('?' * len(SEARCH_FIELDS))})",
+            (entry_id, *(' '.join(tokenize(text)) for text in texts))
+        )
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+    def _written(self, rows: int):
+        self._uncommitted += rows
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
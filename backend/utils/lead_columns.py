@@ -0,0 +1,241 @@
+"""
+Compact columnar storage for leads
+Numeric fields live in typed arrays, strings are packed into one buffer, and
+repeated values (status, source, tags) are interned. Outreach messages and ROI
+analyses are spilled to disk and loaded only when a record asks for them.
+"""
+import json
+import math
+import tempfile
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterator, List, Optional, Sequence
+
+from .geohash import lead_coordinates
+
+MISSING = float('nan')
+
+# Timestamps are kept as integer microseconds since this naive epoch, so they
+# round-trip exactly; NO_TIMESTAMP marks ones kept as raw strings instead
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+NO_TIMESTAMP = -(2 ** 63)
+
+
+class _Interned:
+    """Small table of repeated values, referenced by index"""
+
+    def __init__(self):
+        self.values: List[Any] = []
+        self.ids: Dict[Hashable, int] = {}
+
+    def id_of(self, value: Hashable) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return value_id
+
+
+class _PackedStrings:
+    """Strings stored back to back as UTF-8 in one buffer"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.ends = array('Q')
+
+    def append(self, value: str):
+        self.data += value.encode('utf-8')
+        self.ends.append(len(self.data))
+
+    def __getitem__(self, index: int) -> str:
+        start = self.ends[index - 1] if index else 0
+        return self.data[start:self.ends[index]].decode('utf-8')
+
+    def nbytes(self) -> int:
+        return len(self.data) + self.ends.itemsize * len(self.ends)
+
+
+class LeadRecord:
+    """
+    Read-only view of one stored lead with the attributes of a Lead;
+    roi_analysis and outreach_message are read from disk on access
+    """
+    __slots__ = ('_columns', 'id')
+
+    def __init__(self, columns: 'LeadColumns', entry_id: int):
+        self._columns = columns
+        self.id = entry_id
+
+    @property
+    def address(self) -> str:
+        return self._columns.addresses[self.id]
+
+    @property
+    def owner(self) -> str:
+        return self._columns.owners[self.id]
+
+    @property
+    def status(self) -> Any:
+        return self._columns.statuses.values[self._columns.status_ids[self.id]]
+
+    @property
+    def source(self) -> Optional[str]:
+        return self._columns.sources.values[self._columns.source_ids[self.id]]
+
+    @property
+    def estimated_value(self) -> Optional[float]:
+        value = self._columns.estimated_values[self.id]
+        return None if math.isnan(value) else value
+
+    @property
+    def cap_rate(self) -> Optional[float]:
+        value = self._columns.cap_rates[self.id]
+        return None if math.isnan(value) else value
+
+    @property
+    def latitude(self) -> Optional[float]:
+        value = self._columns.latitudes[self.id]
+        return None if math.isnan(value) else value
+
+    @property
+    def longitude(self) -> Optional[float]:
+        value = self._columns.longitudes[self.id]
+        return None if math.isnan(value) else value
+
+    @property
+    def tags(self) -> List[str]:
+        return list(self._columns.tag_sets.values[self._columns.tag_ids[self.id]])
+
+    @property
+    def timestamp(self) -> Optional[str]:
+        return self._columns.timestamp(self.id)
+
+    @property
+    def roi_analysis(self) -> Optional[Dict]:
+        return self._columns.load_spilled(self.id)[0]
+
+    @property
+    def outreach_message(self) -> Optional[str]:
+        return self._columns.load_spilled(self.id)[1]
+
+    def __repr__(self) -> str:
+        return f"LeadRecord(id={self.id}, address={self.address!r}, owner={self.owner!r})"
+
+
+class LeadColumns:
+    """Append-only columnar lead table"""
+
+    def __init__(self, spill_dir: str = None):
+        """
+        Args:
+            spill_dir: Directory for the roi_analysis / outreach_message
+                payloads; each table spills to its own anonymous temporary
+                file there (the system temp directory when not given)
+        """
+        self.addresses = _PackedStrings()
+        self.owners = _PackedStrings()
+        # 16-bit codes, widened to 32 bits once a column has more distinct values
+        self.statuses = _Interned()
+        self.status_ids = array('H')
+        self.sources = _Interned()
+        self.source_ids = array('H')
+        self.tag_sets = _Interned()
+        self.tag_ids = array('I')
+
+        self.estimated_values = array('d')
+        self.cap_rates = array('d')  # NaN when the analysis has no cap rate
+        self.latitudes = array('d')  # NaN when the lead is not geocoded
+        self.longitudes = array('d')
+        self.timestamps = array('q')
+        self._raw_timestamps: Dict[int, str] = {}
+
+        # Byte offset of each lead's spilled payload, -1 when it has none
+        self.spill_offsets = array('q')
+        if spill_dir:
+            Path(spill_dir).mkdir(parents=True, exist_ok=True)
+        self._spill = tempfile.TemporaryFile(dir=spill_dir)
+
+    def __len__(self) -> int:
+        return len(self.spill_offsets)
+
+    def __getitem__(self, entry_id: int) -> LeadRecord:
+        if not 0 <= entry_id < len(self):
+            raise IndexError(entry_id)
+        return LeadRecord(self, entry_id)
+
+    def __iter__(self) -> Iterator[LeadRecord]:
+        return (LeadRecord(self, entry_id) for entry_id in range(len(self)))
+
+    def append(self, lead: Any, tags: Sequence[str] = ()) -> LeadRecord:
+        """Store a Lead (or anything with its attributes); returns its view"""
+        entry_id = len(self)
+
+        self.addresses.append(lead.address or '')
+        self.owners.append(lead.owner or '')
+        self._append_code('status_ids', self.statuses.id_of(lead.status))
+        self._append_code('source_ids', self.sources.id_of(lead.source))
+        self.tag_ids.append(self.tag_sets.id_of(tuple(tags)))
+
+        roi = lead.roi_analysis
+        self.estimated_values.append(MISSING if lead.estimated_value is None else lead.estimated_value)
+        self.cap_rates.append(roi['cap_rate'] if roi and roi.get('cap_rate') is not None else MISSING)
+        latitude, longitude = lead_coordinates(lead) or (MISSING, MISSING)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+        self.timestamps.append(self._parse_timestamp(entry_id, lead.timestamp))
+
+        if roi is None and lead.outreach_message is None:
+            self.spill_offsets.append(-1)
+        else:
+            self._spill.seek(0, 2)
+            self.spill_offsets.append(self._spill.tell())
+            self._spill.write(json.dumps([roi, lead.outreach_message], default=str).encode('utf-8') + b'\n')
+
+        return LeadRecord(self, entry_id)
+
+    def _append_code(self, column: str, code: int):
+        """Append an interned value's code, widening the column when the code outgrows it"""
+        codes = getattr(self, column)
+        if code > 0xFFFF and codes.typecode == 'H':
+            codes = array('I', codes)
+            setattr(self, column, codes)
+        codes.append(code)
+
+    def load_spilled(self, entry_id: int) -> List:
+        """[roi_analysis, outreach_message] of one lead"""
+        offset = self.spill_offsets[entry_id]
+        if offset < 0:
+            return [None, None]
+
+        self._spill.seek(offset)
+        return json.loads(self._spill.readline())
+
+    def timestamp(self, entry_id: int) -> Optional[str]:
+        value = self.timestamps[entry_id]
+        if value == NO_TIMESTAMP:
+            return self._raw_timestamps.get(entry_id)
+        return (EPOCH + value * MICROSECOND).isoformat()
+
+    def _parse_timestamp(self, entry_id: int, timestamp: Optional[str]) -> int:
+        if timestamp:
+            try:
+                parsed = datetime.fromisoformat(timestamp)
+                # Only plain naive ISO strings, which isoformat() reproduces exactly
+                if parsed.tzinfo is None and parsed.isoformat() == timestamp:
+                    return (parsed - EPOCH) // MICROSECOND
+            except (TypeError, ValueError):
+                pass
+            self._raw_timestamps[entry_id] = timestamp
+        return NO_TIMESTAMP
+
+    def nbytes(self) -> int:
+        """Approximate in-memory size of the columns (spilled payloads excluded)"""
+        arrays = (self.status_ids, self.source_ids, self.tag_ids, self.estimated_values,
+                  self.cap_rates, self.latitudes, self.longitudes, self.timestamps, self.spill_offsets)
+        return (self.addresses.nbytes() + self.owners.nbytes()
+                + sum(a.itemsize * len(a) for a in arrays))
+
+    def close(self):
+        self._spill.close()
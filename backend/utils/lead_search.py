@@ -0,0 +1,223 @@
+"""
+Persistent search index over project leads
+Text fields go into an FTS5 index with prefix support and numeric fields
+(estimated value, ROI metrics) into a (field, value) B-tree, so queries like
+'atlan* owner:smith cap_rate>7' never open the lead files; searches return
+lead IDs, which the project manager resolves against its segment store
+"""
+import re
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .knowledge_store import FTS_TOKENIZER
+from .text import tokenize
+
+# Indexed text columns; 'field:value' filters may name any of them
+TEXT_FIELDS = ('address', 'owner', 'status', 'source', 'notes', 'roi', 'other')
+
+# Nested analyses whose fields are indexed as if they were top-level
+ROI_KEYS = ('roi_analysis', 'roi')
+# Bookkeeping values that are never searched
+SKIPPED_KEYS = {'saved_at', 'timestamp', 'created_at', 'project', '_id'}
+
+NUMERIC_OPERATORS = {'>': '>', '>=': '>=', '<': '<', '<=': '<=', '=': '=', '==': '='}
+
+QUERY_PATTERN = re.compile(
+    r'(?P<num_field>\w+)\s*(?P<op>>=|<=|==|>|<|=)\s*(?P<number>-?\d+(?:\.\d+)?)'
+    r'|(?P<field>\w+):(?:"(?P<field_phrase>[^"]*)"|(?P<field_value>\S+))'
+    r'|"(?P<phrase>[^"]*)"'
+    r'|(?P<term>\S+)'
+)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def index_fields(lead: Dict) -> Tuple[Tuple[str, ...], List[Tuple[str, float]]]:
+    """(text per TEXT_FIELDS column, [(numeric field, value)]) of a lead"""
+    texts = {field: [] for field in TEXT_FIELDS}
+    numbers: Dict[str, float] = {}
+
+    def add_text(column: str, value):
+        if isinstance(value, str):
+            texts[column].append(value)
+        elif isinstance(value, (list, tuple)):
+            texts[column].extend(item for item in value if isinstance(item, str))
+
+    for key, value in lead.items():
+        if key in SKIPPED_KEYS:
+            continue
+        if key in ROI_KEYS and isinstance(value, dict):
+            for roi_key, roi_value in value.items():
+                if _is_number(roi_value):
+                    # Top-level fields win over the analysis copy
+                    numbers.setdefault(roi_key.lower(), float(roi_value))
+                else:
+                    add_text('roi', roi_value)
+        elif _is_number(value):
+            # Lowercased like the field names in queries
+            numbers[key.lower()] = float(value)
+        else:
+            add_text(key if key in texts and key not in ('roi', 'other') else 'other', value)
+
+    return tuple(' '.join(texts[field]) for field in TEXT_FIELDS), list(numbers.items())
+
+
+def parse_query(query: str) -> Tuple[str, List[Tuple[str, str, float]]]:
+    """
+    Split a query into an FTS5 expression and numeric filters
+
+    Words match as prefixes in any text field, "quoted words" as a phrase,
+    field:value only in that field, and field>number (>=, <, <=, =) compares a
+    numeric field. All parts must match; a field:value whose field is not
+    indexed is searched as plain words
+    """
+    clauses = []
+    numeric = []
+
+    for match in QUERY_PATTERN.finditer(query):
+        if match.group('num_field'):
+            numeric.append((match.group('num_field').lower(), NUMERIC_OPERATORS[match.group('op')],
+                            float(match.group('number'))))
+            continue
+
+        column = match.group('field')
+        if column is not None and column.lower() in TEXT_FIELDS:
+            column = column.lower()
+            phrase, value = match.group('field_phrase'), match.group('field_value')
+        else:
+            column = None
+            phrase = match.group('phrase')
+            value = match.group(0) if match.group('field') else match.group('term')
+
+        if phrase is not None:
+            tokens = tokenize(phrase)
+            expressions = ['"' + ' '.join(tokens) + '"'] if tokens else []
+        else:
+            expressions = ['"' + token + '"*' for token in tokenize(value)]
+
+        for expression in expressions:
+            clauses.append(f"{column} : {expression}" if column else expression)
+
+    return ' AND '.join(clauses), numeric
+
+
+class LeadSearchIndex:
+    """FTS5 text index and numeric field index of lead IDs in one SQLite file"""
+
+    def __init__(self, db_path: str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Shared with the project manager's writer thread, which serializes access
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+
+        columns = tuple(d[0] for d in self.conn.execute("SELECT * FROM leads LIMIT 0").description)
+        if columns != ('id',):
+            # Index built when it kept a copy of each lead; re-indexed from the store
+            self.clear()
+
+    def _create_tables(self):
+        self.conn.execute("CREATE TABLE IF NOT EXISTS leads (id INTEGER PRIMARY KEY)")
+        # Contentless: matching only needs the tokens, the leads live in the segment store
+        self.conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+                {', '.join(TEXT_FIELDS)}, content='', tokenize="{FTS_TOKENIZER}", prefix='2 3'
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS lead_numbers (
+                field TEXT NOT NULL,
+                value REAL NOT NULL,
+                id INTEGER NOT NULL,
+                PRIMARY KEY (field, value, id)
+            ) WITHOUT ROWID
+        """)
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+    def next_id(self) -> int:
+        """One past the highest indexed lead ID"""
+        return self.conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM leads").fetchone()[0]
+
+    def add_many(self, leads: Iterable[Tuple[int, Dict]]) -> int:
+        """Index (lead ID, lead) pairs in one transaction, returning how many were added"""
+        added = 0
+        with self.conn:
+            for lead_id, lead in leads:
+                texts, numbers = index_fields(lead)
+                self.conn.execute("INSERT INTO leads (id) VALUES (?)", (lead_id,))
+                self._write_text(lead_id, texts)
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO lead_numbers (field, value, id) VALUES (?, ?, ?)",
+                    ((field, value, lead_id) for field, value in numbers)
+                )
+                added += 1
+        return added
+
+    def remove(self, lead_id: int, lead: Dict) -> bool:
+        """
+        Drop a lead from the index; lead must be the record as it was indexed,
+        since the contentless text index can only delete the tokens it is given
+        """
+        with self.conn:
+            if self.conn.execute("DELETE FROM leads WHERE id = ?", (lead_id,)).rowcount == 0:
+                return False
+            texts, numbers = index_fields(lead)
+            self._write_text(lead_id, texts, command='delete')
+            self.conn.executemany(
+                "DELETE FROM lead_numbers WHERE field = ? AND value = ? AND id = ?",
+                ((field, value, lead_id) for field, value in numbers)
+            )
+        return True
+
+    def _write_text(self, lead_id: int, texts: Tuple[str, ...], command: str = None):
+        """Add a lead's tokens to the text index, or remove them with command='delete'"""
+        columns = ('leads_fts, ' if command else '') + 'rowid, ' + ', '.join(TEXT_FIELDS)
+        values = ('?, ' if command else '') + '?, ' + ', '.join('?' * len(TEXT_FIELDS))
+        self.conn.execute(
+            f"INSERT INTO leads_fts ({columns}) VALUES ({values})",
+            ((command,) if command else ()) + (lead_id, *(' '.join(tokenize(text)) for text in texts))
+        )
+
+    def clear(self):
+        """Drop every indexed lead, leaving an empty index to fill again"""
+        with self.conn:
+            for table in ('leads', 'leads_fts', 'lead_numbers'):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._create_tables()
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[int]:
+        """
+        IDs of the leads matching every part of query (see parse_query), newest
+        first. An empty query matches every lead
+        """
+        expression, numeric = parse_query(query)
+
+        conditions = []
+        params: List = []
+        if expression:
+            conditions.append("id IN (SELECT rowid FROM leads_fts WHERE leads_fts MATCH ?)")
+            params.append(expression)
+        for field, operator, value in numeric:
+            conditions.append(f"id IN (SELECT id FROM lead_numbers WHERE field = ? AND value {operator} ?)")
+            params.extend((field, value))
+
+        sql = "SELECT id FROM leads"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [lead_id for (lead_id,) in self.conn.execute(sql, params)]
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,139 @@
+"""
+Location feature lookup for property addresses
+Resolves an address to its neighborhood/ZIP valuation features with hash
+lookups over the address tokens, so cost does not grow with the table size
+"""
+import csv
+import json
+import re
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# More specific levels win when an address matches several entries
+LEVEL_PRIORITY = {'borough': 0, 'neighborhood': 1, 'zip': 2}
+
+ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+@dataclass(frozen=True)
+class LocationFeatures:
+    """Valuation and risk inputs for one area"""
+    name: str
+    level: str = 'neighborhood'
+    value_multiplier: float = 1.2
+    rent_ratio: float = 0.009  # Monthly rent as a fraction of value
+    risk_adjustment: float = 0.0  # Added to the base risk score
+
+
+UNKNOWN_LOCATION = LocationFeatures(name='Unknown', level='default')
+
+# Borough-level defaults; a locations file layers neighborhoods and ZIPs on top
+DEFAULT_LOCATIONS = [
+    LocationFeatures('Manhattan', 'borough', value_multiplier=2.5, risk_adjustment=-1),
+    LocationFeatures('Brooklyn', 'borough', value_multiplier=1.8, risk_adjustment=-0.5),
+    LocationFeatures('Queens', 'borough', value_multiplier=1.4),
+    LocationFeatures('Bronx', 'borough', value_multiplier=1.0, risk_adjustment=1),
+    LocationFeatures('Staten Island', 'borough', value_multiplier=1.2),
+]
+
+
+class LocationIndex:
+    """Precompiled address -> LocationFeatures matcher"""
+
+    def __init__(self, locations: Iterable[Tuple[LocationFeatures, List[str]]] = None):
+        """
+        Args:
+            locations: (features, zip_codes) pairs added on top of the borough defaults
+        """
+        self.by_name: Dict[Tuple[str, ...], LocationFeatures] = {}
+        self.by_zip: Dict[str, LocationFeatures] = {}
+        self.max_name_tokens = 1
+
+        for features in DEFAULT_LOCATIONS:
+            self.add(features)
+
+        for features, zip_codes in locations or []:
+            self.add(features, zip_codes)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'LocationIndex':
+        """
+        Load a location table from CSV or JSON
+
+        Each row/object has a name plus optional level, zip_codes (list, or
+        ';'-separated in CSV), value_multiplier, rent_ratio and risk_adjustment.
+        """
+        path = Path(path)
+
+        if path.suffix.lower() == '.json':
+            with open(path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+        else:
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                rows = list(csv.DictReader(f))
+
+        numeric = {f.name for f in fields(LocationFeatures) if f.type is float}
+        locations = []
+        for row in rows:
+            zip_codes = row.get('zip_codes') or []
+            if isinstance(zip_codes, str):
+                zip_codes = [z.strip() for z in zip_codes.split(';') if z.strip()]
+
+            values = {}
+            for f in fields(LocationFeatures):
+                value = row.get(f.name)
+                if value in (None, ''):
+                    continue
+                values[f.name] = float(value) if f.name in numeric else value
+
+            if 'name' not in values:
+                values['name'] = zip_codes[0] if zip_codes else ''
+                values.setdefault('level', 'zip')
+
+            locations.append((LocationFeatures(**values), zip_codes))
+
+        index = cls(locations)
+        print(f"[LocationIndex] Loaded {len(locations)} locations from {path.name}")
+        return index
+
+    def add(self, features: LocationFeatures, zip_codes: Iterable[str] = ()):
+        """Register an area under its name and ZIP codes"""
+        name_tokens = tuple(TOKEN_PATTERN.findall(features.name.lower()))
+        if name_tokens and not name_tokens[0].isdigit():
+            self.by_name[name_tokens] = features
+            self.max_name_tokens = max(self.max_name_tokens, len(name_tokens))
+
+        for zip_code in zip_codes:
+            self.by_zip[zip_code] = features
+
+    def resolve(self, address: str) -> LocationFeatures:
+        """Most specific location features for an address"""
+        if not address:
+            return UNKNOWN_LOCATION
+
+        best: Optional[LocationFeatures] = None
+        best_rank = (-1, 0)
+
+        zip_matches = ZIP_PATTERN.findall(address)
+        if zip_matches and zip_matches[-1] in self.by_zip:
+            best = self.by_zip[zip_matches[-1]]
+            best_rank = (LEVEL_PRIORITY['zip'], 0)
+
+        # Skip the street part when there is one, so "Brooklyn Ave" is not Brooklyn
+        parts = address.split(',')
+        area_text = ','.join(parts[1:]) if len(parts) > 1 else address
+        tokens = TOKEN_PATTERN.findall(area_text.lower())
+
+        for start in range(len(tokens)):
+            for length in range(1, min(self.max_name_tokens, len(tokens) - start) + 1):
+                features = self.by_name.get(tuple(tokens[start:start + length]))
+                if features is None:
+                    continue
+
+                rank = (LEVEL_PRIORITY.get(features.level, 1), length)
+                if rank > best_rank:
+                    best, best_rank = features, rank
+
+        return best or UNKNOWN_LOCATION
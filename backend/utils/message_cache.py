@@ -0,0 +1,124 @@
+"""
+Persistent cache of generated outreach message skeletons
+Skeletons carry {{owner_name}} / {{street}} placeholders so one generated
+message serves every lead that shares its cache key
+"""
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+OWNER_PLACEHOLDER = "{{owner_name}}"
+STREET_PLACEHOLDER = "{{street}}"
+
+
+class MessageSkeletonCache:
+    """Size-bounded LRU cache of message skeletons stored in SQLite"""
+
+    def __init__(self, db_path: str, max_entries: int = 1000, touch_batch: int = 64):
+        """
+        Args:
+            touch_batch: Hits whose last-used times are held in memory before
+                being written back in one transaction
+        """
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        # key -> last-used time not yet written to the table
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS skeletons (
+                key TEXT PRIMARY KEY,
+                skeleton TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_skeletons_last_used ON skeletons(last_used)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the skeleton for key and mark it recently used"""
+        row = self.conn.execute("SELECT skeleton FROM skeletons WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.touch_batch:
+            self._write_touched()
+        return row[0]
+
+    def _write_touched(self):
+        """Write buffered last-used times back in one transaction"""
+        if not self._touched:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE skeletons SET last_used = ? WHERE key = ?",
+                ((last_used, key) for key, last_used in self._touched.items())
+            )
+        self._touched = {}
+
+    def put(self, key: str, skeleton: str):
+        """Store a skeleton, evicting the least recently used entries past max_entries"""
+        now = time.time()
+        # Eviction order must reflect the hits since the last write-back
+        self._write_touched()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO skeletons (key, skeleton, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, skeleton, now, now)
+            )
+
+            overflow = len(self) - self.max_entries
+            if overflow > 0:
+                self.conn.execute(
+                    "DELETE FROM skeletons WHERE key IN "
+                    "(SELECT key FROM skeletons ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,)
+                )
+                self.evictions += overflow
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM skeletons").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process plus the persisted size"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+    def close(self):
+        self._write_touched()
+        self.conn.close()
+
+    @staticmethod
+    def is_reusable(skeleton: str, owner_name: str, street: str) -> bool:
+        """
+        Whether a generated skeleton can serve other leads: it must carry both
+        placeholders and must not spell out this lead's owner or street
+        """
+        if OWNER_PLACEHOLDER not in skeleton or STREET_PLACEHOLDER not in skeleton:
+            return False
+        text = skeleton.lower()
+        return not any(value and value.lower() in text for value in (owner_name.strip(), street.strip()))
+
+    @staticmethod
+    def fill(skeleton: str, owner_name: str, street: str) -> str:
+        """Substitute a lead's name and street into a skeleton"""
+        return skeleton.replace(OWNER_PLACEHOLDER, owner_name).replace(STREET_PLACEHOLDER, street)
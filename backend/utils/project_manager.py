@@ -6,15 +6,35 @@ import os
 import json
 import shutil
 import time
+import asyncio
+import itertools
+import threading
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
 
+from .lead_search import LeadSearchIndex
+from .segment_store import SegmentStore
+
+# Record kinds kept per project, each in its own segment store directory
+RECORD_KINDS = ('leads', 'outreach', 'analysis')
+
+# project.json counter for each record kind
+STAT_KEYS = {'leads': 'total_leads', 'outreach': 'total_outreach', 'analysis': 'total_analyses'}
+
 
 class LeadProjectManager:
     """Manage real estate leads organized by projects/campaigns"""
 
-    def __init__(self, workspace_root: str = None):
+    def __init__(self, workspace_root: str = None, max_segment_bytes: int = 64 << 20, sync_every: int = 256,
+                 stats_every: int = 100):
+        """
+        Args:
+            max_segment_bytes: Size at which a record store starts a new segment file
+            sync_every: Records written between fsyncs
+            stats_every: Saves between project.json rewrites; counters are
+                reconciled with the record stores when a project is loaded
+        """
         if workspace_root is None:
             workspace_root = Path(__file__).parent.parent
 
@@ -22,6 +42,24 @@ class LeadProjectManager:
         self.projects_dir = self.workspace_root / "projects"
         self.current_project = "default"
 
+        # Open segment stores by (project, kind); see _store
+        self.max_segment_bytes = max_segment_bytes
+        self.sync_every = sync_every
+        self._stores: Dict[Tuple[str, str], SegmentStore] = {}
+        # Per-project lead search index (search.db), updated on every lead write
+        self._search_indexes: Dict[str, LeadSearchIndex] = {}
+
+        # project.json contents by project, kept in memory and written every stats_every saves
+        self.stats_every = stats_every
+        self._metadata: Dict[str, Dict] = {}
+        self._unsaved_stats: Dict[str, int] = {}
+
+        # Async writes waiting for the next group commit: (project, kind, record, future)
+        self._pending_writes: List[Tuple[str, str, Dict, asyncio.Future]] = []
+        self._writer_task: Optional[asyncio.Task] = None
+        # Store and counter updates come from the caller's thread and the writer thread
+        self._write_lock = threading.RLock()
+
         # Ensure projects root exists
         if not self.projects_dir.exists():
             self.projects_dir.mkdir(parents=True)
@@ -57,12 +95,11 @@ class LeadProjectManager:
             metadata = {
                 "name": safe_name,
                 "created_at": datetime.now().isoformat(),
-                "total_leads": 0,
+                **{key: 0 for key in STAT_KEYS.values()},
                 "status": "active"
             }
-
-            with open(project_path / "project.json", 'w') as f:
-                json.dump(metadata, f, indent=2)
+            self._metadata[safe_name] = metadata
+            self._write_metadata(safe_name)
 
             print(f"[ProjectManager] Created project: {safe_name}")
             return True, f"Project '{safe_name}' created."
@@ -97,6 +134,67 @@ class LeadProjectManager:
         """Get the path to the current project"""
         return self.projects_dir / self.current_project
 
+    def _store(self, kind: str, project: str = None) -> SegmentStore:
+        """Segment store for one record kind of a project (the current one by default), opened on first use"""
+        key = (project or self.current_project, kind)
+        store = self._stores.get(key)
+        if store is None:
+            directory = self.projects_dir / key[0] / kind
+            store = self._stores[key] = SegmentStore(
+                directory, max_segment_bytes=self.max_segment_bytes, sync_every=self.sync_every
+            )
+            self._migrate_json_files(directory, store)
+        return store
+
+    def _search_index(self, project: str = None) -> LeadSearchIndex:
+        """Search index of a project, caught up with its lead store when opened"""
+        project = project or self.current_project
+        index = self._search_indexes.get(project)
+        if index is None:
+            index = self._search_indexes[project] = LeadSearchIndex(self.projects_dir / project / "search.db")
+
+            store = self._store("leads", project)
+            if index.next_id() > len(store):
+                # The index committed leads whose segment bytes a crash lost; their
+                # IDs will be issued again, so the index is rebuilt from the store
+                print("[ProjectManager] Search index is ahead of the lead store, rebuilding")
+                index.clear()
+
+            # Leads saved before the index existed, or lost from it in a crash
+            if index.next_id() < len(store):
+                indexed = index.add_many(store.scan(start=index.next_id()))
+                if indexed:
+                    print(f"[ProjectManager] Indexed {indexed} leads for search")
+        return index
+
+    def _migrate_json_files(self, directory: Path, store: SegmentStore):
+        """
+        Append records from the older one-JSON-file-per-record layout, oldest
+        first, then move the files to legacy/ so they are imported only once
+        """
+        files = list(directory.glob("*.json"))
+        if not files:
+            return
+
+        records = []
+        for record_file in files:
+            try:
+                with open(record_file, 'r', encoding='utf-8') as f:
+                    records.append((record_file, json.load(f)))
+            except Exception as e:
+                print(f"[ProjectManager] Error reading {record_file.name}: {e}")
+
+        records.sort(key=lambda item: (item[1].get('saved_at') or item[1].get('created_at') or '', item[0].name))
+        store.append_many(record for _, record in records)
+        store.sync()
+
+        legacy_dir = directory / "legacy"
+        legacy_dir.mkdir(exist_ok=True)
+        for record_file, _ in records:
+            record_file.replace(legacy_dir / record_file.name)
+
+        print(f"[ProjectManager] Imported {len(records)} {directory.name} files into segment storage")
+
     def save_lead(self, lead_data: Dict) -> Optional[str]:
         """
         Save a lead to the current project
@@ -105,59 +203,103 @@ class LeadProjectManager:
             lead_data: Dictionary containing lead information
 
         Returns:
-            Path to saved lead file or None on error
+            ID of the saved lead or None on error
         """
-        project_path = self.get_current_project_path()
-        leads_dir = project_path / "leads"
+        try:
+            lead_id = self._append("leads", [self._lead_record(lead_data)])[0]
+            print(f"[ProjectManager] Saved lead {lead_id}: {lead_data.get('address', 'unknown')}")
+            return str(lead_id)
 
-        # Generate filename
-        timestamp = int(time.time())
-        address = lead_data.get('address', 'unknown')
-        safe_address = "".join([c for c in address if c.isalnum() or c in (' ', '-', '_')])[:50].strip().replace(" ", "_")
-        filename = f"{timestamp}_{safe_address}.json"
+        except Exception as e:
+            print(f"[ProjectManager] Error saving lead: {e}")
+            return None
 
-        lead_file = leads_dir / filename
+    def save_leads_bulk(self, leads: Iterable[Dict]) -> List[str]:
+        """
+        Save many leads to the current project with one write and one fsync
 
+        Returns:
+            IDs of the saved leads, in order (empty on error)
+        """
         try:
-            # Add metadata
-            lead_data['saved_at'] = datetime.now().isoformat()
-            lead_data['project'] = self.current_project
+            records = [self._lead_record(lead_data) for lead_data in leads]
+            lead_ids = self._append("leads", records, sync=True)
+            print(f"[ProjectManager] Saved {len(lead_ids)} leads")
+            return [str(lead_id) for lead_id in lead_ids]
 
-            with open(lead_file, 'w', encoding='utf-8') as f:
-                json.dump(lead_data, f, indent=2)
-
-            print(f"[ProjectManager] Saved lead: {lead_file.name}")
+        except Exception as e:
+            print(f"[ProjectManager] Error saving leads: {e}")
+            return []
 
-            # Update project metadata
-            self._update_project_stats()
+    def delete_lead(self, lead_id: str) -> bool:
+        """
+        Delete a lead from the current project; its bytes are reclaimed when
+        enough of the store is deleted for it to compact
 
-            return str(lead_file)
+        Returns:
+            True if the lead existed and was deleted
+        """
+        try:
+            return self._delete("leads", int(lead_id))
 
         except Exception as e:
-            print(f"[ProjectManager] Error saving lead: {e}")
-            return None
+            print(f"[ProjectManager] Error deleting lead {lead_id}: {e}")
+            return False
 
     def get_all_leads(self) -> List[Dict]:
-        """Get all leads from the current project"""
-        leads_dir = self.get_current_project_path() / "leads"
-        leads = []
+        """Get all leads from the current project, newest first"""
+        return list(self.iter_leads())
 
-        if not leads_dir.exists():
-            return leads
+    def iter_leads(self, cursor: str = None, fields: Iterable[str] = None) -> Iterator[Dict]:
+        """
+        Stream the current project's leads newest first, straight from the
+        segment index; each lead carries its ID as '_id'
 
-        for lead_file in leads_dir.glob("*.json"):
+        Args:
+            cursor: next_cursor of a previous page, to continue after it
+            fields: Keys to keep in each lead ('_id' is always included)
+        """
+        fields = tuple(fields) if fields is not None else None
+        start = None
+        if cursor is not None:
             try:
-                with open(lead_file, 'r', encoding='utf-8') as f:
-                    lead_data = json.load(f)
-                    lead_data['_file'] = lead_file.name
-                    leads.append(lead_data)
-            except Exception as e:
-                print(f"[ProjectManager] Error reading {lead_file.name}: {e}")
-
-        # Sort by timestamp (newest first)
-        leads.sort(key=lambda x: x.get('saved_at', ''), reverse=True)
+                start = int(cursor) - 1
+            except ValueError:
+                raise ValueError(f"Invalid cursor: {cursor!r}")
+            if start < 0:
+                return
+
+        with self._write_lock:
+            records = self._store("leads").scan(reverse=True, start=start)
+        while True:
+            # One record at a time under the lock, so a group commit on the
+            # writer thread never leaves the record being read half written
+            with self._write_lock:
+                item = next(records, None)
+            if item is None:
+                return
+            lead_id, lead_data = item
+            if fields is not None:
+                lead_data = {field: lead_data[field] for field in fields if field in lead_data}
+            lead_data['_id'] = lead_id
+            yield lead_data
+
+    def get_leads_page(self, limit: int = 50, cursor: str = None, fields: Iterable[str] = None) -> Dict:
+        """
+        One page of leads, newest first; cost depends on limit, not project size
 
-        return leads
+        Returns:
+            {'leads': [...], 'next_cursor': cursor for the following page, or None at the end}
+        """
+        if limit < 1:
+            raise ValueError(f"Page limit must be at least 1, got {limit}")
+        leads = list(itertools.islice(self.iter_leads(cursor, fields), limit + 1))
+        has_more = len(leads) > limit
+        leads = leads[:limit]
+        return {
+            'leads': leads,
+            'next_cursor': str(leads[-1]['_id']) if has_more else None
+        }
 
     def save_outreach_message(self, address: str, message: str, metadata: Dict = None) -> Optional[str]:
         """
@@ -169,30 +311,12 @@ class LeadProjectManager:
             metadata: Additional metadata (owner, ROI data, etc.)
 
         Returns:
-            Path to saved message or None on error
+            ID of the saved message or None on error
         """
-        outreach_dir = self.get_current_project_path() / "outreach"
-
-        timestamp = int(time.time())
-        safe_address = "".join([c for c in address if c.isalnum() or c in (' ', '-', '_')])[:50].strip().replace(" ", "_")
-        filename = f"{timestamp}_{safe_address}.json"
-
-        outreach_file = outreach_dir / filename
-
         try:
-            data = {
-                'address': address,
-                'message': message,
-                'created_at': datetime.now().isoformat(),
-                'status': 'draft',
-                'metadata': metadata or {}
-            }
-
-            with open(outreach_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2)
-
-            print(f"[ProjectManager] Saved outreach: {outreach_file.name}")
-            return str(outreach_file)
+            message_id = self._append("outreach", [self._outreach_record(address, message, metadata)])[0]
+            print(f"[ProjectManager] Saved outreach {message_id}: {address}")
+            return str(message_id)
 
         except Exception as e:
             print(f"[ProjectManager] Error saving outreach: {e}")
@@ -207,87 +331,215 @@ class LeadProjectManager:
             analysis: ROI analysis dictionary
 
         Returns:
-            Path to saved analysis or None on error
+            ID of the saved analysis or None on error
         """
-        analysis_dir = self.get_current_project_path() / "analysis"
-
-        timestamp = int(time.time())
-        safe_address = "".join([c for c in address if c.isalnum() or c in (' ', '-', '_')])[:50].strip().replace(" ", "_")
-        filename = f"{timestamp}_{safe_address}.json"
-
-        analysis_file = analysis_dir / filename
-
         try:
-            analysis['saved_at'] = datetime.now().isoformat()
-            analysis['address'] = address
-
-            with open(analysis_file, 'w', encoding='utf-8') as f:
-                json.dump(analysis, f, indent=2)
-
-            print(f"[ProjectManager] Saved analysis: {analysis_file.name}")
-            return str(analysis_file)
+            analysis_id = self._append("analysis", [self._analysis_record(address, analysis)])[0]
+            print(f"[ProjectManager] Saved analysis {analysis_id}: {address}")
+            return str(analysis_id)
 
         except Exception as e:
             print(f"[ProjectManager] Error saving analysis: {e}")
             return None
 
-    def get_project_summary(self) -> Dict:
-        """Get a summary of the current project"""
-        project_path = self.get_current_project_path()
+    def _lead_record(self, lead_data: Dict) -> Dict:
+        # Add metadata
+        lead_data['saved_at'] = datetime.now().isoformat()
+        lead_data['project'] = self.current_project
+        return lead_data
+
+    @staticmethod
+    def _outreach_record(address: str, message: str, metadata: Dict = None) -> Dict:
+        return {
+            'address': address,
+            'message': message,
+            'created_at': datetime.now().isoformat(),
+            'status': 'draft',
+            'metadata': metadata or {}
+        }
+
+    @staticmethod
+    def _analysis_record(address: str, analysis: Dict) -> Dict:
+        analysis['saved_at'] = datetime.now().isoformat()
+        analysis['address'] = address
+        return analysis
+
+    def _append(self, kind: str, records: List[Dict], project: str = None, sync: bool = False) -> List[int]:
+        """Write records of one kind to a project's store and count them"""
+        with self._write_lock:
+            store = self._store(kind, project)
+            # Loaded first, so neither the counters' reconcile nor the index's
+            # catch-up also counts these records
+            self._project_metadata(project)
+            if kind == "leads":
+                search_index = self._search_index(project)
+            record_ids = store.append_many(records)
+            if sync:
+                store.sync()
+            if kind == "leads":
+                search_index.add_many(zip(record_ids, records))
+            self._update_project_stats(kind, len(record_ids), project)
+        return record_ids
+
+    def _delete(self, kind: str, record_id: int, project: str = None) -> bool:
+        """Delete one record from a project's store, its search index and its count"""
+        with self._write_lock:
+            store = self._store(kind, project)
+            self._project_metadata(project)
+            if kind == "leads":
+                search_index = self._search_index(project)
+            record = store.get(record_id)
+            if record is None:
+                return False
+            # Store first: a crash in between leaves an index hit that
+            # search_leads skips, never a live lead the index has lost
+            store.delete(record_id)
+            if kind == "leads":
+                search_index.remove(record_id, record)
+            self._update_project_stats(kind, -1, project)
+        return True
+
+    # -- async writes --------------------------------------------------------------
+
+    def submit_lead(self, lead_data: Dict) -> 'asyncio.Future[Optional[str]]':
+        """
+        Queue a lead for the background writer without blocking the event loop
 
-        # Count leads
-        leads_dir = project_path / "leads"
-        num_leads = len(list(leads_dir.glob("*.json"))) if leads_dir.exists() else 0
+        Returns:
+            Future of the lead's ID (None on error); await it only if the ID is
+            needed, or await flush_writes() once for everything queued
+        """
+        return self._submit("leads", self._lead_record(lead_data))
+
+    def submit_outreach_message(self, address: str, message: str,
+                                metadata: Dict = None) -> 'asyncio.Future[Optional[str]]':
+        """Queue an outreach message for the background writer (see submit_lead)"""
+        return self._submit("outreach", self._outreach_record(address, message, metadata))
 
-        # Count outreach messages
-        outreach_dir = project_path / "outreach"
-        num_outreach = len(list(outreach_dir.glob("*.json"))) if outreach_dir.exists() else 0
+    def submit_roi_analysis(self, address: str, analysis: Dict) -> 'asyncio.Future[Optional[str]]':
+        """Queue an ROI analysis for the background writer (see submit_lead)"""
+        return self._submit("analysis", self._analysis_record(address, analysis))
 
-        # Count analyses
-        analysis_dir = project_path / "analysis"
-        num_analyses = len(list(analysis_dir.glob("*.json"))) if analysis_dir.exists() else 0
+    def _submit(self, kind: str, record: Dict) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_writes.append((self.current_project, kind, record, future))
 
-        # Load project metadata
-        metadata_file = project_path / "project.json"
-        metadata = {}
-        if metadata_file.exists():
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = loop.create_task(self._write_loop())
+        return future
+
+    async def _write_loop(self):
+        """
+        Group commit: everything queued while the previous batch was being
+        written goes out together in one append and one fsync per store
+        """
+        while self._pending_writes:
+            batch, self._pending_writes = self._pending_writes, []
+            results = await asyncio.to_thread(self._commit_writes, batch)
+            for (_, _, _, future), record_id in zip(batch, results):
+                if not future.done():
+                    future.set_result(None if record_id is None else str(record_id))
+
+    def _commit_writes(self, batch: List[Tuple[str, str, Dict, Any]]) -> List[Optional[int]]:
+        """Write a batch grouped by project and kind, in submission order within each group"""
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for position, (project, kind, _, _) in enumerate(batch):
+            groups.setdefault((project, kind), []).append(position)
+
+        results: List[Optional[int]] = [None] * len(batch)
+        for (project, kind), positions in groups.items():
             try:
-                with open(metadata_file, 'r') as f:
-                    metadata = json.load(f)
-            except:
-                pass
+                record_ids = self._append(kind, [batch[i][2] for i in positions], project=project, sync=True)
+                for position, record_id in zip(positions, record_ids):
+                    results[position] = record_id
+            except Exception as e:
+                print(f"[ProjectManager] Error writing {len(positions)} {kind} records: {e}")
+
+        if len(batch) > 1:
+            print(f"[ProjectManager] Committed {len(batch)} queued records")
+        return results
+
+    async def flush_writes(self):
+        """Wait until every queued write is on disk"""
+        while self._writer_task is not None and not self._writer_task.done():
+            await self._writer_task
+
+    def get_project_summary(self) -> Dict:
+        """Get a summary of the current project"""
+        project_path = self.get_current_project_path()
+
+        with self._write_lock:
+            metadata = dict(self._project_metadata())
 
         return {
             'name': self.current_project,
             'path': str(project_path),
-            'leads': num_leads,
-            'outreach_messages': num_outreach,
-            'roi_analyses': num_analyses,
+            'leads': metadata['total_leads'],
+            'outreach_messages': metadata['total_outreach'],
+            'roi_analyses': metadata['total_analyses'],
             'metadata': metadata
         }
 
-    def _update_project_stats(self):
-        """Update project statistics"""
-        project_path = self.get_current_project_path()
-        metadata_file = project_path / "project.json"
-
-        metadata = {}
-        if metadata_file.exists():
-            try:
-                with open(metadata_file, 'r') as f:
-                    metadata = json.load(f)
-            except:
-                pass
-
-        # Update stats
-        leads_dir = project_path / "leads"
-        metadata['total_leads'] = len(list(leads_dir.glob("*.json"))) if leads_dir.exists() else 0
-        metadata['last_updated'] = datetime.now().isoformat()
-
-        # Save
+    def _project_metadata(self, project: str = None) -> Dict:
+        """Metadata of a project (the current one by default), loaded and reconciled on first use"""
+        project = project or self.current_project
+        metadata = self._metadata.get(project)
+        if metadata is None:
+            metadata_file = self.projects_dir / project / "project.json"
+            metadata = {}
+            if metadata_file.exists():
+                try:
+                    with open(metadata_file, 'r') as f:
+                        metadata = json.load(f)
+                except Exception as e:
+                    print(f"[ProjectManager] Error reading {metadata_file.name}, rebuilding: {e}")
+            self._metadata[project] = metadata
+
+            # Counters lag the stores after a crash, and older projects lack some
+            if any(metadata.get(STAT_KEYS[kind]) != self._store(kind, project).live_count
+                   for kind in RECORD_KINDS):
+                self.rebuild_project_stats(project)
+        return metadata
+
+    def _update_project_stats(self, kind: str = "leads", added: int = 1, project: str = None):
+        """
+        Count saved records (deleted ones with a negative added); project.json
+        is rewritten every stats_every changes
+        """
+        project = project or self.current_project
+        with self._write_lock:
+            metadata = self._project_metadata(project)
+            metadata[STAT_KEYS[kind]] += added
+            metadata['last_updated'] = datetime.now().isoformat()
+
+            unsaved = self._unsaved_stats.get(project, 0) + abs(added)
+            self._unsaved_stats[project] = unsaved
+            if unsaved >= self.stats_every:
+                self._write_metadata(project)
+
+    def rebuild_project_stats(self, project: str = None):
+        """Recount a project's records from its stores (startup and repair)"""
+        project = project or self.current_project
+        with self._write_lock:
+            metadata = self._metadata.setdefault(project, {})
+            metadata.setdefault('name', project)
+            for kind in RECORD_KINDS:
+                metadata[STAT_KEYS[kind]] = self._store(kind, project).live_count
+            metadata['last_updated'] = datetime.now().isoformat()
+            self._write_metadata(project)
+
+    def _write_metadata(self, project: str):
+        """Atomically replace a project's project.json with its in-memory metadata"""
+        metadata_file = self.projects_dir / project / "project.json"
+        tmp_file = metadata_file.with_suffix('.json.tmp')
         try:
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            with open(tmp_file, 'w') as f:
+                json.dump(self._metadata[project], f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, metadata_file)
+            self._unsaved_stats[project] = 0
         except Exception as e:
             print(f"[ProjectManager] Error updating stats: {e}")
 
@@ -307,6 +559,14 @@ class LeadProjectManager:
             export_path = self.workspace_root / f"{self.current_project}_{int(time.time())}.zip"
 
         try:
+            # Buffered records and counters must be on disk before they are read
+            with self._write_lock:
+                for (project, _), store in self._stores.items():
+                    if project == self.current_project:
+                        store.sync()
+                if self._unsaved_stats.get(self.current_project):
+                    self._write_metadata(self.current_project)
+
             import zipfile
 
             with zipfile.ZipFile(export_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -323,34 +583,42 @@ class LeadProjectManager:
             print(f"[ProjectManager] Error exporting project: {e}")
             return None
 
-    def search_leads(self, query: str) -> List[Dict]:
+    def close(self):
+        """
+        Write pending counters, then sync and close every open record store;
+        await flush_writes() first when async writes were submitted
+        """
+        with self._write_lock:
+            for project, unsaved in list(self._unsaved_stats.items()):
+                if unsaved:
+                    self._write_metadata(project)
+            for store in self._stores.values():
+                store.close()
+            self._stores = {}
+            for index in self._search_indexes.values():
+                index.close()
+            self._search_indexes = {}
+
+    def search_leads(self, query: str, limit: int = None) -> List[Dict]:
         """
-        Search for leads matching a query
+        Search leads through the project's search index, newest first
 
         Args:
-            query: Search query (searches in address, owner, notes)
+            query: Words (prefix matches in address, owner, status, source,
+                notes, ROI text), "quoted phrases", field filters such as
+                owner:smith, and numeric ranges such as cap_rate>7 or
+                estimated_value<=500000; every part must match
+            limit: Maximum number of leads to return
 
         Returns:
-            List of matching leads
+            List of matching leads, each with its ID as '_id'
         """
-        all_leads = self.get_all_leads()
-        query_lower = query.lower()
-
-        matching_leads = []
-        for lead in all_leads:
-            # Search in address
-            if query_lower in lead.get('address', '').lower():
-                matching_leads.append(lead)
-                continue
-
-            # Search in owner
-            if query_lower in lead.get('owner', '').lower():
-                matching_leads.append(lead)
-                continue
-
-            # Search in notes/metadata
-            metadata_str = json.dumps(lead).lower()
-            if query_lower in metadata_str:
-                matching_leads.append(lead)
-
-        return matching_leads
+        with self._write_lock:
+            store = self._store("leads")
+            leads = []
+            for lead_id in self._search_index().search(query, limit):
+                lead_data = store.get(lead_id)
+                if lead_data is not None:
+                    lead_data['_id'] = lead_id
+                    leads.append(lead_data)
+            return leads
@@ -0,0 +1,329 @@
+"""
+Append-only record store: JSON lines in size-capped segment files plus a
+fixed-width binary index
+Record IDs are positions in the index, so they never change; the index gives
+O(1) lookup by ID and newest-first reads without scanning the segments
+"""
+import json
+import os
+import re
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})\.jsonl$')
+INDEX_FILE = 'index.bin'
+
+# Each index entry is two native 64-bit words: (segment << 40 | offset) and
+# the record's byte length, with DELETED set once it is removed
+OFFSET_BITS = 40
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+DELETED = 1 << 63
+
+
+class SegmentStore:
+    """JSON records appended to segment files, addressed by a positional index"""
+
+    def __init__(self, directory: str, max_segment_bytes: int = 64 << 20, sync_every: int = 256,
+                 compact_ratio: float = 0.5, min_compact_bytes: int = 1 << 20):
+        """
+        Args:
+            max_segment_bytes: A new segment is started once the active one reaches this size
+            sync_every: Appends between fsyncs; records written since the last
+                sync can be lost in a crash, never corrupted
+            compact_ratio: Deleted share of the stored bytes that triggers compaction,
+                once at least min_compact_bytes are deleted
+        """
+        self.directory = Path(directory)
+        self.max_segment_bytes = max_segment_bytes
+        self.sync_every = sync_every
+        self.compact_ratio = compact_ratio
+        self.min_compact_bytes = min_compact_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.entries = array('Q')
+        self.live_count = 0
+        self.live_bytes = 0
+        self.deleted_bytes = 0
+        self._unsynced = 0
+        self._dirty = False
+        self._readers: Dict[int, 'object'] = {}
+
+        self._recover()
+
+    # -- opening and crash recovery ------------------------------------------------
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.jsonl"
+
+    def _recover(self):
+        """Load the index and reconcile it with the segments after an unclean shutdown"""
+        index_path = self.directory / INDEX_FILE
+        data = index_path.read_bytes() if index_path.exists() else b''
+        # A torn final entry is dropped
+        self.entries.frombytes(data[:len(data) - len(data) % (2 * self.entries.itemsize)])
+
+        # Index entries whose data never reached the segment are dropped
+        sizes = {}
+        while self.entries and not self.is_deleted(len(self) - 1):
+            segment, offset, length = self._locate(len(self) - 1)
+            if segment not in sizes:
+                path = self._segment_path(segment)
+                sizes[segment] = path.stat().st_size if path.exists() else -1
+            if offset + length <= sizes[segment]:
+                break
+            del self.entries[-2:]
+
+        # Segment 0 only appears in the tombstones compaction leaves
+        referenced = set(map(OFFSET_BITS.__rrshift__, self.entries[::2])) - {0}
+        self.active_segment = max(referenced, default=1)
+        referenced.add(self.active_segment)
+
+        # Leftovers of an interrupted compaction or rollover
+        for path in self.directory.iterdir():
+            match = SEGMENT_PATTERN.match(path.name)
+            if (match and int(match.group(1)) not in referenced) or path.suffix == '.tmp':
+                path.unlink()
+
+        recovered = self._recover_tail()
+
+        lengths = self.entries[1::2]
+        if not lengths or max(lengths) < DELETED:
+            self.live_count, self.live_bytes = len(lengths), sum(lengths)
+        else:
+            for length in lengths:
+                if length & DELETED:
+                    self.deleted_bytes += length & ~DELETED
+                else:
+                    self.live_count += 1
+                    self.live_bytes += length
+
+        self._segment = open(self._segment_path(self.active_segment), 'ab')
+        self._index = open(index_path, 'r+b' if index_path.exists() else 'w+b')
+        if self._index.seek(0, os.SEEK_END) != len(self.entries) * self.entries.itemsize or recovered:
+            self._index.seek(0)
+            self._index.truncate()
+            self._index.write(self.entries.tobytes())
+            self.sync()
+        if recovered:
+            print(f"[SegmentStore] Recovered {recovered} unindexed records in {self.directory.name}")
+
+    def _recover_tail(self) -> int:
+        """Index complete records written after the last index entry; cut off a torn last line"""
+        path = self._segment_path(self.active_segment)
+        if not path.exists():
+            return 0
+
+        # End of the last indexed record in the active segment
+        end = 0
+        for record_id in range(len(self) - 1, -1, -1):
+            segment, offset, length = self._locate(record_id)
+            if segment == self.active_segment:
+                end = offset + length
+                break
+
+        recovered = 0
+        with open(path, 'r+b') as f:
+            f.seek(end)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    json.loads(line)
+                except ValueError:
+                    break
+                self.entries.extend((self.active_segment << OFFSET_BITS | end, len(line)))
+                end += len(line)
+                recovered += 1
+            f.truncate(end)
+        return recovered
+
+    # -- writing -----------------------------------------------------------------
+
+    def __len__(self) -> int:
+        """Number of record IDs issued, deleted ones included"""
+        return len(self.entries) // 2
+
+    def append(self, record: Dict) -> int:
+        """Write one record, returning its ID"""
+        return self.append_many([record])[0]
+
+    def append_many(self, records: Iterable[Dict]) -> List[int]:
+        """Write records back to back, returning their IDs"""
+        ids = []
+        for record in records:
+            line = json.dumps(record, default=str, ensure_ascii=False).encode('utf-8') + b'\n'
+
+            offset = self._segment.tell()
+            if offset and offset + len(line) > self.max_segment_bytes:
+                self._roll_segment()
+                offset = 0
+
+            # Marked before the bytes are buffered (a rollover flush clears it),
+            # so a read that sees this record's entry flushes them first
+            self._dirty = True
+            self._segment.write(line)
+            entry = array('Q', (self.active_segment << OFFSET_BITS | offset, len(line)))
+            self._index.write(entry.tobytes())
+            self.entries.extend(entry)
+            self.live_count += 1
+            self.live_bytes += len(line)
+            ids.append(len(self.entries) // 2 - 1)
+
+        self._unsynced += len(ids)
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        return ids
+
+    def _roll_segment(self):
+        self.sync()
+        self._segment.close()
+        self.active_segment += 1
+        self._segment = open(self._segment_path(self.active_segment), 'ab')
+
+    def delete(self, record_id: int) -> bool:
+        """Mark a record deleted; its bytes are reclaimed by compaction"""
+        if not 0 <= record_id < len(self):
+            return False
+        length = self.entries[2 * record_id + 1]
+        if length & DELETED:
+            return False
+
+        self.entries[2 * record_id + 1] = length | DELETED
+        self._index.seek(self.entries.itemsize * (2 * record_id + 1))
+        self._index.write(self.entries[2 * record_id + 1:2 * record_id + 2].tobytes())
+        self._index.seek(0, os.SEEK_END)
+
+        self.live_count -= 1
+        self.live_bytes -= length
+        self.deleted_bytes += length
+        self._dirty = True
+        self._unsynced += 1
+
+        if (self.deleted_bytes >= self.min_compact_bytes
+                and self.deleted_bytes > self.compact_ratio * (self.live_bytes + self.deleted_bytes)):
+            self.compact()
+        return True
+
+    def flush(self):
+        """Hand buffered writes to the OS so reads see them"""
+        if self._dirty:
+            self._segment.flush()
+            self._index.flush()
+            self._dirty = False
+
+    def sync(self):
+        """Flush and fsync; segment data reaches disk before the index entries pointing at it"""
+        self.flush()
+        os.fsync(self._segment.fileno())
+        os.fsync(self._index.fileno())
+        self._unsynced = 0
+
+    def compact(self):
+        """Rewrite the live records into fresh segments, dropping deleted ones; IDs are kept"""
+        self.sync()
+        old_segments = sorted((set(map(OFFSET_BITS.__rrshift__, self.entries[::2])) - {0}) | {self.active_segment})
+        segment = old_segments[-1] + 1
+        entries = array('Q', self.entries)
+
+        out = open(self._segment_path(segment), 'wb')
+        written = 0
+        for record_id in range(len(self)):
+            length = entries[2 * record_id + 1]
+            if length & DELETED:
+                # Nothing left to point at; keep the ID as a zero-length tombstone
+                entries[2 * record_id] = 0
+                entries[2 * record_id + 1] = DELETED
+                continue
+
+            if written and written + length > self.max_segment_bytes:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+                segment += 1
+                out = open(self._segment_path(segment), 'wb')
+                written = 0
+
+            out.write(self._read(record_id))
+            entries[2 * record_id] = segment << OFFSET_BITS | written
+            written += length
+        out.flush()
+        os.fsync(out.fileno())
+        out.close()
+
+        # The new index only becomes visible once complete
+        tmp_path = self.directory / (INDEX_FILE + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(entries.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._close_files()
+        os.replace(tmp_path, self.directory / INDEX_FILE)
+        for old in old_segments:
+            self._segment_path(old).unlink(missing_ok=True)
+
+        self.entries = entries
+        self.deleted_bytes = 0
+        self.active_segment = segment
+        self._segment = open(self._segment_path(segment), 'ab')
+        self._index = open(self.directory / INDEX_FILE, 'r+b')
+        self._index.seek(0, os.SEEK_END)
+        print(f"[SegmentStore] Compacted {self.directory.name}: {self.live_count} live records")
+
+    # -- reading -----------------------------------------------------------------
+
+    def _locate(self, record_id: int) -> Tuple[int, int, int]:
+        """(segment, offset, length) of a record"""
+        position = self.entries[2 * record_id]
+        return position >> OFFSET_BITS, position & OFFSET_MASK, self.entries[2 * record_id + 1] & ~DELETED
+
+    def is_deleted(self, record_id: int) -> bool:
+        return bool(self.entries[2 * record_id + 1] & DELETED)
+
+    def _read(self, record_id: int) -> bytes:
+        segment, offset, length = self._locate(record_id)
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self._segment_path(segment), 'rb')
+        reader.seek(offset)
+        return reader.read(length)
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """A record by ID, None when it does not exist or was deleted"""
+        if not 0 <= record_id < len(self) or self.is_deleted(record_id):
+            return None
+        self.flush()
+        return json.loads(self._read(record_id))
+
+    def scan(self, reverse: bool = False, start: int = None) -> Iterator[Tuple[int, Dict]]:
+        """
+        (ID, record) for every live record, oldest first unless reverse; records
+        are read one at a time, so memory does not grow with the store
+
+        Args:
+            start: First ID to visit, continuing in the scan direction
+        """
+        last = len(self) - 1
+        # Everything up to the current last ID is flushed before it is read
+        self.flush()
+        if reverse:
+            ids = range(last if start is None else min(start, last), -1, -1)
+        else:
+            ids = range(0 if start is None else max(start, 0), last + 1)
+        for record_id in ids:
+            if not self.is_deleted(record_id):
+                yield record_id, json.loads(self._read(record_id))
+
+    # -- closing -----------------------------------------------------------------
+
+    def _close_files(self):
+        for reader in self._readers.values():
+            reader.close()
+        self._readers = {}
+        self._segment.close()
+        self._index.close()
+
+    def close(self):
+        self.sync()
+        self._close_files()
@@ -0,0 +1,53 @@
+"""
+In-flight request coalescing
+Concurrent callers asking for the same key share one underlying call and its result
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Key for prompts that differ only in whitespace; case is kept, since owner
+    names and addresses in the prompt end up in the generated text
+    """
+    return ' '.join(prompt.split())
+
+
+class SingleFlight:
+    """Collapse identical concurrent calls into one"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.collapsed = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run fn() unless a call for key is already running, in which case wait
+        for that call's result (or exception) instead
+        """
+        task = self._in_flight.get(key)
+
+        if task is None:
+            self.calls += 1
+            # A separate task so one caller being cancelled does not cancel
+            # the call the others are waiting on
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.collapsed += 1
+
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict:
+        requested = self.calls + self.collapsed
+        return {
+            'calls': self.calls,
+            'collapsed': self.collapsed,
+            'in_flight': len(self._in_flight),
+            'collapse_rate': self.collapsed / requested if requested else 0.0
+        }
@@ -0,0 +1,10 @@
+"""Text helpers shared by the search and embedding indexes"""
+import re
+from typing import List
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._'][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; keeps dotted numbers and snake_case words whole"""
+    return TOKEN_PATTERN.findall(text.lower())
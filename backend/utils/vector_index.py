@@ -0,0 +1,234 @@
+"""
+Local embeddings and nearest-neighbor search for the knowledge base
+Feature-hashing embeddings (no model download) stored in a contiguous float32
+matrix, with random-hyperplane LSH for approximate search on large collections
+"""
+import heapq
+import math
+import random
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# numpy is optional; it only speeds up batch hashing and exact scoring
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from .text import tokenize
+
+
+def top_k_rows(vectors: array, dim: int, query: array, k: int, ids: Optional[Iterable[int]] = None,
+               first_id: int = 0) -> List[Tuple[float, int]]:
+    """
+    Top-k (cosine similarity, id) pairs among row-major vectors, row i having
+    ID first_id + i; ids restricts scoring to those rows
+    """
+    rows = len(vectors) // dim
+    if ids is None:
+        ids = range(first_id, first_id + rows)
+
+    if NUMPY_AVAILABLE:
+        if not rows:
+            return []
+        matrix = np.frombuffer(vectors, dtype=np.float32).reshape(rows, dim)
+        q = np.frombuffer(query, dtype=np.float32)
+        if isinstance(ids, range):
+            scores = matrix @ q
+        else:
+            scores = matrix[[i - first_id for i in ids]] @ q
+        return heapq.nlargest(k, zip(scores.tolist(), ids))
+
+    # Sparse dot products: hashed vectors have few non-zero coordinates
+    nonzero = [(j, v) for j, v in enumerate(query) if v]
+    scored = (
+        (sum(vectors[(i - first_id) * dim + j] * v for j, v in nonzero), i)
+        for i in ids
+    )
+    return heapq.nlargest(k, scored)
+
+
+def search_chunks(chunks: Iterable[array], dim: int, query: array, k: int = 10) -> List[Tuple[float, int]]:
+    """
+    Exact top-k over vectors streamed in row-major chunks (IDs are row numbers
+    across the chunks); memory stays at one chunk however many vectors there are
+    """
+    best: List[Tuple[float, int]] = []
+    first_id = 0
+    for chunk in chunks:
+        best = heapq.nlargest(k, best + top_k_rows(chunk, dim, query, k, first_id=first_id))
+        first_id += len(chunk) // dim
+    return best
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words, word bigrams and character trigrams"""
+
+    def __init__(self, dim: int = 256, max_cached_features: int = 100000):
+        """
+        Args:
+            max_cached_features: Size at which the feature -> slot memo is
+                cleared; it only saves recomputing crc32, so it must not grow
+                with the vocabulary
+        """
+        self.dim = dim
+        self.max_cached_features = max_cached_features
+        self._features: Dict[str, Tuple[int, float]] = {}
+
+    def embed(self, text: str) -> array:
+        """One L2-normalized float32 vector"""
+        return self.embed_batch([text])
+
+    def embed_batch(self, texts: Iterable[str]) -> array:
+        """
+        Embed many texts at once
+
+        Returns:
+            Row-major float32 matrix (len(texts) x dim) as a flat array
+        """
+        dim = self.dim
+        matrix = array('f')
+
+        for text in texts:
+            row = [0.0] * dim
+            words = tokenize(text)
+
+            features = list(words)
+            features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+            for word in words:
+                # Trigrams let misspellings land near the right word
+                padded = f"#{word}#"
+                features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+            for feature in features:
+                slot = self._features.get(feature)
+                if slot is None:
+                    # crc32 rather than hash() so vectors are stable across processes
+                    h = zlib.crc32(feature.encode('utf-8'))
+                    slot = (h % dim, -1.0 if h & 0x80000000 else 1.0)
+                    if len(self._features) >= self.max_cached_features:
+                        self._features.clear()
+                    self._features[feature] = slot
+                row[slot[0]] += slot[1]
+
+            norm = math.sqrt(sum(v * v for v in row))
+            if norm:
+                row = [v / norm for v in row]
+            matrix.extend(row)
+
+        return matrix
+
+
+class VectorIndex:
+    """Contiguous float32 vector matrix with exact and LSH-approximate search"""
+
+    def __init__(self, dim: int = 256, ann_threshold: int = 20000, num_tables: int = 6,
+                 num_bits: int = 14, seed: int = 13):
+        """
+        Args:
+            ann_threshold: Collections at least this large are searched through
+                the LSH tables instead of scoring every vector
+            num_tables / num_bits: LSH tables and hyperplanes per table
+        """
+        self.dim = dim
+        self.ann_threshold = ann_threshold
+        self.num_tables = num_tables
+        self.num_bits = num_bits
+
+        self.vectors = array('f')
+        self.count = 0
+
+        rng = random.Random(seed)
+        # planes_by_dim[j] holds coordinate j of every hyperplane, table-major
+        self.planes_by_dim = [
+            [rng.gauss(0, 1) for _ in range(num_tables * num_bits)]
+            for _ in range(dim)
+        ]
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(num_tables)]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add_batch(self, vectors: array) -> int:
+        """
+        Append row-major vectors
+
+        Returns:
+            ID of the first vector added; IDs are consecutive row numbers
+        """
+        first_id = self.count
+        rows = len(vectors) // self.dim
+        self.vectors.extend(vectors)
+        self.count += rows
+
+        for offset, keys in enumerate(self._hash_rows(vectors, rows)):
+            for table, key in zip(self.tables, keys):
+                table.setdefault(key, []).append(first_id + offset)
+
+        return first_id
+
+    def search(self, query: array, k: int = 10) -> List[Tuple[float, int]]:
+        """Top-k (cosine similarity, id) pairs for one normalized query vector"""
+        return self.search_batch(query, k)[0]
+
+    def search_batch(self, queries: array, k: int = 10) -> List[List[Tuple[float, int]]]:
+        """Top-k (cosine similarity, id) pairs for each row-major query vector"""
+        rows = len(queries) // self.dim
+        if not self.count:
+            return [[] for _ in range(rows)]
+
+        if self.count < self.ann_threshold:
+            candidates = [None] * rows  # Score everything
+        else:
+            candidates = [self._candidates(keys) for keys in self._hash_rows(queries, rows)]
+
+        results = []
+        for row, ids in enumerate(candidates):
+            query = queries[row * self.dim:(row + 1) * self.dim]
+            results.append(self._top_k(query, ids, k))
+        return results
+
+    def _candidates(self, keys: List[int]) -> List[int]:
+        """IDs sharing a bucket with the query in any table, probing one-bit neighbors too"""
+        found = set()
+        for table, key in zip(self.tables, keys):
+            found.update(table.get(key, ()))
+            for bit in range(self.num_bits):
+                found.update(table.get(key ^ (1 << bit), ()))
+        return sorted(found)
+
+    def _top_k(self, query: array, ids: Optional[List[int]], k: int) -> List[Tuple[float, int]]:
+        return top_k_rows(self.vectors, self.dim, query, k, ids)
+
+    def _hash_rows(self, vectors: array, rows: int) -> List[List[int]]:
+        """LSH bucket key per table for each row"""
+        dim, bits, tables = self.dim, self.num_bits, self.num_tables
+
+        if NUMPY_AVAILABLE:
+            matrix = np.frombuffer(vectors, dtype=np.float32).reshape(rows, dim)
+            signs = (matrix @ np.asarray(self.planes_by_dim, dtype=np.float32)) > 0
+            weights = 1 << np.arange(bits, dtype=np.int64)
+            keys = signs.reshape(rows, tables, bits).astype(np.int64) @ weights
+            return keys.tolist()
+
+        all_keys = []
+        for row in range(rows):
+            projections = [0.0] * (tables * bits)
+            for j in range(dim):
+                v = vectors[row * dim + j]
+                if v:
+                    plane = self.planes_by_dim[j]
+                    for p in range(tables * bits):
+                        projections[p] += plane[p] * v
+
+            keys = []
+            for t in range(tables):
+                key = 0
+                for b in range(bits):
+                    if projections[t * bits + b] > 0:
+                        key |= 1 << b
+                keys.append(key)
+            all_keys.append(keys)
+        return all_keys